@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AiServicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ai_services'
+
+    def ready(self):
+        from notes.signals import chunks_extracted
+        from .vector_index import on_chunks_extracted
+
+        chunks_extracted.connect(on_chunks_extracted, dispatch_uid='ai_services.index_chunks')
@@ -0,0 +1,177 @@
+"""
+Batch generation of summaries or quizzes for many of a user's files.
+
+A batch runs as one GenerationJob of type 'batch'. Files are generated on a
+pool of ``AI_BATCH['CONCURRENCY']`` threads, so throughput is bounded by that
+setting rather than by client round trips. Quizzes and summaries copied from
+the cache are bulk inserted as they accumulate. A newly generated summary is
+saved by ``generate_summary`` itself, because requests coalesced onto it in
+other processes read that row. Per-file progress is written to the job's
+``result`` at the same time, so polling the job shows it. A batch resumed after
+a restart skips the files it has already finished.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from notes.models import Summary, Quiz, UploadedFile, SUBJECT_CHOICES, GRADE_CHOICES
+from .generation import generate_summary
+from .llm import metered
+from .models import GenerationJob
+from .question_bank import generate_quiz, parse_num_questions
+
+KINDS = {'summary': Summary, 'quiz': Quiz}
+
+
+def _config():
+    config = getattr(settings, 'AI_BATCH', {})
+    return {
+        'CONCURRENCY': config.get('CONCURRENCY', 4),
+        'MAX_FILES': config.get('MAX_FILES', 200),
+        'FLUSH_SIZE': config.get('FLUSH_SIZE', 20),
+        'PROGRESS_SECONDS': config.get('PROGRESS_SECONDS', 1.0),
+    }
+
+
+def batch_params(user, data):
+    """Validate a batch request and resolve it to job params; raises ValueError with a client-facing message."""
+    kind = data.get('kind')
+    if kind not in KINDS:
+        raise ValueError("kind must be 'summary' or 'quiz'")
+
+    files = UploadedFile.objects.filter(user=user)
+    file_ids = data.get('file_ids')
+    subject = data.get('subject')
+    grade = data.get('grade')
+    if file_ids is not None:
+        if not isinstance(file_ids, list):
+            raise ValueError('file_ids must be a list')
+        try:
+            file_ids = [int(file_id) for file_id in file_ids]
+        except (TypeError, ValueError):
+            raise ValueError('file_ids must be integers')
+        files = files.filter(id__in=file_ids)
+    elif subject or grade:
+        if subject and subject not in dict(SUBJECT_CHOICES):
+            raise ValueError('Invalid subject')
+        if grade and grade not in dict(GRADE_CHOICES):
+            raise ValueError('Invalid grade')
+        if subject:
+            files = files.filter(subject=subject)
+        if grade:
+            files = files.filter(grade=grade)
+    else:
+        raise ValueError('Either file_ids or a subject/grade filter is required')
+
+    max_files = _config()['MAX_FILES']
+    ids = list(files.order_by('id').values_list('id', flat=True)[:max_files + 1])
+    if not ids:
+        raise ValueError('No files match')
+    if len(ids) > max_files:
+        raise ValueError(f'A batch can cover at most {max_files} files')
+
+    params = {'kind': kind, 'file_ids': ids}
+    if kind == 'quiz':
+        params['num_questions'] = parse_num_questions(data.get('num_questions'))
+    return params
+
+
+def request_batch_params(request):
+    """``batch_params`` of a DRF request, validated once however often the quota and the view ask."""
+    cached = getattr(request, 'ai_batch_params', None)
+    if cached is None:
+        try:
+            cached = (batch_params(request.user, request.data), None)
+        except ValueError as e:
+            cached = (None, str(e))
+        request.ai_batch_params = cached
+    params, error = cached
+    if error is not None:
+        raise ValueError(error)
+    return params
+
+
+def _generate_item(user, kind, file_obj, num_questions):
+    try:
+        if kind == 'summary':
+            return generate_summary(user, file_obj, save=False)
+        return generate_quiz(user, file_obj, num_questions, save=False)
+    finally:
+        # Pool threads live outside the request cycle, so release their connections here
+        close_old_connections()
+
+
+def _finish_item(item, kind, row, cached):
+    item.pop('error', None)  # Left by an earlier attempt
+    item.update(status='done', cached=cached, **{f'{kind}_id': row.id})
+
+
+def _flush(kind, pending):
+    if pending:
+        rows = KINDS[kind].objects.bulk_create([row for _, row, _ in pending])
+        for (item, _, cached), row in zip(pending, rows):
+            _finish_item(item, kind, row, cached)
+        pending.clear()
+
+
+def _report(job, progress):
+    items = progress['items']
+    progress['done'] = sum(item['status'] == 'done' for item in items)
+    progress['failed'] = sum(item['status'] == 'failed' for item in items)
+    GenerationJob.objects.filter(id=job.id).update(result=progress, updated_at=timezone.now())
+
+
+def run_batch(job):
+    """Generate every file of a 'batch' job; returns the final progress, which becomes the job result."""
+    config = _config()
+    kind = job.params['kind']
+    progress = job.result or {
+        'kind': kind, 'total': len(job.params['file_ids']), 'done': 0, 'failed': 0, 'tokens': 0,
+        'items': [{'file_id': file_id, 'status': 'pending'} for file_id in job.params['file_ids']],
+    }
+    todo = [item for item in progress['items'] if item['status'] != 'done']
+    files = UploadedFile.objects.filter(user=job.user).in_bulk([item['file_id'] for item in todo])
+
+    pending = []  # (item, unsaved row, cached)
+    reported_at = time.monotonic()
+    tokens_before = progress['tokens']
+    with metered() as usage, ThreadPoolExecutor(max_workers=config['CONCURRENCY'],
+                                                thread_name_prefix='ai-batch') as executor:
+        futures = {}
+        for item in todo:
+            file_obj = files.get(item['file_id'])
+            if file_obj is None:
+                item.update(status='failed', error='File not found')
+                continue
+            # Copied contexts carry this job's usage meter into the worker threads
+            future = executor.submit(contextvars.copy_context().run, _generate_item,
+                                     job.user, kind, file_obj, job.params.get('num_questions'))
+            futures[future] = item
+        _report(job, progress)
+
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                row, cached = future.result()
+            except Exception as e:
+                item.update(status='failed', error=str(e))
+            else:
+                if row.pk is None:
+                    pending.append((item, row, cached))
+                else:
+                    _finish_item(item, kind, row, cached)  # The user's existing row for a cache hit
+
+            if len(pending) >= config['FLUSH_SIZE'] or time.monotonic() - reported_at >= config['PROGRESS_SECONDS']:
+                _flush(kind, pending)
+                progress['tokens'] = tokens_before + usage.prompt_tokens + usage.completion_tokens
+                _report(job, progress)
+                reported_at = time.monotonic()
+
+    _flush(kind, pending)
+    progress['tokens'] = tokens_before + usage.prompt_tokens + usage.completion_tokens
+    _report(job, progress)
+    return progress
@@ -0,0 +1,58 @@
+"""
+Content-addressed cache for generated summaries.
+
+Results are keyed on a hash of everything that influences the model output
+(model name, prompt template version, file content, and the title, subject and
+grade the prompt names). Lookups go through a small in-process LRU first and
+fall back to the Summary and BookSummary tables, so a repeat request never
+reaches Gemini while the entry is fresh.
+
+Quizzes are served from per-document question banks instead
+(``ai_services.question_bank``); a Quiz row's ``cache_key`` records the
+``source_key`` of the bank it was sampled from.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.lru import LRUCache
+from notes.models import Summary, BookSummary
+
+
+def make_cache_key(kind, model_name, template_version, content, *prompt_fields):
+    """Hash of a prompt's inputs; ``prompt_fields`` are the other values formatted into it."""
+    payload = json.dumps([kind, model_name, template_version, content, *prompt_fields], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _config():
+    config = getattr(settings, 'AI_RESULT_CACHE', {})
+    return config.get('MAX_ENTRIES', 512), config.get('TTL_SECONDS', 7 * 24 * 3600)
+
+
+result_cache = LRUCache(*_config())
+
+
+def _lookup(key, model, field):
+    value = result_cache.get(key)
+    if value is not None:
+        return value
+
+    # Persistent tier: any fresh row generated from the same inputs will do
+    cutoff = timezone.now() - timedelta(seconds=result_cache.ttl_seconds)
+    value = (model.objects
+             .filter(cache_key=key, created_at__gte=cutoff)
+             .order_by('-created_at')
+             .values_list(field, flat=True)
+             .first())
+    if value is not None:
+        result_cache.set(key, value)
+    return value
+
+
+def get_cached_summary(key):
+    # A catalog book's shared summary also serves uploads of the same text, title, subject and grade
+    return _lookup(key, Summary, 'content') or _lookup(key, BookSummary, 'content')
@@ -0,0 +1,388 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from notes.models import Summary, BookSummary, CommonBook, DocumentChunk
+from .cache import make_cache_key, get_cached_summary, result_cache
+from .llm import get_client, metered
+from .request_log import log_request
+from . import singleflight
+
+# Bump whenever the prompt templates below change so cached results are not reused
+PROMPT_TEMPLATE_VERSION = 1
+
+SUMMARY_PROMPT = """
+            Please provide a comprehensive summary of the following educational content:
+
+            Subject: {subject}
+            Grade: {grade}
+            Title: {title}
+
+            Content: {content}
+
+            Please provide:
+            1. A concise summary (2-3 paragraphs)
+            2. Key concepts and main points
+            3. Important definitions or formulas
+            4. Study recommendations
+
+            Format the response in a clear, educational manner suitable for students.
+            """
+
+QUIZ_PROMPT = """
+            Please create a {num_questions}-question quiz based on the following educational content:
+
+            Subject: {subject}
+            Grade: {grade}
+            Title: {title}
+
+            Content: {content}
+
+            Please provide:
+            1. {num_questions} multiple choice questions
+            2. 4 answer choices for each question (A, B, C, D)
+            3. The correct answer for each question
+            4. A brief explanation for each correct answer
+
+            Format the response as a JSON object with this structure:
+            {{
+                "questions": [
+                    {{
+                        "question": "Question text here?",
+                        "options": {{
+                            "A": "Option A",
+                            "B": "Option B",
+                            "C": "Option C",
+                            "D": "Option D"
+                        }},
+                        "correct_answer": "A",
+                        "explanation": "Explanation of why this is correct"
+                    }}
+                ]
+            }}
+
+            Make sure the questions are appropriate for the grade level and subject.
+            """
+
+# Map phase of map-reduce summarization for documents too large for one prompt
+CHUNK_SUMMARY_PROMPT = """
+            Summarize this excerpt from "{title}" ({subject}, {grade}), page {page}.
+            Keep every key concept, definition and formula; leave out examples and filler.
+
+            Excerpt: {content}
+            """
+
+# Intermediate reduce step used when the chunk summaries still do not fit one prompt
+MERGE_PROMPT = """
+            Combine these consecutive section summaries of "{title}" ({subject}, {grade})
+            into one shorter summary. Keep every key concept, definition and formula.
+
+            Section summaries: {content}
+            """
+
+ASK_PROMPT = """
+            Answer the student's question using only the study material excerpts below.
+            If the excerpts do not contain the answer, say so instead of guessing.
+            Refer to excerpts by their number when you use them.
+
+            Excerpts:
+            {passages}
+
+            Question: {question}
+            """
+
+FALLBACK_QUIZ = {
+    "questions": [
+        {
+            "question": "Sample question based on the content?",
+            "options": {
+                "A": "Option A",
+                "B": "Option B",
+                "C": "Option C",
+                "D": "Option D"
+            },
+            "correct_answer": "A",
+            "explanation": "This is a sample explanation"
+        }
+    ]
+}
+
+
+def _chunk_filter(document):
+    # Chunks hang off either a student's UploadedFile or a catalog CommonBook
+    return {'book': document} if isinstance(document, CommonBook) else {'file': document}
+
+
+def _placeholder_content(document):
+    return f"Content from {document.title} - {document.subject} for {document.grade}"
+
+
+def get_file_content(file_obj):
+    # Text is extracted once at upload time (notes.extraction) and read back here
+    max_chars = settings.AI_MAX_CONTENT_CHARS
+    parts = []
+    remaining = max_chars
+    chunks = DocumentChunk.objects.filter(**_chunk_filter(file_obj)).order_by('index').values_list('text', flat=True)
+    for text in chunks.iterator():
+        parts.append(text[:remaining])
+        remaining -= len(parts[-1])
+        if remaining <= 0:
+            break
+    if parts:
+        return '\n\n'.join(parts)
+
+    # Extraction still pending or nothing extractable: describe the file instead
+    return _placeholder_content(file_obj)
+
+
+def _model_name():
+    # Part of every cache key, so stub and real results never mix
+    return get_client().model_name
+
+
+def _generate(prompt):
+    return get_client().generate(prompt)
+
+
+def _run_bounded(func, items):
+    # Every item is attempted even if some fail, so finished work is kept for a retry;
+    # the first failure is raised once the whole batch has settled
+    with ThreadPoolExecutor(max_workers=settings.AI_MAP_REDUCE['CONCURRENCY']) as executor:
+        # Copied contexts carry the caller's usage meter into the worker threads
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def _map_chunk(document, chunk, key):
+    try:
+        summary = _generate(CHUNK_SUMMARY_PROMPT.format(
+            title=document.title, subject=document.subject, grade=document.grade,
+            page=chunk.page, content=chunk.text
+        ))
+        # Persist straight away so a retry after a partial failure skips this chunk
+        DocumentChunk.objects.filter(id=chunk.id).update(summary=summary, summary_key=key)
+        return summary
+    finally:
+        close_old_connections()
+
+
+def _group_partials(partials, max_chars):
+    groups = [[]]
+    size = 0
+    for partial in partials:
+        if groups[-1] and size + len(partial) > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(partial)
+        size += len(partial)
+    return groups
+
+
+def condense_chunks(document, chunks):
+    """
+    Map phase of map-reduce summarization.
+
+    Summarizes every chunk in parallel (bounded by ``AI_MAP_REDUCE['CONCURRENCY']``),
+    reusing chunk summaries stored by earlier runs, then merges the partial
+    summaries until they fit into a single prompt for the final reduce call.
+    """
+    partials = [None] * len(chunks)
+    pending = []
+    for position, chunk in enumerate(chunks):
+        key = make_cache_key('chunk-summary', _model_name(), PROMPT_TEMPLATE_VERSION, chunk.text,
+                             *_prompt_fields(document), chunk.page)
+        if chunk.summary and chunk.summary_key == key:
+            partials[position] = chunk.summary
+        else:
+            pending.append((position, chunk, key))
+
+    results = _run_bounded(lambda item: _map_chunk(document, item[1], item[2]), pending)
+    for (position, _, _), summary in zip(pending, results):
+        partials[position] = summary
+
+    max_chars = settings.AI_MAX_CONTENT_CHARS
+    while len(partials) > 1 and sum(len(partial) for partial in partials) > max_chars:
+        groups = _group_partials(partials, max_chars)
+        if len(groups) == len(partials):
+            break  # Every partial is already near the limit; grouping cannot shrink it further
+        partials = _run_bounded(lambda group: _generate(MERGE_PROMPT.format(
+            title=document.title, subject=document.subject, grade=document.grade,
+            content='\n\n'.join(group)
+        )), groups)
+    return '\n\n'.join(partials)[:max_chars]
+
+
+def _existing_or_new(model, user, file_obj, key, save=True, **fields):
+    # A cache hit reuses the user's own row when there is one instead of piling up duplicates
+    row = model.objects.filter(user=user, file=file_obj, cache_key=key).order_by('-created_at').first()
+    if row is None:
+        row = model(user=user, file=file_obj, cache_key=key, **fields)
+        if save:
+            row.save()
+    return row
+
+
+def _prompt_fields(document):
+    # Formatted into every document prompt next to its text, so they are part of every cache key
+    return document.title, document.subject, document.grade
+
+
+def _summary_source(document):
+    chunks = list(DocumentChunk.objects.filter(**_chunk_filter(document))
+                  .order_by('index').only('id', 'page', 'text', 'summary', 'summary_key'))
+    file_content = '\n\n'.join(chunk.text for chunk in chunks) or _placeholder_content(document)
+    key = make_cache_key('summary', _model_name(), PROMPT_TEMPLATE_VERSION, file_content, *_prompt_fields(document))
+    return file_content, key, chunks
+
+
+def _summary_prompt(document, file_content, chunks):
+    if len(file_content) > settings.AI_MAX_CONTENT_CHARS:
+        # Too large for one prompt: map over the chunks, the prompt below is the reduce call
+        file_content = condense_chunks(document, chunks)
+    return SUMMARY_PROMPT.format(
+        subject=document.subject, grade=document.grade, title=document.title, content=file_content
+    )
+
+
+def _save_summary(user, file_obj, key, file_content, summary_content, usage):
+    # Save summary to database
+    summary = Summary.objects.create(
+        user=user,
+        file=file_obj,
+        content=summary_content,
+        cache_key=key
+    )
+    result_cache.set(key, summary_content)
+
+    # Log AI request
+    log_request(user, 'summary', file_content, summary_content, usage=usage, model_name=_model_name())
+    return summary
+
+
+def _cached_summary(user, file_obj, key, file_content, cached_content, save=True):
+    summary = _existing_or_new(Summary, user, file_obj, key, save=save, content=cached_content)
+    log_request(user, 'summary', file_content, cached_content, cache_hit=True, model_name=_model_name())
+    return summary
+
+
+def generate_summary(user, file_obj, save=True):
+    """
+    Return ``(summary, cached)`` for ``file_obj``, calling Gemini only on a cache miss.
+
+    With ``save=False`` a Summary served from the cache is returned unsaved, for
+    callers that bulk insert. A newly generated one is always saved: the row is
+    what requests waiting on the same key in other processes read.
+    """
+    file_content, key, chunks = _summary_source(file_obj)
+
+    cached_content = get_cached_summary(key)
+    if cached_content is not None:
+        return _cached_summary(user, file_obj, key, file_content, cached_content, save), True
+
+    # Concurrent requests for the same content wait for one Gemini call
+    with singleflight.single_flight(f'summary:{key}', lambda: get_cached_summary(key)) as cached_content:
+        if cached_content is not None:
+            return _cached_summary(user, file_obj, key, file_content, cached_content, save), True
+
+        with metered() as usage:
+            prompt = _summary_prompt(file_obj, file_content, chunks)
+            summary_content = _generate(prompt)
+        # Saved before the lease is released so waiters elsewhere find it
+        summary = _save_summary(user, file_obj, key, file_content, summary_content, usage)
+    return summary, False
+
+
+def _store_book_summary(book, key, content):
+    book_summary, _ = BookSummary.objects.update_or_create(
+        book=book, defaults={'content': content, 'cache_key': key, 'created_at': timezone.now()}
+    )
+    result_cache.set(key, content)
+    return book_summary
+
+
+def _generate_book_summary(book, key, file_content, chunks):
+    with metered() as usage:
+        content = _generate(_summary_prompt(book, file_content, chunks))
+    book_summary = _store_book_summary(book, key, content)
+    # No student asked for it, so the calls are logged without a user
+    log_request(None, 'summary', file_content, content, usage=usage, model_name=_model_name())
+    return book_summary
+
+
+def generate_book_summary(book, force=False):
+    """
+    Return ``(book_summary, cached)``, the summary of catalog ``book`` shared by every student.
+
+    The stored summary is kept while the book's text is unchanged, so a rerun of
+    ``precompute_catalog`` skips finished books; ``force`` regenerates it anyway.
+    """
+    file_content, key, chunks = _summary_source(book)
+    if force:
+        return _generate_book_summary(book, key, file_content, chunks), False
+
+    existing = BookSummary.objects.filter(book=book).first()
+    if existing is not None and existing.cache_key == key:
+        return existing, True
+
+    cached_content = get_cached_summary(key)
+    if cached_content is None:
+        with singleflight.single_flight(f'summary:{key}', lambda: get_cached_summary(key)) as cached_content:
+            if cached_content is None:
+                return _generate_book_summary(book, key, file_content, chunks), False
+    return _store_book_summary(book, key, cached_content), True
+
+
+async def stream_summary(user, file_obj):
+    """
+    Async generator yielding ``(event, data)`` pairs while Gemini streams a summary.
+
+    ``token`` events carry text as it arrives; a final ``done`` event carries the
+    id of the Summary row, which is only written once the stream has completed.
+    """
+    file_content, key, chunks = await sync_to_async(_summary_source)(file_obj)
+
+    cached_content = await sync_to_async(get_cached_summary)(key)
+    lease = None
+    if cached_content is None:
+        # Shares the single flight of generate_summary; waiters receive the whole summary at once
+        lease, cached_content = await sync_to_async(singleflight.acquire)(
+            f'summary:{key}', lambda: get_cached_summary(key)
+        )
+    if cached_content is not None:
+        summary = await sync_to_async(_cached_summary)(user, file_obj, key, file_content, cached_content)
+        yield 'token', cached_content
+        yield 'done', {'summary_id': summary.id, 'cached': True}
+        return
+
+    try:
+        with metered() as usage:
+            # Large documents run the map phase first; only the reduce call is streamed
+            prompt = await sync_to_async(_summary_prompt)(file_obj, file_content, chunks)
+
+            parts = []
+            async for text in get_client().stream(prompt):
+                parts.append(text)
+                yield 'token', text
+
+        summary = await sync_to_async(_save_summary)(user, file_obj, key, file_content, ''.join(parts), usage)
+    finally:
+        await sync_to_async(singleflight.release)(lease)
+    yield 'done', {'summary_id': summary.id, 'cached': False}
+
+
+def answer_question(user, question, chunks):
+    """Answer ``question`` from the retrieved ``chunks`` only (retrieval-augmented generation)."""
+    passages = '\n\n'.join(
+        f"[{number}] {(chunk.file or chunk.book).title}, page {chunk.page}:\n{chunk.text}"
+        for number, chunk in enumerate(chunks, start=1)
+    )
+    with metered() as usage:
+        answer = _generate(ASK_PROMPT.format(passages=passages, question=question))
+
+    # Log AI request
+    log_request(user, 'ask', question, answer, usage=usage, model_name=_model_name())
+    return answer
@@ -0,0 +1,227 @@
+"""
+Background AI generation jobs.
+
+Jobs are persisted as GenerationJob rows and executed by a bounded thread pool
+inside the web process, so no external broker is needed. A job is claimed with
+an atomic status update before it runs, which keeps several worker processes
+from executing the same row.
+
+While the pool runs, a monitor thread refreshes ``updated_at`` of the jobs
+this process is executing every ``HEARTBEAT_SECONDS``, so a long handler is
+never mistaken for an orphan. On the same tick it requeues jobs that stopped
+heartbeating (their process died) and submits pending jobs nobody picked up.
+A job that could not be claimed, e.g. on a transient database error, is left
+pending for that tick and only failed after ``MAX_ATTEMPTS`` such errors.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from notes.models import UploadedFile
+from . import batch, quota
+from .generation import generate_summary
+from .llm import metered
+from .question_bank import generate_quiz
+from .models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_queued = set()  # Job ids submitted to this process's pool and not started yet
+_running = set()  # Job ids this process is executing
+_claim_errors = {}  # Job id -> failed attempts to claim it in this process
+
+
+def _config():
+    config = getattr(settings, 'AI_JOBS', {})
+    return {
+        'MAX_WORKERS': config.get('MAX_WORKERS', 4),
+        'STALE_AFTER_SECONDS': config.get('STALE_AFTER_SECONDS', 600),
+        'MAX_ATTEMPTS': config.get('MAX_ATTEMPTS', 3),
+        'HEARTBEAT_SECONDS': config.get('HEARTBEAT_SECONDS', 60),
+    }
+
+
+def register(job_type):
+    """Register the function that executes jobs of ``job_type``; it returns the JSON result."""
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+def _settle(job, spent):
+    # The request was charged an estimate; settle it now the real usage is known
+    if job.params.get('quota_charge') is not None:
+        quota.settle(job.user_id, job.params['quota_charge'], spent)
+
+
+@register('summary')
+def _run_summary(job):
+    with metered() as usage:
+        try:
+            file_obj = UploadedFile.objects.get(id=job.params['file_id'], user=job.user)
+            summary, cached = generate_summary(job.user, file_obj)
+        finally:
+            _settle(job, usage.prompt_tokens + usage.completion_tokens)
+    return {'summary': summary.content, 'summary_id': summary.id, 'cached': cached}
+
+
+@register('quiz')
+def _run_quiz(job):
+    with metered() as usage:
+        try:
+            file_obj = UploadedFile.objects.get(id=job.params['file_id'], user=job.user)
+            quiz, cached = generate_quiz(job.user, file_obj, job.params.get('num_questions', 5))
+        finally:
+            _settle(job, usage.prompt_tokens + usage.completion_tokens)
+    return {'quiz': quiz.questions, 'quiz_id': quiz.id, 'cached': cached}
+
+
+@register('batch')
+def _run_batch(job):
+    progress = batch.run_batch(job)
+    _settle(job, progress['tokens'])
+    return progress
+
+
+def _get_executor():
+    global _executor
+    started = False
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_config()['MAX_WORKERS'], thread_name_prefix='ai-job'
+            )
+            started = True
+    if started:
+        threading.Thread(target=_monitor, name='ai-job-monitor', daemon=True).start()
+        resume_jobs()
+    return _executor
+
+
+def _submit(job_id):
+    with _executor_lock:
+        if job_id in _queued:
+            return  # Already waiting for a worker here
+        _queued.add(job_id)
+    _executor.submit(run_job, job_id)
+
+
+def _heartbeat():
+    with _executor_lock:
+        running = list(_running)
+    if running:
+        GenerationJob.objects.filter(id__in=running, status=GenerationJob.STATUS_RUNNING).update(
+            updated_at=timezone.now()
+        )
+
+
+def _monitor():
+    while True:
+        time.sleep(_config()['HEARTBEAT_SECONDS'])
+        try:
+            _heartbeat()
+            resume_jobs()
+        except Exception:
+            logger.exception('AI job monitor failed')
+        finally:
+            close_old_connections()
+
+
+def ensure_started():
+    _get_executor()
+
+
+def enqueue(user, job_type, params):
+    if job_type not in _handlers:
+        raise ValueError(f'Unknown job type: {job_type}')
+    job = GenerationJob.objects.create(user=user, job_type=job_type, params=params)
+    _get_executor()
+    _submit(job.id)
+    return job
+
+
+def resume_jobs():
+    """Requeue jobs whose process stopped heartbeating and submit every pending job."""
+    config = _config()
+    stale_before = timezone.now() - timedelta(seconds=config['STALE_AFTER_SECONDS'])
+    stale = GenerationJob.objects.filter(status=GenerationJob.STATUS_RUNNING, updated_at__lt=stale_before)
+    stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+        status=GenerationJob.STATUS_FAILED, error='Job abandoned after too many attempts',
+        updated_at=timezone.now()
+    )
+    stale.update(status=GenerationJob.STATUS_PENDING, updated_at=timezone.now())
+
+    pending = GenerationJob.objects.filter(status=GenerationJob.STATUS_PENDING).values_list('id', flat=True)
+    for job_id in pending:
+        _submit(job_id)
+
+
+def _claim_failed(job_id, status, error):
+    with _executor_lock:
+        errors = _claim_errors[job_id] = _claim_errors.get(job_id, 0) + 1
+        if errors >= _config()['MAX_ATTEMPTS']:
+            del _claim_errors[job_id]
+    # Only the status this worker left the row in, so another worker's run is never touched
+    job = GenerationJob.objects.filter(id=job_id, status=status)
+    if errors >= _config()['MAX_ATTEMPTS']:
+        job.update(status=GenerationJob.STATUS_FAILED, error=error, updated_at=timezone.now())
+    elif status != GenerationJob.STATUS_PENDING:
+        # Back to pending, so the monitor submits it again on its next tick
+        job.update(status=GenerationJob.STATUS_PENDING, updated_at=timezone.now())
+
+
+def run_job(job_id):
+    with _executor_lock:
+        _queued.discard(job_id)
+    claimed = False
+    try:
+        try:
+            claimed = bool(GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_PENDING).update(
+                status=GenerationJob.STATUS_RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now()
+            ))
+            if not claimed:
+                return  # Another worker got there first
+            with _executor_lock:
+                _running.add(job_id)
+            job = GenerationJob.objects.select_related('user').get(id=job_id)
+            with _executor_lock:
+                _claim_errors.pop(job_id, None)
+        except Exception as e:
+            logger.exception('Could not claim AI job %s', job_id)
+            status = GenerationJob.STATUS_RUNNING if claimed else GenerationJob.STATUS_PENDING
+            try:
+                _claim_failed(job_id, status, f'Could not start job: {e}')
+            except Exception:
+                # A claimed row left running stops heartbeating, so resume_jobs requeues or fails it
+                logger.exception('Could not release AI job %s', job_id)
+            return
+
+        try:
+            result = _handlers[job.job_type](job)
+        except Exception as e:
+            logger.exception('AI job %s failed', job_id)
+            job.status = GenerationJob.STATUS_FAILED
+            job.error = str(e)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            return
+
+        job.status = GenerationJob.STATUS_DONE
+        job.result = result
+        job.save(update_fields=['status', 'result', 'updated_at'])
+    finally:
+        if claimed:
+            with _executor_lock:
+                _running.discard(job_id)
+        # Pool threads live outside the request cycle, so release their connections here
+        close_old_connections()
@@ -0,0 +1,257 @@
+"""
+Provider client layer for the AI endpoints.
+
+Each worker process creates one backend on first use and keeps it. For Gemini
+that means the SDK is configured once, and every request reuses the same
+long-lived transport: one gRPC channel, or one pooled keep-alive HTTP session
+with ``transport='rest'``. Requests no longer build a fresh model and connection
+each time.
+
+The backend is chosen by ``AI_LLM['BACKEND']``: ``gemini``, ``stub`` or a
+dotted path to an ``LLMBackend`` subclass. The ``stub`` backend answers
+deterministically from a hash of the prompt, without any network access. It is
+meant for tests and benchmarks. Calls made inside ``metered()`` report their
+token counts and latency to the caller.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.metrics import timed
+
+
+def _config():
+    config = getattr(settings, 'AI_LLM', {})
+    return {
+        'BACKEND': config.get('BACKEND', 'gemini'),
+        'API_KEY': config.get('API_KEY', ''),
+        'MODEL': config.get('MODEL', 'gemini-pro'),
+        'TRANSPORT': config.get('TRANSPORT') or None,
+        'TIMEOUT': config.get('TIMEOUT', 120),
+        'STUB_LATENCY_MS': config.get('STUB_LATENCY_MS', 0),
+        'STUB_ERROR_RATE': config.get('STUB_ERROR_RATE', 0.0),
+    }
+
+
+class Usage:
+    """Token counts and upstream latency summed over every model call inside ``metered()``."""
+
+    def __init__(self, parent=None):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_ms = 0.0
+        self.parent = parent  # An enclosing meter also sees the calls
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens, completion_tokens, latency_ms):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+            self.latency_ms += latency_ms
+        if self.parent is not None:
+            self.parent.add(prompt_tokens, completion_tokens, latency_ms)
+
+
+_usage = contextvars.ContextVar('llm_usage', default=None)
+
+
+@contextmanager
+def metered():
+    """Collect the usage of the model calls made in this block (threads need a copied context)."""
+    usage = Usage(parent=_usage.get())
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _usage.reset(token)
+        except ValueError:
+            pass  # Closed from another context, e.g. an abandoned streaming response
+
+
+def _record(prompt_tokens, completion_tokens, started):
+    usage = _usage.get()
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens, (time.perf_counter() - started) * 1000)
+
+
+class LLMBackend:
+    """
+    Backends implement ``_complete`` -> ``(text, prompt_tokens, completion_tokens)``,
+    ``_stream`` (yielding text and filling the ``usage`` dict) and ``_embed``.
+    """
+    model_name = ''
+
+    def generate(self, prompt, model=None):
+        started = time.perf_counter()
+        with timed('llm'):
+            text, prompt_tokens, completion_tokens = self._complete(prompt, model)
+        _record(prompt_tokens, completion_tokens, started)
+        return text
+
+    async def stream(self, prompt, model=None):
+        started = time.perf_counter()
+        usage = {}
+        with timed('llm'):
+            async for text in self._stream(prompt, model, usage):
+                yield text
+        _record(usage.get('prompt_tokens'), usage.get('completion_tokens'), started)
+
+    def embed(self, texts, model, task_type, dimensions):
+        with timed('llm'):
+            return self._embed(texts, model, task_type, dimensions)
+
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, config):
+        import google.generativeai as genai
+
+        if not config['API_KEY']:
+            raise RuntimeError("GEMINI_API_KEY must be set to use the Gemini backend.")
+        self.genai = genai
+        self.default_model = config['MODEL']
+        self.model_name = config['MODEL']
+        self.request_options = {'timeout': config['TIMEOUT']}
+        # Resets the SDK's cached clients, so a forked worker never reuses its parent's channel
+        genai.configure(api_key=config['API_KEY'], transport=config['TRANSPORT'])
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, name):
+        name = name or self.default_model
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self.genai.GenerativeModel(name)
+            return self._models[name]
+
+    def _complete(self, prompt, model):
+        response = self._model(model).generate_content(prompt, request_options=self.request_options)
+        metadata = getattr(response, 'usage_metadata', None)
+        return (response.text, getattr(metadata, 'prompt_token_count', None),
+                getattr(metadata, 'candidates_token_count', None))
+
+    async def _stream(self, prompt, model, usage):
+        response = await self._model(model).generate_content_async(
+            prompt, stream=True, request_options=self.request_options
+        )
+        async for chunk in response:
+            metadata = getattr(chunk, 'usage_metadata', None)
+            if metadata is not None:
+                # Counts are cumulative; the last chunk carries the totals
+                usage['prompt_tokens'] = metadata.prompt_token_count
+                usage['completion_tokens'] = metadata.candidates_token_count
+            if chunk.text:
+                yield chunk.text
+
+    def _embed(self, texts, model, task_type, dimensions):
+        result = self.genai.embed_content(model=model, content=texts, task_type=task_type,
+                                          request_options=self.request_options)
+        return result['embedding']
+
+
+class StubBackend(LLMBackend):
+    """Deterministic offline stand-in: the same prompt always gets the same answer."""
+
+    QUIZ_RE = re.compile(r'create a (\d+)-question quiz')
+
+    def __init__(self, config):
+        self.default_model = config['MODEL']
+        self.model_name = f"stub:{config['MODEL']}"
+        self.latency = config['STUB_LATENCY_MS'] / 1000
+        self.error_rate = config['STUB_ERROR_RATE']
+
+    def _maybe_fail(self):
+        # Injected provider failures, for exercising error paths under load
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError('Stub backend injected failure')
+
+    def _digest(self, text):
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _tokens(self, text):
+        # Roughly four characters per token, like the real tokenizers
+        return max(1, len(text) // 4)
+
+    def _answer(self, prompt):
+        digest = self._digest(prompt)
+        match = self.QUIZ_RE.search(prompt)
+        if match:
+            return json.dumps({'questions': [
+                {
+                    'question': f'Stub question {number} ({digest[:8]})?',
+                    'options': {letter: f'Option {letter}' for letter in 'ABCD'},
+                    'correct_answer': 'ABCD'[int(digest[number % 64], 16) % 4],
+                    'explanation': 'Generated by the stub backend.',
+                }
+                for number in range(int(match.group(1)))
+            ]})
+        return f"Stub summary {digest[:16]} of a {len(prompt)}-character prompt."
+
+    def _complete(self, prompt, model):
+        if self.latency:
+            time.sleep(self.latency)
+        self._maybe_fail()
+        text = self._answer(prompt)
+        return text, self._tokens(prompt), self._tokens(text)
+
+    async def _stream(self, prompt, model, usage):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        text = self._answer(prompt)
+        usage.update(prompt_tokens=self._tokens(prompt), completion_tokens=self._tokens(text))
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+
+    def _embed(self, texts, model, task_type, dimensions):
+        # Hashed bag of words: texts sharing words get similar vectors, so retrieval still behaves
+        self._maybe_fail()
+        vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                vectors[row, int(self._digest(word)[:8], 16) % dimensions] += 1.0
+        return vectors.tolist()
+
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'stub': StubBackend,
+}
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return this process's backend, creating it on first use (and again after a fork)."""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            config = _config()
+            backend = BACKENDS.get(config['BACKEND']) or import_string(config['BACKEND'])
+            _client = backend(config)
+            _client_pid = os.getpid()
+        return _client
+
+
+def reset_client():
+    # Lets tests and benchmarks switch AI_LLM settings at runtime
+    global _client
+    with _client_lock:
+        _client = None
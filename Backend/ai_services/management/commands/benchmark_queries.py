@@ -0,0 +1,141 @@
+import json
+import random
+import re
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+from ai_services.models import AIRequest
+from notes.models import UploadedFile, Summary, Quiz, CommonBook, SUBJECT_CHOICES, GRADE_CHOICES
+
+User = get_user_model()
+
+COST_RE = re.compile(r'cost=([\d.]+)\.\.([\d.]+)')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Seed a realistic data volume, then report query plans and timings for the "
+            "listing queries. Seed data is rolled back afterwards unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--files-per-user', type=int, default=25)
+        parser.add_argument('--summaries-per-user', type=int, default=150)
+        parser.add_argument('--quizzes-per-user', type=int, default=75)
+        parser.add_argument('--requests-per-user', type=int, default=300)
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=25, help='Timed runs per query')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                users = self.seed(options)
+                results = self.measure(users, options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+        self.report(results, options)
+
+    def seed(self, options):
+        started = time.perf_counter()
+        tag = f"bench-{int(time.time())}"
+        users = User.objects.bulk_create(
+            [User(username=f"{tag}-{n}", email=f"{tag}-{n}@example.com") for n in range(options['users'])]
+        )
+        subjects = [choice for choice, _ in SUBJECT_CHOICES]
+        grades = [choice for choice, _ in GRADE_CHOICES]
+
+        files = UploadedFile.objects.bulk_create([
+            UploadedFile(user=user, title=f"Notes {n}", subject=random.choice(subjects),
+                         grade=random.choice(grades), file_name=f"notes-{n}.pdf",
+                         file_url=f"https://example.com/{user.username}/notes-{n}.pdf")
+            for user in users for n in range(options['files_per_user'])
+        ], batch_size=2000)
+        files_by_user = {}
+        for file_obj in files:
+            files_by_user.setdefault(file_obj.user_id, []).append(file_obj)
+
+        Summary.objects.bulk_create([
+            Summary(user=user, file=random.choice(files_by_user[user.id]), content='Summary text. ' * 150)
+            for user in users for _ in range(options['summaries_per_user'])
+        ], batch_size=2000)
+        Quiz.objects.bulk_create([
+            Quiz(user=user, file=random.choice(files_by_user[user.id]),
+                 questions={'questions': [{'question': 'Q?', 'options': {}, 'correct_answer': 'A'}] * 5})
+            for user in users for _ in range(options['quizzes_per_user'])
+        ], batch_size=2000)
+        AIRequest.objects.bulk_create([
+            AIRequest(user=user, request_type=random.choice(['summary', 'quiz']),
+                      content='x' * 200, response='y' * 200)
+            for user in users for _ in range(options['requests_per_user'])
+        ], batch_size=2000)
+        CommonBook.objects.bulk_create([
+            CommonBook(title=f"Book {n}", subject=random.choice(subjects), grade=random.choice(grades),
+                       file_url=f"https://example.com/book-{n}.pdf", is_active=random.random() < 0.8)
+            for n in range(options['books'])
+        ], batch_size=2000)
+
+        if connection.vendor == 'postgresql':
+            # Fresh statistics so the planner sees the seeded volume
+            with connection.cursor() as cursor:
+                for model in (UploadedFile, Summary, Quiz, CommonBook, AIRequest):
+                    cursor.execute(f'ANALYZE {model._meta.db_table}')
+        self.stderr.write(f"Seeded {len(users)} users in {time.perf_counter() - started:.1f}s")
+        return users
+
+    def queries(self, user):
+        # Mirrors the ORM queries issued by the listing views
+        file_fields = {'file_title': F('file__title'), 'subject': F('file__subject'), 'grade': F('file__grade')}
+        return {
+            'user_files': UploadedFile.objects.filter(user=user).order_by('-uploaded_at'),
+            'user_summaries': Summary.objects.filter(user=user)
+                .values('id', 'created_at', 'content', **file_fields).order_by('-created_at', '-id')[:21],
+            'user_quizzes': Quiz.objects.filter(user=user)
+                .values('id', 'created_at', 'questions', **file_fields).order_by('-created_at', '-id')[:21],
+            'common_books': CommonBook.objects.filter(is_active=True, subject='Physics', grade='Grade11'),
+            'user_ai_requests': AIRequest.objects.filter(user=user).order_by('-created_at')[:50],
+        }
+
+    def measure(self, users, options):
+        results = {}
+        for name in self.queries(users[0]):
+            timings = []
+            for _ in range(options['repeat']):
+                queryset = self.queries(random.choice(users))[name]
+                started = time.perf_counter()
+                list(queryset)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            plan = self.queries(users[0])[name].explain()
+            match = COST_RE.search(plan)
+            results[name] = {
+                'total_cost': float(match.group(2)) if match else None,
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(sorted(timings)[int(0.95 * (len(timings) - 1))], 3),
+                'uses_index': 'Index' in plan or 'USING INDEX' in plan.upper(),
+                'plan': plan,
+            }
+        return results
+
+    def report(self, results, options):
+        if options['json']:
+            self.stdout.write(json.dumps({'vendor': connection.vendor, 'queries': results}, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:18} cost={result['total_cost']} p50={result['p50_ms']}ms "
+                f"p95={result['p95_ms']}ms index={'yes' if result['uses_index'] else 'NO'}"
+            )
+            for line in result['plan'].splitlines():
+                self.stdout.write(f"    {line}")
@@ -0,0 +1,69 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ai_services.generation import generate_book_summary
+from ai_services.llm import metered
+from ai_services.question_bank import fill_bank
+from notes.models import CommonBook, UploadedFile
+
+
+class Command(BaseCommand):
+    help = ("Precompute the shared summary and question bank of every active, extracted CommonBook. "
+            "Finished work is stored per book (and per chunk and question batch), so a rerun resumes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book-id', type=int, action='append', dest='book_ids',
+                            help='Only precompute these books (repeatable)')
+        parser.add_argument('--workers', type=int, default=settings.AI_BATCH['CONCURRENCY'],
+                            help='Books processed in parallel')
+        parser.add_argument('--questions', type=int, default=settings.AI_QUESTION_BANK['LOW_WATER'],
+                            help='Questions to keep in each question bank')
+        parser.add_argument('--skip-summaries', action='store_true')
+        parser.add_argument('--skip-quizzes', action='store_true')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate summaries and question banks that are already up to date')
+
+    def _precompute(self, book, options):
+        try:
+            done = []
+            if not options['skip_summaries']:
+                _, cached = generate_book_summary(book, force=options['force'])
+                done.append('summary kept' if cached else 'summary generated')
+            if not options['skip_quizzes']:
+                count = fill_bank(book, options['questions'], force=options['force'])
+                done.append(f'{count} questions')
+            return ', '.join(done)
+        finally:
+            # Pool threads live outside the request cycle, so release their connections here
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        books = CommonBook.objects.filter(is_active=True)
+        if options['book_ids']:
+            books = books.filter(id__in=options['book_ids'])
+        pending = books.exclude(extraction_status=UploadedFile.EXTRACTION_DONE)
+        for book in pending:
+            self.stderr.write(f"Skipping {book.title}: text not extracted yet (manage.py extract_common_books)")
+        books = list(books.filter(extraction_status=UploadedFile.EXTRACTION_DONE).order_by('id'))
+
+        failed = 0
+        with metered() as usage, ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            # Copied contexts carry the usage meter into the worker threads
+            futures = {executor.submit(contextvars.copy_context().run, self._precompute, book, options): book
+                       for book in books}
+            for future in as_completed(futures):
+                book = futures[future]
+                try:
+                    self.stdout.write(f"{book.title}: {future.result()}")
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Precompute failed for {book.title}: {e}")
+
+        self.stdout.write(f"Precomputed {len(books) - failed} of {len(books)} books "
+                          f"({usage.calls} model calls, {usage.prompt_tokens + usage.completion_tokens} tokens)")
+        if failed:
+            self.stderr.write("Rerun the command to resume the failed books")
@@ -0,0 +1,34 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+
+from ai_services.vector_index import _config, index_chunks
+from notes.models import DocumentChunk
+
+
+class Command(BaseCommand):
+    help = "Rebuild the local vector index from every stored DocumentChunk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Rebuilding also drops rows for chunks that were deleted or re-extracted
+        index_dir = _config()['DIR']
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+
+        chunks = DocumentChunk.objects.select_related('file', 'book').order_by('id')
+        batch = []
+        total = 0
+        for chunk in chunks.iterator(chunk_size=options['batch_size']):
+            batch.append(chunk)
+            if len(batch) >= options['batch_size']:
+                index_chunks(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            index_chunks(batch)
+            total += len(batch)
+        self.stdout.write(f"Indexed {total} chunks into {index_dir}")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_services', '0002_generationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airequest',
+            index=models.Index(fields=['user', '-created_at'], name='airequest_user_created'),
+        ),
+    ]
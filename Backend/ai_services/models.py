@@ -1,14 +1,75 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 class AIRequest(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_requests')
-    request_type = models.CharField(max_length=50)  # 'summary' or 'quiz'
+    # None for catalog precomputation (manage.py precompute_catalog), which no student asked for
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_requests', null=True, blank=True)
+    request_type = models.CharField(max_length=50)  # 'summary', 'quiz' or 'ask'
     content = models.TextField()
     response = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    model_name = models.CharField(max_length=100, blank=True)
+    cache_hit = models.BooleanField(default=False)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)  # Upstream model time; null on cache hits
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    # Set when the request happened, not when the buffered row is flushed (see request_log)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='airequest_user_created'),
+        ]
     
     def __str__(self):
         return f"{self.request_type} request by {self.user.username}"
+
+
+class GenerationJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    job_type = models.CharField(max_length=50)  # 'summary', 'quiz' or 'batch'
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job_type} job {self.id} ({self.status})"
+
+
+class AIQuota(models.Model):
+    # Token bucket of ai_services.quota, in model tokens; refilled lazily whenever it is charged
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='ai_quota')
+    tokens = models.FloatField()  # Negative while the user owes tokens spent beyond an estimate
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"AI quota of {self.user.username}: {self.tokens:.0f} tokens"
+
+
+class GenerationLease(models.Model):
+    # Held by the one worker generating a result (ai_services.singleflight); the others wait for it
+    key = models.CharField(max_length=64, primary_key=True)
+    owner = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Lease on {self.key} until {self.expires_at}"
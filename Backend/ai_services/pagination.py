@@ -0,0 +1,57 @@
+"""
+Keyset (cursor) pagination over ``(created_at, id)``.
+
+Pages are fetched with ``WHERE (created_at, id) < cursor ORDER BY created_at DESC, id DESC``
+so every page costs the same index range scan, however deep the client has paged.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, pk)``; raises ValueError for malformed cursors."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def get_limit(request):
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(queryset, request):
+    """
+    Return ``(rows, next_cursor)`` for the page selected by ``?cursor=`` and ``?limit=``.
+
+    ``queryset`` must be a ``values()`` queryset that includes ``id`` and ``created_at``.
+    """
+    limit = get_limit(request)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # One extra row tells us whether another page exists without a COUNT query
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
@@ -0,0 +1,293 @@
+"""
+Per-document question banks behind quiz generation.
+
+Questions are stored one row each (``notes.BankQuestion``), deduplicated by a
+hash of their normalized text, and a quiz is a random sample of the bank. The
+model is only asked for another batch when the bank cannot cover a request, or
+in the background once it holds fewer than ``LOW_WATER`` questions, so most
+quiz requests are answered from the database alone. A top-up that adds no new
+question marks the bank saturated, and no further top-ups are made for it until
+its source changes or ``SATURATED_COOLDOWN_SECONDS`` pass.
+
+Each question records the ``source_key`` of the document text, title, subject
+and grade it was written from; after a re-extraction or an edit of those, the
+old questions are no longer served and are dropped on the next top-up.
+
+Banks of catalog books are filled ahead of time by ``manage.py
+precompute_catalog`` (``fill_bank``), and students read them with
+``sample_questions`` without any model call.
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from notes.models import BankQuestion, Quiz
+from .cache import make_cache_key
+from .generation import (
+    FALLBACK_QUIZ, PROMPT_TEMPLATE_VERSION, QUIZ_PROMPT, _chunk_filter, _generate, _model_name, _prompt_fields,
+    get_file_content
+)
+from .llm import metered
+from .request_log import log_request
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# Appended to QUIZ_PROMPT on top-ups so a new batch does not repeat the bank
+AVOID_PROMPT = """
+            Do not repeat or rephrase any of these questions, which the students already have:
+            {questions}
+            """
+
+MAX_QUESTIONS = 50  # Longest quiz a single request may ask for
+
+_executor = None
+_executor_lock = threading.Lock()
+_refilling = set()  # Documents with a background top-up queued or running in this process
+
+
+def _config():
+    config = getattr(settings, 'AI_QUESTION_BANK', {})
+    return {
+        'BATCH_SIZE': config.get('BATCH_SIZE', 20),
+        'LOW_WATER': config.get('LOW_WATER', 30),
+        'AVOID_IN_PROMPT': config.get('AVOID_IN_PROMPT', 50),
+        'RECENT_QUIZZES': config.get('RECENT_QUIZZES', 5),
+        'MAX_WORKERS': config.get('MAX_WORKERS', 2),
+        'SATURATED_COOLDOWN_SECONDS': config.get('SATURATED_COOLDOWN_SECONDS', 3600),
+    }
+
+
+def parse_num_questions(value, default=5):
+    """Clamp a client-supplied quiz length to 1..MAX_QUESTIONS; raises ValueError unless it is an integer."""
+    if value is None:
+        return default
+    try:
+        return max(1, min(int(value), MAX_QUESTIONS))
+    except (TypeError, ValueError):
+        raise ValueError('num_questions must be an integer')
+
+
+def content_hash(question_text):
+    normalized = ' '.join(str(question_text).lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def source_key(document, file_content):
+    return make_cache_key('question-bank', _model_name(), PROMPT_TEMPLATE_VERSION, file_content,
+                          *_prompt_fields(document))
+
+
+def _saturated_key(document, key):
+    return f'question-bank-saturated:{type(document).__name__}:{document.pk}:{key}'
+
+
+def is_saturated(document, key):
+    """Whether the last top-up of ``document``'s bank under source ``key`` came back with nothing new."""
+    return bool(caches['shared'].get(_saturated_key(document, key)))
+
+
+def _parse_questions(response):
+    try:
+        questions = json.loads(response)['questions']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return []
+    if not isinstance(questions, list):
+        return []
+    return [question for question in questions if isinstance(question, dict) and question.get('question')]
+
+
+def top_up(document, user, size=None, file_content=None):
+    """
+    Ask the model for one batch of new questions for ``document`` and add them to its bank.
+
+    Returns the number of current questions in the bank afterwards. The call is
+    logged as a 'quiz' request of ``user``, who is None when precomputing. A batch with no new
+    question marks the bank saturated (see ``is_saturated``).
+    """
+    config = _config()
+    if file_content is None:
+        file_content = get_file_content(document)
+    key = source_key(document, file_content)
+    bank = BankQuestion.objects.filter(**_chunk_filter(document))
+    bank.exclude(source_key=key).delete()
+    before = bank.filter(source_key=key).count()
+
+    prompt = QUIZ_PROMPT.format(
+        num_questions=size or config['BATCH_SIZE'], subject=document.subject, grade=document.grade,
+        title=document.title, content=file_content
+    )
+    existing = list(bank.order_by('-id').values_list('question__question', flat=True)[:config['AVOID_IN_PROMPT']])
+    if existing:
+        prompt += AVOID_PROMPT.format(questions='\n'.join(f'- {text}' for text in existing))
+
+    with metered() as usage:
+        response = _generate(prompt)
+
+    questions = {}
+    for question in _parse_questions(response):
+        questions.setdefault(content_hash(question['question']), question)
+    # Concurrent top-ups may produce the same question; the unique constraint keeps one
+    BankQuestion.objects.bulk_create([
+        BankQuestion(source_key=key, content_hash=digest, question=question, **_chunk_filter(document))
+        for digest, question in questions.items()
+    ], ignore_conflicts=True)
+
+    log_request(user, 'quiz', file_content, response, usage=usage, model_name=_model_name())
+    count = bank.filter(source_key=key).count()
+    # An empty bank that got nothing is more likely a failed call than an exhausted text
+    if before and count == before:
+        caches['shared'].set(_saturated_key(document, key), True, timeout=_config()['SATURATED_COOLDOWN_SECONDS'])
+    return count
+
+
+def fill_bank(document, target, force=False):
+    """
+    Top ``document``'s bank up to ``target`` current questions; returns the final count.
+
+    Every batch is stored as soon as it arrives, so an interrupted fill resumes
+    where it stopped. ``force`` discards the bank first.
+    """
+    bank = BankQuestion.objects.filter(**_chunk_filter(document))
+    if force:
+        bank.delete()
+    file_content = get_file_content(document)
+    key = source_key(document, file_content)
+    count = bank.filter(source_key=key).count()
+    # A model that keeps repeating itself must not keep the loop going forever
+    for _ in range(-(-target // _config()['BATCH_SIZE']) + 2):
+        if count >= target:
+            break
+        count = top_up(document, None, file_content=file_content)
+    return count
+
+
+def sample_questions(document, num_questions):
+    """
+    Random questions from ``document``'s bank; the model is never called.
+
+    Only questions written from the document's current text and fields are
+    served, so an edited or re-extracted book does not get stale questions.
+    """
+    key = source_key(document, get_file_content(document))
+    ids = list(BankQuestion.objects.filter(source_key=key, **_chunk_filter(document)).values_list('id', flat=True))
+    picked = random.sample(ids, min(num_questions, len(ids)))
+    rows = BankQuestion.objects.only('question').in_bulk(picked)
+    return [rows[row_id].question for row_id in picked if row_id in rows]
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_config()['MAX_WORKERS'], thread_name_prefix='question-bank')
+    return _executor
+
+
+def _background_top_up(marker, document, user):
+    # quota imports this module through batch
+    from . import quota
+
+    try:
+        with metered() as usage:
+            top_up(document, user)
+        if user is not None:
+            quota.charge(user.id, usage.prompt_tokens + usage.completion_tokens)
+    except Exception:
+        logger.exception('Question bank top-up failed for %s %s', *marker)
+    finally:
+        with _executor_lock:
+            _refilling.discard(marker)
+        # Pool threads live outside the request cycle, so release their connections here
+        close_old_connections()
+
+
+def schedule_top_up(document, user):
+    """Top up ``document``'s bank in the background unless that is already under way in this process."""
+    marker = (type(document).__name__, document.pk)
+    with _executor_lock:
+        if marker in _refilling:
+            return
+        _refilling.add(marker)
+        executor = _get_executor()
+    executor.submit(_background_top_up, marker, document, user)
+
+
+def _recently_served(user, file_obj):
+    quizzes = (Quiz.objects.filter(user=user, file=file_obj)
+               .order_by('-created_at')
+               .values_list('questions', flat=True)[:_config()['RECENT_QUIZZES']])
+    return {
+        content_hash(question['question'])
+        for quiz in quizzes if isinstance(quiz, dict)
+        for question in quiz.get('questions', []) if isinstance(question, dict) and question.get('question')
+    }
+
+
+def _sample(user, file_obj, available, num_questions):
+    # Questions the user was not just quizzed on come first
+    seen = _recently_served(user, file_obj)
+    fresh = [row_id for row_id, digest in available if digest not in seen]
+    repeats = [row_id for row_id, digest in available if digest in seen]
+    picked = random.sample(fresh, min(num_questions, len(fresh)))
+    picked += random.sample(repeats, min(num_questions - len(picked), len(repeats)))
+
+    rows = BankQuestion.objects.only('question').in_bulk(picked)
+    return [rows[row_id].question for row_id in picked if row_id in rows]
+
+
+def generate_quiz(user, file_obj, num_questions=5, save=True):
+    """
+    Return ``(quiz, cached)`` sampled from ``file_obj``'s bank, calling Gemini only if the bank is short.
+
+    With ``save=False`` the Quiz is returned unsaved, for callers that bulk insert;
+    the bank rows other requests wait on are stored either way. ``num_questions``
+    must already be in 1..MAX_QUESTIONS (see ``parse_num_questions``).
+    """
+    if not isinstance(num_questions, int) or not 1 <= num_questions <= MAX_QUESTIONS:
+        raise ValueError(f'num_questions must be an integer between 1 and {MAX_QUESTIONS}')
+    config = _config()
+    file_content = get_file_content(file_obj)
+    key = source_key(file_obj, file_content)
+
+    def available():
+        return list(BankQuestion.objects.filter(file=file_obj, source_key=key).values_list('id', 'content_hash'))
+
+    rows = available()
+    before = len(rows)
+
+    def covering():
+        # A top-up finished elsewhere counts even if the model came up short, or every waiter would call it again
+        current = available()
+        done = len(current) >= num_questions or len(current) > before or is_saturated(file_obj, key)
+        return current if done else None
+
+    saturated = is_saturated(file_obj, key)
+    # A saturated bank is served as it is, short or not
+    cached = len(rows) >= num_questions or saturated
+    if not cached:
+        # Concurrent requests for a short bank wait for one top-up
+        with single_flight(f'question-bank:{file_obj.pk}:{key}', covering) as covered:
+            cached = covered is not None
+            if not cached:
+                top_up(file_obj, user, size=max(config['BATCH_SIZE'], num_questions - len(rows)),
+                       file_content=file_content)
+            rows = covered if cached else available()
+    if len(rows) < config['LOW_WATER'] and not saturated:
+        schedule_top_up(file_obj, user)
+
+    # The fallback is never added to the bank, so the next request gets another chance
+    questions = _sample(user, file_obj, rows, num_questions) or FALLBACK_QUIZ['questions']
+    quiz = Quiz(user=user, file=file_obj, questions={'questions': questions}, cache_key=key)
+    if save:
+        quiz.save()
+
+    if cached:
+        log_request(user, 'quiz', file_content, str(quiz.questions), cache_hit=True, model_name=_model_name())
+    return quiz, cached
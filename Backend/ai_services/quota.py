@@ -0,0 +1,193 @@
+"""
+Cost-weighted AI quota shared by every worker process.
+
+Each user has a token bucket (``AIQuota`` row) measured in model tokens that
+refills at ``REFILL_PER_MINUTE`` up to ``CAPACITY``. Before a view runs, the
+prompt and completion tokens of the request are estimated from the request
+alone (document size, quiz length, number of retrieved passages) and the
+request is rejected with a 429 unless the bucket holds that many. Once the
+response is ready the estimate is replaced by the tokens actually spent, so
+cache and question-bank hits cost nothing. Async jobs and streamed responses
+spend their tokens after the response: a job settles once it has finished and
+a stream once its last event is sent. Background question-bank top-ups are
+charged to the user whose request started them.
+
+The bucket row is locked while it is charged, so concurrent requests from
+any process see a consistent balance.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Least, Length
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+from notes.models import DocumentChunk
+from . import batch
+from .llm import metered
+from .models import AIQuota
+from .question_bank import MAX_QUESTIONS
+
+
+def _config():
+    config = getattr(settings, 'AI_QUOTA', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'CAPACITY': config.get('CAPACITY', 100000),
+        'REFILL_PER_MINUTE': config.get('REFILL_PER_MINUTE', 10000),
+        'CHARS_PER_TOKEN': config.get('CHARS_PER_TOKEN', 4),
+        'PROMPT_OVERHEAD_TOKENS': config.get('PROMPT_OVERHEAD_TOKENS', 250),
+        'COMPLETION_TOKENS': {'summary': 1200, 'quiz': 150, 'ask': 600, **config.get('COMPLETION_TOKENS', {})},
+    }
+
+
+def _int(value, default, low, high):
+    try:
+        return max(low, min(int(value), high))
+    except (TypeError, ValueError):
+        return default
+
+
+def _document_chars(user, file_ids):
+    # Characters of extracted text per file; files still without chunks count as empty
+    chunks = DocumentChunk.objects.filter(file_id__in=file_ids, file__user=user)
+    sizes = dict(chunks.values('file_id').annotate(chars=Sum(Length('text'))).values_list('file_id', 'chars'))
+    return [sizes.get(file_id, 0) for file_id in file_ids]
+
+
+def _file_tokens(config, request_type, chars, num_questions):
+    completion = config['COMPLETION_TOKENS'].get(request_type, 0)
+    max_chars = settings.AI_MAX_CONTENT_CHARS
+    prompt_chars = min(chars, max_chars)
+    if request_type == 'summary' and chars > max_chars:
+        prompt_chars += chars  # Map-reduce: every chunk is sent once before the reduce call
+    if request_type == 'quiz':
+        completion *= num_questions  # Per question
+    return config['PROMPT_OVERHEAD_TOKENS'] + prompt_chars // config['CHARS_PER_TOKEN'] + completion
+
+
+def estimate_tokens(request, request_type):
+    """Estimate the prompt plus completion tokens of an AI request without building its prompt."""
+    config = _config()
+    num_questions = _int(request.data.get('num_questions'), 5, 1, MAX_QUESTIONS)
+
+    if request_type == 'ask':
+        top_k = _int(request.data.get('top_k'), 5, 1, 20)
+        prompt_chars = len(str(request.data.get('question') or '')) + top_k * settings.NOTES_EXTRACTION['CHUNK_CHARS']
+        return (config['PROMPT_OVERHEAD_TOKENS'] + prompt_chars // config['CHARS_PER_TOKEN']
+                + config['COMPLETION_TOKENS']['ask'])
+
+    if request_type == 'batch':
+        try:
+            params = batch.request_batch_params(request)
+        except ValueError:
+            return 0  # The view rejects the request anyway
+        request_type, file_ids = params['kind'], params['file_ids']
+    else:
+        try:
+            file_ids = [int(request.data.get('file_id'))]
+        except (TypeError, ValueError):
+            return 0  # The view rejects the request anyway
+
+    return sum(_file_tokens(config, request_type, chars, num_questions)
+               for chars in _document_chars(request.user, file_ids))
+
+
+def take(user_id, cost):
+    """
+    Charge ``cost`` tokens to the user's bucket; returns 0, or the seconds until
+    they would be available (None if the bucket does not refill).
+    """
+    config = _config()
+    capacity = config['CAPACITY']
+    rate = config['REFILL_PER_MINUTE'] / 60
+    # An estimate above the burst size is admitted from a full bucket and leaves it in debt
+    needed = min(cost, capacity)
+
+    with transaction.atomic():
+        bucket = AIQuota.objects.select_for_update().filter(user_id=user_id).first()
+        if bucket is None:
+            AIQuota.objects.bulk_create([AIQuota(user_id=user_id, tokens=capacity, updated_at=timezone.now())],
+                                        ignore_conflicts=True)
+            bucket = AIQuota.objects.select_for_update().get(user_id=user_id)
+
+        now = timezone.now()
+        elapsed = max(0.0, (now - bucket.updated_at).total_seconds())
+        tokens = min(capacity, bucket.tokens + elapsed * rate)
+        if tokens < needed:
+            return (needed - tokens) / rate if rate > 0 else None
+
+        bucket.tokens = tokens - cost
+        bucket.updated_at = now
+        bucket.save(update_fields=['tokens', 'updated_at'])
+    return 0
+
+
+def settle(user_id, charged, spent):
+    """Replace a request's estimated charge with the tokens it actually spent."""
+    if charged != spent:
+        AIQuota.objects.filter(user_id=user_id).update(
+            tokens=Least(F('tokens') + (charged - spent), Value(float(_config()['CAPACITY'])))
+        )
+
+
+async def settle_after(user_id, charged, stream):
+    """Yield from the async iterator ``stream``, then settle ``charged`` against the tokens it spent."""
+    with metered() as usage:
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            # Also when the client disconnects: only what was generated is paid for
+            await sync_to_async(settle)(user_id, charged, usage.prompt_tokens + usage.completion_tokens)
+
+
+def charge(user_id, spent):
+    """Charge tokens spent by background work, which no request estimate covered."""
+    if _config()['ENABLED']:
+        settle(user_id, 0, spent)
+
+
+class AIQuotaThrottle(BaseThrottle):
+    """Admits a request only while the user's bucket holds its estimated token cost."""
+
+    def allow_request(self, request, view):
+        request_type = getattr(view, 'ai_request_type', None)
+        if request_type is None or not _config()['ENABLED'] or not request.user.is_authenticated:
+            return True
+
+        cost = estimate_tokens(request, request_type)
+        self.wait_seconds = take(request.user.id, cost)
+        if self.wait_seconds != 0:
+            return False  # A wait of None sends no Retry-After
+        view.ai_quota_charge = cost
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AIQuotaMixin:
+    """
+    Puts an APIView under the AI quota. ``ai_request_type`` ('summary', 'quiz', 'ask'
+    or 'batch') selects the estimate; the model calls made while the view runs settle it.
+    """
+    ai_request_type = None
+    ai_quota_charge = None
+
+    def get_throttles(self):
+        return [*super().get_throttles(), AIQuotaThrottle()]
+
+    def dispatch(self, request, *args, **kwargs):
+        with metered() as usage:
+            response = super().dispatch(request, *args, **kwargs)
+        if self.ai_quota_charge is None or response.status_code == 202:
+            return response  # Queued jobs carry the charge in their params and settle when they finish
+        if not response.streaming:
+            settle(self.request.user.id, self.ai_quota_charge, usage.prompt_tokens + usage.completion_tokens)
+        elif response.is_async:
+            # The model is called while the stream is consumed, after this returns
+            response.streaming_content = settle_after(self.request.user.id, self.ai_quota_charge,
+                                                      response.streaming_content)
+        return response
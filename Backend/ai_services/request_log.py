@@ -0,0 +1,130 @@
+"""
+Buffered AIRequest logging.
+
+Generation code calls ``log_request`` and does not wait on a database write.
+Rows collect in an in-process queue, and a background thread saves them with
+one ``bulk_create`` whenever ``BATCH_SIZE`` rows are waiting, or at least every
+``FLUSH_SECONDS``. If the queue fills up, the caller writes the batch itself.
+This applies backpressure rather than losing rows. Queued rows are flushed
+when the process exits.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import AIRequest
+
+logger = logging.getLogger(__name__)
+
+TRUNCATE_CHARS = 500
+
+
+def _config():
+    config = getattr(settings, 'AI_REQUEST_LOG', {})
+    return {
+        'BATCH_SIZE': config.get('BATCH_SIZE', 200),
+        'FLUSH_SECONDS': config.get('FLUSH_SECONDS', 2.0),
+        'MAX_QUEUE': config.get('MAX_QUEUE', 10000),
+    }
+
+
+class RequestLogBuffer:
+    def __init__(self):
+        config = _config()
+        self.batch_size = config['BATCH_SIZE']
+        self.flush_seconds = config['FLUSH_SECONDS']
+        self._queue = queue.Queue(maxsize=config['MAX_QUEUE'])
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # One flusher per process; a forked worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='ai-request-log', daemon=True)
+                self._thread.start()
+
+    def add(self, row):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._write(self._drain() + [row])
+
+    def _drain(self, limit=None):
+        rows = []
+        while limit is None or len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        if not rows:
+            return
+        try:
+            AIRequest.objects.bulk_create(rows, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Dropped %d AIRequest log rows', len(rows))
+
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            # Gather a batch for at most FLUSH_SECONDS after the first row arrives
+            deadline = time.monotonic() + self.flush_seconds
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(rows)
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                return
+            self._write(rows)
+
+
+buffer = RequestLogBuffer()
+atexit.register(buffer.flush)
+
+
+def log_request(user, request_type, content, response, usage=None, cache_hit=False, model_name=''):
+    """
+    Queue an AIRequest row; ``usage`` is the ``llm.Usage`` of the calls behind it, if any.
+
+    ``user`` is None for work no student asked for, such as catalog precomputation.
+    """
+    buffer.add(AIRequest(
+        user=user,
+        request_type=request_type,
+        content=content[:TRUNCATE_CHARS],
+        response=response[:TRUNCATE_CHARS],
+        model_name=model_name,
+        cache_hit=cache_hit,
+        latency_ms=round(usage.latency_ms) if usage is not None and usage.calls else None,
+        prompt_tokens=usage.prompt_tokens if usage is not None and usage.calls else None,
+        completion_tokens=usage.completion_tokens if usage is not None and usage.calls else None,
+        created_at=timezone.now(),
+    ))
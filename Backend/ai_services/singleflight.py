@@ -0,0 +1,169 @@
+"""
+Single-flight coalescing of identical generation requests.
+
+When many students ask for the same result at once (same generation key),
+only one of them calls the model. Within a process the others wait on an
+event; across processes the producer holds a ``GenerationLease`` row and the
+others poll ``lookup`` until the result has been persisted. Every caller then
+reads the one result.
+
+    with single_flight(f'summary:{key}', lambda: get_cached_summary(key)) as found:
+        if found is not None:
+            ...  # Produced by a concurrent request
+        else:
+            ...  # Generate and persist; ``lookup`` must see it before the block exits
+
+While a producer runs, a renewer thread pushes back the expiry of every
+lease its process holds every third of ``LEASE_SECONDS``, so a long generation
+keeps its lease. If the producer fails, or its process dies and the lease
+expires, the next waiter takes over.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import GenerationLease
+
+logger = logging.getLogger(__name__)
+
+_flights = {}  # digest -> Event set when this process's producer finishes
+_held = set()  # Owners of the leases this process's producers hold
+_renewer = None
+_lock = threading.Lock()
+
+
+def _config():
+    config = getattr(settings, 'AI_SINGLE_FLIGHT', {})
+    return {
+        'LEASE_SECONDS': config.get('LEASE_SECONDS', 300),
+        'POLL_SECONDS': config.get('POLL_SECONDS', 0.5),
+    }
+
+
+class Lease:
+    def __init__(self, digest):
+        self.digest = digest
+        self.owner = uuid.uuid4().hex
+
+
+def _take(lease):
+    config = _config()
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=config['LEASE_SECONDS'])
+    try:
+        with transaction.atomic():
+            GenerationLease.objects.create(key=lease.digest, owner=lease.owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        # Held elsewhere; a lease left behind by a crashed or stuck worker can be taken over
+        return bool(GenerationLease.objects.filter(key=lease.digest, expires_at__lt=now)
+                    .update(owner=lease.owner, expires_at=expires_at))
+
+
+def _renew():
+    with _lock:
+        owners = list(_held)
+    if owners:
+        expires_at = timezone.now() + timedelta(seconds=_config()['LEASE_SECONDS'])
+        # A lease taken over in the meantime has a new owner and is left alone
+        GenerationLease.objects.filter(owner__in=owners).update(expires_at=expires_at)
+
+
+def _renew_forever():
+    while True:
+        time.sleep(_config()['LEASE_SECONDS'] / 3)
+        try:
+            _renew()
+        except Exception:
+            logger.exception('Could not renew generation leases')
+        finally:
+            close_old_connections()
+
+
+def _hold(lease):
+    global _renewer
+    with _lock:
+        _held.add(lease.owner)
+        if _renewer is None:
+            _renewer = threading.Thread(target=_renew_forever, name='lease-renewer', daemon=True)
+            _renewer.start()
+
+
+def _finish(digest):
+    with _lock:
+        event = _flights.pop(digest, None)
+    if event is not None:
+        event.set()
+
+
+def acquire(key, lookup):
+    """
+    Return ``(None, value)`` once a concurrent producer of ``key`` has made ``lookup()``
+    return a value, or ``(lease, None)`` if the caller must produce it and then ``release(lease)``.
+    """
+    config = _config()
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    while True:
+        with _lock:
+            event = _flights.get(digest)
+            if event is None:
+                _flights[digest] = threading.Event()
+                break
+        # Woken when the producer finishes; it keeps its lease renewed, so wait for as long as it runs
+        event.wait(config['LEASE_SECONDS'])
+        value = lookup()
+        if value is not None:
+            return None, value
+
+    # This thread is the process's producer; other processes may have one too
+    lease = Lease(digest)
+    try:
+        while not _take(lease):
+            value = lookup()
+            if value is not None:
+                _finish(digest)
+                return None, value
+            time.sleep(config['POLL_SECONDS'])
+        _hold(lease)
+
+        # The previous holder may have finished between our last lookup and taking the lease
+        value = lookup()
+        if value is not None:
+            release(lease)
+            return None, value
+    except BaseException:
+        with _lock:
+            _held.discard(lease.owner)
+        _finish(digest)
+        raise
+    return lease, None
+
+
+def release(lease):
+    with _lock:
+        _held.discard(lease.owner)
+    try:
+        GenerationLease.objects.filter(key=lease.digest, owner=lease.owner).delete()
+    finally:
+        _finish(lease.digest)
+
+
+@contextmanager
+def single_flight(key, lookup):
+    """Yield the value a concurrent producer of ``key`` made, or ``None`` while this caller produces it."""
+    lease, value = acquire(key, lookup)
+    if lease is None:
+        yield value
+        return
+    try:
+        yield None
+    finally:
+        release(lease)
@@ -0,0 +1,860 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notes.models import BankQuestion, CommonBook, DocumentChunk, Quiz, Summary, UploadedFile
+from . import generation, jobs, llm, question_bank, quota, request_log, singleflight, vector_index
+from .cache import get_cached_summary, make_cache_key, result_cache
+from .llm import metered
+from .models import AIQuota, GenerationJob, GenerationLease
+from .generation import condense_chunks, generate_book_summary
+from .question_bank import MAX_QUESTIONS, fill_bank, generate_quiz, is_saturated, source_key, top_up
+
+STUB_LLM = {'BACKEND': 'stub', 'MODEL': 'gemini-pro'}
+# No background top-ups: their pool threads would race the test transaction
+QUESTION_BANK = {'BATCH_SIZE': 10, 'LOW_WATER': 0}
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class EchoBackend(llm.LLMBackend):
+    # Loaded by dotted path from AI_LLM['BACKEND']
+    model_name = 'echo'
+
+    def __init__(self, config):
+        self.config = config
+
+    def _complete(self, prompt, model):
+        return prompt, 1, 2
+
+
+@override_settings(AI_LLM=STUB_LLM, AI_QUESTION_BANK=QUESTION_BANK, CACHES=LOCAL_CACHES)
+class AIServicesTestCase(TestCase):
+    def setUp(self):
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        result_cache.clear()
+        caches['shared'].clear()
+        # Logged rows would be written by the buffer's thread after the test has rolled back
+        patcher = mock.patch.object(request_log.buffer, 'add')
+        self.logged = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='student', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.file = self.make_file('Forces')
+
+    def make_file(self, title, text=None):
+        file_obj = UploadedFile.objects.create(
+            user=self.user, title=title, subject='Physics', grade='Grade11',
+            file_name=f'{title}.txt', file_url=f'http://example.com/{title}.txt'
+        )
+        DocumentChunk.objects.create(file=file_obj, index=0, page=1, text=text or f'Notes about {title}.')
+        return file_obj
+
+    def queue_only(self):
+        # Jobs are created as enqueue would, but never handed to the worker pool
+        return mock.patch.object(jobs, 'enqueue', side_effect=lambda user, job_type, params:
+                                 GenerationJob.objects.create(user=user, job_type=job_type, params=params))
+
+
+@override_settings(AI_LLM=STUB_LLM)
+class LLMClientTests(TestCase):
+    def setUp(self):
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+
+    def test_client_is_created_once_per_process(self):
+        client = llm.get_client()
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(llm.get_client())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(other is client for other in clients))
+
+        llm.reset_client()
+        self.assertIsNot(llm.get_client(), client)
+
+    def test_forked_process_builds_its_own_client(self):
+        client = llm.get_client()
+        with mock.patch.object(llm.os, 'getpid', return_value=-1):
+            self.assertIsNot(llm.get_client(), client)
+
+    @override_settings(AI_LLM={'BACKEND': 'ai_services.tests.EchoBackend', 'MODEL': 'echo'})
+    def test_backend_can_be_a_dotted_path(self):
+        client = llm.get_client()
+        self.assertIsInstance(client, EchoBackend)
+        self.assertEqual(client.config['MODEL'], 'echo')
+        self.assertEqual(client.generate('hello'), 'hello')
+
+    @override_settings(AI_LLM={'BACKEND': 'gemini', 'API_KEY': ''})
+    def test_gemini_requires_an_api_key(self):
+        with self.assertRaisesMessage(RuntimeError, 'GEMINI_API_KEY'):
+            llm.get_client()
+
+    def test_stub_is_deterministic(self):
+        client = llm.get_client()
+        self.assertEqual(client.generate('same prompt'), client.generate('same prompt'))
+        quiz = json.loads(client.generate('Please create a 3-question quiz about forces.'))
+        self.assertEqual(len(quiz['questions']), 3)
+
+    def test_meters_nest_and_follow_copied_contexts(self):
+        client = llm.get_client()
+        with metered() as outer:
+            client.generate('first')
+            with metered() as inner:
+                thread = threading.Thread(target=contextvars.copy_context().run, args=(client.generate, 'second'))
+                thread.start()
+                thread.join()
+        self.assertEqual((inner.calls, outer.calls), (1, 2))
+        self.assertEqual(outer.prompt_tokens, inner.prompt_tokens + client._tokens('first'))
+
+    def test_streams_are_metered(self):
+        client = llm.get_client()
+
+        async def consume():
+            return ''.join([text async for text in client.stream('stream me')])
+
+        with metered() as usage:
+            text = asyncio.run(consume())
+        self.assertEqual(text, client.generate('stream me'))
+        self.assertEqual((usage.calls, usage.completion_tokens), (1, client._tokens(text)))
+
+
+class SummaryCacheTests(AIServicesTestCase):
+    def post(self, file_obj):
+        return self.client.post(reverse('generate-summary'), {'file_id': file_obj.id}, format='json')
+
+    def test_repeat_request_is_served_from_the_cache(self):
+        first = self.post(self.file)
+        self.assertFalse(first.data['cached'])
+        with metered() as usage:
+            second = self.post(self.file)
+        self.assertEqual(usage.calls, 0)
+        self.assertTrue(second.data['cached'])
+        self.assertEqual(second.data['summary'], first.data['summary'])
+
+    def test_identical_upload_shares_the_summary(self):
+        first = self.post(self.file)
+        copy = UploadedFile.objects.create(user=self.user, title='Forces', subject='Physics', grade='Grade11',
+                                           file_name='copy.txt', file_url='http://example.com/copy.txt')
+        DocumentChunk.objects.create(file=copy, index=0, page=1, text='Notes about Forces.')
+        response = self.post(copy)
+        self.assertTrue(response.data['cached'])
+        self.assertEqual(response.data['summary'], first.data['summary'])
+
+    def test_different_title_is_a_miss(self):
+        self.post(self.file)
+        self.file.title = 'Newton'
+        self.file.save()
+        self.assertFalse(self.post(self.file).data['cached'])
+
+    def test_key_covers_every_prompt_input(self):
+        base = make_cache_key('summary', 'gemini-pro', 1, 'text', 'Forces', 'Physics', 'Grade11')
+        for changed in (make_cache_key('quiz', 'gemini-pro', 1, 'text', 'Forces', 'Physics', 'Grade11'),
+                        make_cache_key('summary', 'gemini-flash', 1, 'text', 'Forces', 'Physics', 'Grade11'),
+                        make_cache_key('summary', 'gemini-pro', 2, 'text', 'Forces', 'Physics', 'Grade11'),
+                        make_cache_key('summary', 'gemini-pro', 1, 'text', 'Forces', 'Physics', 'Grade12')):
+            self.assertNotEqual(changed, base)
+
+    def test_lookup_falls_back_to_stored_summaries(self):
+        Summary.objects.create(user=self.user, file=self.file, content='Stored', cache_key='k' * 64)
+        result_cache.clear()
+        self.assertEqual(get_cached_summary('k' * 64), 'Stored')
+
+
+class StreamSummaryViewTests(AIServicesTestCase):
+    def stream(self):
+        response = self.client.post(reverse('stream-summary'), {'file_id': self.file.id}, format='json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for frame in b''.join(response).decode().strip().split('\n\n'):
+            event, data = frame.split('\n', 1)
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+
+    def test_tokens_are_streamed_before_the_saved_summary(self):
+        events = self.stream()
+        self.assertEqual(events[-1][0], 'done')
+        self.assertFalse(events[-1][1]['cached'])
+        summary = Summary.objects.get(id=events[-1][1]['summary_id'])
+        self.assertEqual(''.join(data for event, data in events[:-1]), summary.content)
+        self.assertEqual({event for event, _ in events[:-1]}, {'token'})
+
+    def test_cached_summary_is_sent_whole(self):
+        first = self.stream()
+        events = self.stream()
+        self.assertEqual([event for event, _ in events], ['token', 'done'])
+        self.assertTrue(events[-1][1]['cached'])
+        self.assertEqual(events[0][1], Summary.objects.get(id=first[-1][1]['summary_id']).content)
+
+    def test_model_failure_is_sent_as_an_error_event(self):
+        with mock.patch.object(llm.get_client(), 'stream', side_effect=RuntimeError('model down')):
+            events = self.stream()
+        self.assertEqual(events[-1][0], 'error')
+        self.assertIn('model down', events[-1][1]['error'])
+
+    def test_missing_file_is_a_404(self):
+        response = self.client.post(reverse('stream-summary'), {'file_id': 999999}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class MapReduceTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(1, 4):
+            DocumentChunk.objects.create(file=self.file, index=number, page=number, text=f'Page {number} ' * 50)
+        # Chunk summaries are written from the pool threads; run them on the test's connection instead
+        for patcher in (mock.patch.object(generation, '_run_bounded', lambda func, items: [func(i) for i in items]),
+                        mock.patch.object(generation, 'close_old_connections')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def chunks(self):
+        return list(DocumentChunk.objects.filter(file=self.file).order_by('index'))
+
+    def test_chunk_summaries_are_stored_and_reused(self):
+        with metered() as usage:
+            first = condense_chunks(self.file, self.chunks())
+        self.assertEqual(usage.calls, 4)
+        self.assertFalse(DocumentChunk.objects.filter(file=self.file, summary='').exists())
+
+        with metered() as usage:
+            self.assertEqual(condense_chunks(self.file, self.chunks()), first)
+        self.assertEqual(usage.calls, 0)
+
+    def test_changed_chunk_is_summarized_again(self):
+        condense_chunks(self.file, self.chunks())
+        DocumentChunk.objects.filter(file=self.file, index=2).update(text='Rewritten page')
+        with metered() as usage:
+            condense_chunks(self.file, self.chunks())
+        self.assertEqual(usage.calls, 1)
+
+    def test_partials_over_the_limit_are_merged(self):
+        with self.settings(AI_MAX_CONTENT_CHARS=200), metered() as usage:
+            content = condense_chunks(self.file, self.chunks())
+        self.assertGreater(usage.calls, 4)
+        self.assertLessEqual(len(content), 200)
+
+
+class BoundedRunTests(TestCase):
+    @override_settings(AI_MAP_REDUCE={'CONCURRENCY': 2})
+    def test_concurrency_is_bounded(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work(item):
+            with lock:
+                active.append(item)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(item)
+            return item * 2
+
+        self.assertEqual(generation._run_bounded(work, range(6)), [0, 2, 4, 6, 8, 10])
+        self.assertLessEqual(max(peak), 2)
+
+    def test_every_item_runs_before_the_first_failure_is_raised(self):
+        done = []
+
+        def work(item):
+            if item == 1:
+                raise ValueError('chunk 1 failed')
+            done.append(item)
+
+        with self.assertRaisesMessage(ValueError, 'chunk 1 failed'):
+            generation._run_bounded(work, range(4))
+        self.assertEqual(sorted(done), [0, 2, 3])
+
+
+class RequestLogBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student')
+        # The flusher thread is exercised on its own below; here the test thread does the writes
+        patcher = mock.patch.object(request_log.RequestLogBuffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def row(self, n=0):
+        return request_log.AIRequest(user=self.user, request_type='summary', content=str(n), response='',
+                                     created_at=timezone.now())
+
+    def test_log_request_truncates_and_records_usage(self):
+        usage = llm.Usage()
+        usage.add(10, 20, 150.4)
+        buffer = request_log.RequestLogBuffer()
+        with mock.patch.object(request_log, 'buffer', buffer):
+            request_log.log_request(self.user, 'quiz', 'x' * 1000, 'y', usage=usage, model_name='gemini-pro')
+            request_log.log_request(None, 'quiz', 'z', 'y', cache_hit=True)
+        buffer.flush()
+        metered_row, cached_row = request_log.AIRequest.objects.order_by('id')
+        self.assertEqual(len(metered_row.content), request_log.TRUNCATE_CHARS)
+        self.assertEqual((metered_row.prompt_tokens, metered_row.completion_tokens, metered_row.latency_ms),
+                         (10, 20, 150))
+        self.assertIsNone(cached_row.user)
+        self.assertIsNone(cached_row.prompt_tokens)
+
+    @override_settings(AI_REQUEST_LOG={'BATCH_SIZE': 2, 'MAX_QUEUE': 3})
+    def test_full_queue_is_written_by_the_caller(self):
+        buffer = request_log.RequestLogBuffer()
+        for n in range(3):
+            buffer.add(self.row(n))
+        self.assertEqual(request_log.AIRequest.objects.count(), 0)
+        with self.assertNumQueries(2):  # Two batches of BATCH_SIZE
+            buffer.add(self.row(3))
+        self.assertEqual(request_log.AIRequest.objects.count(), 4)
+
+    def test_failed_write_is_logged_not_raised(self):
+        buffer = request_log.RequestLogBuffer()
+        buffer.add(self.row())
+        with mock.patch.object(request_log.AIRequest.objects, 'bulk_create', side_effect=RuntimeError), \
+                self.assertLogs('ai_services.request_log', 'ERROR'):
+            buffer.flush()
+
+    @override_settings(AI_REQUEST_LOG={'BATCH_SIZE': 3, 'FLUSH_SECONDS': 0.2})
+    def test_flusher_thread_batches_rows(self):
+        buffer = request_log.RequestLogBuffer()
+        written = []
+        done = threading.Event()
+
+        def write(rows):
+            written.append(len(rows))
+            if sum(written) == 4:
+                done.set()
+
+        with mock.patch.object(buffer, '_write', write), \
+                mock.patch.object(request_log, 'close_old_connections'):
+            for n in range(4):
+                buffer.add(self.row(n))
+            threading.Thread(target=buffer._run, daemon=True).start()
+            self.assertTrue(done.wait(10))
+        # A full batch goes at once; the remainder waits out FLUSH_SECONDS
+        self.assertEqual(written, [3, 1])
+
+
+class GenerateQuizViewTests(AIServicesTestCase):
+    def post(self, num_questions):
+        return self.client.post(reverse('generate-quiz'), {'file_id': self.file.id, 'num_questions': num_questions},
+                                format='json')
+
+    def test_non_integer_num_questions_is_rejected(self):
+        for value in ('abc', '2.5', [3], {'n': 3}):
+            with self.subTest(value=value):
+                response = self.post(value)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], 'num_questions must be an integer')
+        self.assertFalse(Quiz.objects.exists())
+
+    def test_num_questions_is_clamped(self):
+        response = self.post(-2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['quiz']['questions']), 1)
+
+        response = self.post(10 ** 9)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['quiz']['questions']), MAX_QUESTIONS)
+
+    def test_async_request_stores_the_clamped_value(self):
+        with self.queue_only():
+            response = self.client.post(reverse('generate-quiz'),
+                                        {'file_id': self.file.id, 'num_questions': '500', 'async': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(GenerationJob.objects.get().params['num_questions'], MAX_QUESTIONS)
+
+    def test_generate_quiz_rejects_out_of_range_values(self):
+        for value in (0, MAX_QUESTIONS + 1, '5'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                generate_quiz(self.user, self.file, value)
+
+
+class CatalogQuizViewTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = CommonBook.objects.create(title='Mechanics', subject='Physics', grade='Grade11',
+                                              file_url='http://example.com/Mechanics.pdf')
+        DocumentChunk.objects.create(book=self.book, index=0, page=1, text='Notes about mechanics.')
+        fill_bank(self.book, 5)
+
+    def get(self):
+        return self.client.get(reverse('catalog-quiz', args=[self.book.id]), {'num_questions': 3})
+
+    def test_quiz_is_sampled_from_the_bank(self):
+        with metered() as usage:
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['quiz']['questions']), 3)
+        self.assertEqual(usage.calls, 0)
+
+    def test_questions_of_an_edited_book_are_not_served(self):
+        self.book.title = 'Classical mechanics'
+        self.book.save()
+        self.assertEqual(self.get().status_code, 404)
+
+        fill_bank(self.book, 5)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_questions_of_replaced_text_are_not_served(self):
+        DocumentChunk.objects.filter(book=self.book).update(text='Rewritten notes.')
+        self.assertEqual(self.get().status_code, 404)
+
+
+class CatalogSummaryViewTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = CommonBook.objects.create(title='Mechanics', subject='Physics', grade='Grade11',
+                                              file_url='http://example.com/Mechanics.pdf')
+        DocumentChunk.objects.create(book=self.book, index=0, page=1, text='Notes about mechanics.')
+
+    def get(self):
+        return self.client.get(reverse('catalog-summary', args=[self.book.id]))
+
+    def test_precomputed_summary_is_read_without_a_model_call(self):
+        self.assertEqual(self.get().status_code, 404)
+        book_summary, _ = generate_book_summary(self.book)
+        with metered() as usage, self.assertNumQueries(1):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary'], book_summary.content)
+        self.assertEqual(usage.calls, 0)
+
+    def test_inactive_book_is_not_served(self):
+        generate_book_summary(self.book)
+        CommonBook.objects.filter(id=self.book.id).update(is_active=False)
+        self.assertEqual(self.get().status_code, 404)
+
+
+class CatalogPrecomputeLoggingTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = CommonBook.objects.create(title='Mechanics', subject='Physics', grade='Grade11',
+                                              file_url='http://example.com/Mechanics.pdf')
+        DocumentChunk.objects.create(book=self.book, index=0, page=1, text='Notes about mechanics.')
+
+    def logged_rows(self):
+        return [call.args[0] for call in self.logged.call_args_list]
+
+    def test_book_summary_is_logged_without_a_user(self):
+        generate_book_summary(self.book)
+        [row] = self.logged_rows()
+        self.assertEqual((row.user, row.request_type, row.cache_hit), (None, 'summary', False))
+        self.assertGreater(row.prompt_tokens, 0)
+
+        # Kept while the text is unchanged, so no call and nothing to log
+        generate_book_summary(self.book)
+        self.assertEqual(len(self.logged_rows()), 1)
+
+    def test_question_bank_batches_are_logged_without_a_user(self):
+        fill_bank(self.book, 15)
+        rows = self.logged_rows()
+        self.assertEqual(len(rows), 2)
+        for row in rows:
+            self.assertEqual((row.user, row.request_type), (None, 'quiz'))
+            self.assertGreater(row.completion_tokens, 0)
+
+
+class QuestionBankSaturationTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        top_up(self.file, None)
+        self.key = source_key(self.file, question_bank.get_file_content(self.file))
+        self.bank = list(BankQuestion.objects.filter(file=self.file).values_list('question', flat=True))
+
+    def repeat_bank(self):
+        # The model only comes up with questions the bank already holds
+        response = json.dumps({'questions': self.bank})
+        return mock.patch.object(question_bank, '_generate', return_value=response)
+
+    def test_top_up_without_new_questions_saturates_the_bank(self):
+        self.assertFalse(is_saturated(self.file, self.key))
+        with self.repeat_bank():
+            self.assertEqual(top_up(self.file, None), len(self.bank))
+        self.assertTrue(is_saturated(self.file, self.key))
+
+    def test_empty_answer_for_an_empty_bank_does_not_saturate(self):
+        other = self.make_file('Energy')
+        with mock.patch.object(question_bank, '_generate', return_value='not json'):
+            top_up(other, None)
+        key = source_key(other, question_bank.get_file_content(other))
+        self.assertFalse(is_saturated(other, key))
+
+    def test_saturated_bank_is_served_without_top_ups(self):
+        with self.repeat_bank():
+            top_up(self.file, None)
+        with override_settings(AI_QUESTION_BANK={**QUESTION_BANK, 'LOW_WATER': 100}), \
+                mock.patch.object(question_bank, '_generate') as generate, \
+                mock.patch.object(question_bank, 'schedule_top_up') as schedule:
+            quiz, cached = generate_quiz(self.user, self.file, len(self.bank) + 5)
+        generate.assert_not_called()
+        schedule.assert_not_called()
+        self.assertTrue(cached)
+        self.assertEqual(len(quiz.questions['questions']), len(self.bank))
+
+    def test_changed_source_is_topped_up_again(self):
+        with self.repeat_bank():
+            top_up(self.file, None)
+        DocumentChunk.objects.filter(file=self.file).update(text='Rewritten notes.')
+        quiz, cached = generate_quiz(self.user, self.file, 3)
+        self.assertFalse(cached)
+
+
+class SingleFlightLeaseTests(AIServicesTestCase):
+    key = 'summary:test'
+
+    def setUp(self):
+        super().setUp()
+        self.digest = hashlib.sha256(self.key.encode('utf-8')).hexdigest()
+
+    def lease_row(self, seconds):
+        return GenerationLease.objects.create(key=self.digest, owner='elsewhere',
+                                              expires_at=timezone.now() + timedelta(seconds=seconds))
+
+    def test_expired_lease_is_taken_over(self):
+        self.lease_row(-1)
+        lease, value = singleflight.acquire(self.key, lambda: None)
+        self.addCleanup(singleflight.release, lease)
+        self.assertIsNone(value)
+        self.assertEqual(GenerationLease.objects.get().owner, lease.owner)
+
+    def test_live_lease_is_not_taken(self):
+        self.lease_row(60)
+        self.assertFalse(singleflight._take(singleflight.Lease(self.digest)))
+
+    def test_held_lease_is_renewed_until_released(self):
+        lease, _ = singleflight.acquire(self.key, lambda: None)
+        GenerationLease.objects.update(expires_at=timezone.now() + timedelta(seconds=1))
+        singleflight._renew()
+        self.assertGreater(GenerationLease.objects.get().expires_at, timezone.now() + timedelta(seconds=60))
+
+        singleflight.release(lease)
+        self.assertFalse(GenerationLease.objects.exists())
+        self.assertNotIn(lease.owner, singleflight._held)
+
+    def test_leases_taken_over_are_not_renewed(self):
+        lease, _ = singleflight.acquire(self.key, lambda: None)
+        self.addCleanup(singleflight.release, lease)
+        expires_at = timezone.now() + timedelta(seconds=1)
+        GenerationLease.objects.update(owner='elsewhere', expires_at=expires_at)
+        singleflight._renew()
+        self.assertEqual(GenerationLease.objects.get().expires_at, expires_at)
+
+
+class VectorIndexTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        settings_override = override_settings(AI_VECTOR_INDEX={'DIR': index_dir.name, 'DIMENSIONS': 64})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        vector_index._indexes.clear()
+        self.addCleanup(vector_index._indexes.clear)
+
+    def index(self, file_obj):
+        vector_index.index_chunks(list(DocumentChunk.objects.filter(file=file_obj).select_related('file')))
+
+    def indexed_ids(self):
+        index = vector_index.get_index(vector_index.user_partition(self.user.id))
+        return sorted(int(chunk_id) for chunk_id in index._map()[2])
+
+    def test_search_finds_the_closest_chunk(self):
+        other = self.make_file('Energy', text='Kinetic energy grows with the square of speed.')
+        self.index(self.file)
+        self.index(other)
+        hits = vector_index.search([vector_index.user_partition(self.user.id)], 'kinetic energy and speed', 1)
+        self.assertEqual(hits[0][0], DocumentChunk.objects.get(file=other).id)
+
+    def test_reextraction_retires_the_old_vectors(self):
+        other = self.make_file('Energy')
+        self.index(self.file)
+        self.index(other)
+        self.assertEqual(len(self.indexed_ids()), 2)
+        DocumentChunk.objects.filter(file=self.file).delete()
+        DocumentChunk.objects.create(file=self.file, index=0, page=1, text='Rewritten notes about forces.')
+        self.index(self.file)
+
+        self.assertEqual(vector_index.retire_stale(UploadedFile, self.file.id), 1)
+        live = sorted(DocumentChunk.objects.filter(file__user=self.user).values_list('id', flat=True))
+        self.assertEqual(self.indexed_ids(), live)
+        self.assertEqual(vector_index.retire_stale(UploadedFile, self.file.id), 0)
+
+
+@override_settings(AI_QUOTA={'CAPACITY': 10000, 'REFILL_PER_MINUTE': 1})
+class AIQuotaTests(AIServicesTestCase):
+    def tokens(self):
+        return AIQuota.objects.get(user=self.user).tokens
+
+    def test_request_over_the_remaining_quota_gets_429(self):
+        url = reverse('generate-summary')
+        self.assertEqual(self.client.post(url, {'file_id': self.file.id}, format='json').status_code, 200)
+
+        # Leave less than the next estimate in the bucket
+        AIQuota.objects.filter(user=self.user).update(tokens=1)
+        response = self.client.post(url, {'file_id': self.file.id}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_cache_hit_is_refunded(self):
+        url = reverse('generate-summary')
+        self.client.post(url, {'file_id': self.file.id}, format='json')
+        before = self.tokens()
+
+        response = self.client.post(url, {'file_id': self.file.id}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.data['cached'])
+        self.assertAlmostEqual(self.tokens(), before, delta=1)
+
+    def test_settle_replaces_the_estimate(self):
+        self.assertEqual(quota.take(self.user.id, 600), 0)
+        self.assertAlmostEqual(self.tokens(), 9400, delta=1)
+
+        quota.settle(self.user.id, 600, 100)
+        self.assertAlmostEqual(self.tokens(), 9900, delta=1)
+
+        # Refunds never raise the bucket above its capacity
+        quota.settle(self.user.id, 600, 0)
+        self.assertAlmostEqual(self.tokens(), 10000, delta=1)
+
+    def test_take_reports_the_wait(self):
+        quota.take(self.user.id, 10000)
+        self.assertGreater(quota.take(self.user.id, 500), 0)
+
+    def test_bucket_without_refill_rejects_without_a_retry_time(self):
+        with override_settings(AI_QUOTA={'CAPACITY': 10000, 'REFILL_PER_MINUTE': 0}):
+            quota.take(self.user.id, 10000)
+            self.assertIsNone(quota.take(self.user.id, 500))
+
+            response = self.client.post(reverse('generate-summary'), {'file_id': self.file.id}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.has_header('Retry-After'))
+
+    def test_async_job_settles_when_it_finishes(self):
+        with self.queue_only():
+            response = self.client.post(reverse('generate-quiz'), {'file_id': self.file.id, 'async': True},
+                                        format='json')
+        job = GenerationJob.objects.get(id=response.data['job_id'])
+        self.assertAlmostEqual(self.tokens(), 10000 - job.params['quota_charge'], delta=1)
+
+        with metered() as usage:
+            jobs._run_quiz(job)
+        self.assertGreater(usage.calls, 0)
+        self.assertAlmostEqual(self.tokens(), 10000 - usage.prompt_tokens - usage.completion_tokens, delta=1)
+
+    def test_stream_settles_once_consumed(self):
+        response = self.client.post(reverse('stream-summary'), {'file_id': self.file.id}, format='json')
+        with metered() as usage:
+            body = b''.join(response)
+        self.assertIn(b'event: done', body)
+        self.assertGreater(usage.calls, 0)
+        self.assertAlmostEqual(self.tokens(), 10000 - usage.prompt_tokens - usage.completion_tokens, delta=1)
+
+
+class ListingPaginationTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.summary_ids = [
+            Summary.objects.create(user=self.user, file=self.file, content=f'Summary {number}').id
+            for number in range(5)
+        ]
+
+    def test_pages_cover_every_summary_newest_first(self):
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('user-summaries'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [row['id'] for row in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        self.assertIsNone(cursor)
+        self.assertEqual(seen, list(reversed(self.summary_ids)))
+
+    def test_rows_carry_file_fields(self):
+        response = self.client.get(reverse('user-summaries'), {'limit': 1})
+        row = response.data['results'][0]
+        self.assertEqual((row['file_title'], row['subject'], row['grade']), ('Forces', 'Physics', 'Grade11'))
+        self.assertEqual(row['content'], 'Summary 4')
+
+    def test_bad_cursor_is_rejected(self):
+        for endpoint in ('user-summaries', 'user-quizzes'):
+            with self.subTest(endpoint=endpoint):
+                response = self.client.get(reverse(endpoint), {'cursor': 'not-a-cursor'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+    def test_other_users_rows_are_not_listed(self):
+        other = User.objects.create_user(username='other', password='secret')
+        Summary.objects.create(user=other, file=self.file, content='Not yours')
+        response = self.client.get(reverse('user-summaries'), {'limit': 100})
+        self.assertEqual(len(response.data['results']), len(self.summary_ids))
+
+    def test_preview_returns_the_start_of_each_summary(self):
+        Summary.objects.create(user=self.user, file=self.file, content='x' * 1000)
+        response = self.client.get(reverse('user-summaries'), {'limit': 1, 'preview': 1})
+        row = response.data['results'][0]
+        self.assertNotIn('content', row)
+        self.assertEqual(row['preview'], 'x' * 300)
+
+    def test_quiz_preview_returns_the_question_count(self):
+        questions = {'questions': [{'question': 'a'}, {'question': 'b'}]}
+        Quiz.objects.create(user=self.user, file=self.file, questions=questions)
+        row = self.client.get(reverse('user-quizzes'), {'preview': 1}).data['results'][0]
+        self.assertNotIn('questions', row)
+        self.assertEqual(row['question_count'], 2)
+
+    def test_opened_items_return_the_full_body(self):
+        summary = Summary.objects.create(user=self.user, file=self.file, content='x' * 1000)
+        response = self.client.get(reverse('user-summary', args=[summary.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['content'], response.data['file_title']), ('x' * 1000, 'Forces'))
+
+        quiz = Quiz.objects.create(user=self.user, file=self.file, questions={'questions': [{'question': 'a'}]})
+        response = self.client.get(reverse('user-quiz', args=[quiz.id]))
+        self.assertEqual(response.data['questions'], {'questions': [{'question': 'a'}]})
+
+    def test_other_users_items_cannot_be_opened(self):
+        other = User.objects.create_user(username='other', password='secret')
+        summary = Summary.objects.create(user=other, file=self.file, content='Not yours')
+        self.assertEqual(self.client.get(reverse('user-summary', args=[summary.id])).status_code, 404)
+
+
+class RunJobTests(AIServicesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        jobs.register('test-echo')(lambda job: self.calls.append(job.id) or {'echo': job.params})
+        self.addCleanup(jobs._handlers.pop, 'test-echo')
+        self.addCleanup(jobs._claim_errors.clear)
+        # run_job releases its connection for pool threads; the test's transaction must stay open
+        patcher = mock.patch.object(jobs, 'close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_job(self, **fields):
+        return GenerationJob.objects.create(user=self.user, job_type='test-echo', params={'n': 1}, **fields)
+
+    def test_job_runs_once(self):
+        job = self.make_job()
+        jobs.run_job(job.id)
+        jobs.run_job(job.id)  # Lost the claim race
+
+        job.refresh_from_db()
+        self.assertEqual(self.calls, [job.id])
+        self.assertEqual((job.status, job.attempts, job.result), (GenerationJob.STATUS_DONE, 1, {'echo': {'n': 1}}))
+
+    def test_job_claimed_elsewhere_is_left_alone(self):
+        job = self.make_job(status=GenerationJob.STATUS_RUNNING, attempts=1)
+        jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(self.calls, [])
+        self.assertEqual((job.status, job.attempts), (GenerationJob.STATUS_RUNNING, 1))
+
+    @override_settings(AI_JOBS={'MAX_ATTEMPTS': 2})
+    def test_claim_error_leaves_the_job_pending_until_max_attempts(self):
+        job = self.make_job()
+        with mock.patch.object(GenerationJob.objects, 'select_related', side_effect=RuntimeError('database gone')), \
+                self.assertLogs('ai_services.jobs', 'ERROR'):
+            jobs.run_job(job.id)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error), (GenerationJob.STATUS_PENDING, ''))
+
+            jobs.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(self.calls, [])
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertIn('database gone', job.error)
+        self.assertNotIn(job.id, jobs._claim_errors)
+
+    def test_job_claimed_after_an_error_runs(self):
+        job = self.make_job()
+        with mock.patch.object(GenerationJob.objects, 'select_related', side_effect=RuntimeError('database gone')), \
+                self.assertLogs('ai_services.jobs', 'ERROR'):
+            jobs.run_job(job.id)
+        jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, self.calls), (GenerationJob.STATUS_DONE, [job.id]))
+        self.assertNotIn(job.id, jobs._claim_errors)
+
+
+class QueryPlanBenchmarkTests(TestCase):
+    INDEXES = {
+        'user_files': 'uploadedfile_user_uploaded',
+        'user_summaries': 'summary_user_created',
+        'user_quizzes': 'quiz_user_created',
+        'common_books': 'commonbook_active_subj_grade',
+        'user_ai_requests': 'airequest_user_created',
+    }
+
+    # PostgreSQL may rightly prefer a sequential scan over a seed this small
+    @skipUnless(connection.vendor == 'sqlite', 'query plans of a tiny seed are only stable on SQLite')
+    def test_listing_queries_use_their_indexes_and_seed_data_is_rolled_back(self):
+        out = StringIO()
+        call_command('benchmark_queries', users=3, files_per_user=2, summaries_per_user=5, quizzes_per_user=5,
+                     requests_per_user=5, books=20, repeat=2, json=True, stdout=out, stderr=StringIO())
+        queries = json.loads(out.getvalue())['queries']
+        self.assertEqual(set(queries), set(self.INDEXES))
+        for name, result in queries.items():
+            with self.subTest(query=name):
+                self.assertTrue(result['uses_index'])
+                self.assertIn(self.INDEXES[name], result['plan'])
+                self.assertNotIn('TEMP B-TREE', result['plan'])  # Rows come out of the index already sorted
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(CommonBook.objects.exists())
+
+
+@override_settings(AI_BATCH={'MAX_FILES': 2})
+class BatchGenerateViewTests(AIServicesTestCase):
+    def post(self, data):
+        with self.queue_only():
+            return self.client.post(reverse('batch-generate'), data, format='json')
+
+    def test_more_than_max_files_is_rejected(self):
+        files = [self.file, self.make_file('Energy'), self.make_file('Waves')]
+        response = self.post({'kind': 'summary', 'file_ids': [file_obj.id for file_obj in files]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'A batch can cover at most 2 files')
+
+        response = self.post({'kind': 'summary', 'subject': 'Physics'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_batch_within_the_limit_is_queued(self):
+        second = self.make_file('Energy')
+        response = self.post({'kind': 'quiz', 'file_ids': [self.file.id, second.id], 'num_questions': 99})
+        self.assertEqual(response.status_code, 202)
+
+        job = GenerationJob.objects.get()
+        self.assertEqual(job.params['file_ids'], [self.file.id, second.id])
+        self.assertEqual(job.params['num_questions'], MAX_QUESTIONS)
+        self.assertIsNotNone(job.params['quota_charge'])
+
+    def test_invalid_kind_is_rejected(self):
+        response = self.post({'kind': 'essay', 'file_ids': [self.file.id]})
+        self.assertEqual(response.status_code, 400)
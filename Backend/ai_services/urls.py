@@ -1,9 +1,18 @@
 from django.urls import path
 from .views import (
     GenerateSummaryView, 
+    StreamSummaryView,
     GenerateQuizView, 
+    BatchGenerateView,
+    CatalogSummaryView,
+    CatalogQuizView,
     GetUserSummariesView, 
+    GetUserSummaryView,
     GetUserQuizzesView,
+    GetUserQuizView,
+    GenerationJobStatusView,
+    AskView,
+    AIUsageView,
     SupabaseSignupView,
     SupabaseLoginView,
 )
@@ -12,7 +21,16 @@ urlpatterns = [
     path('signup/', SupabaseSignupView.as_view(), name='supabase-signup'),
     path('login/', SupabaseLoginView.as_view(), name='supabase-login'),
     path('summary/generate/', GenerateSummaryView.as_view(), name='generate-summary'),
+    path('summary/stream/', StreamSummaryView.as_view(), name='stream-summary'),
     path('quiz/generate/', GenerateQuizView.as_view(), name='generate-quiz'),
+    path('batch/generate/', BatchGenerateView.as_view(), name='batch-generate'),
+    path('catalog/<int:book_id>/summary/', CatalogSummaryView.as_view(), name='catalog-summary'),
+    path('catalog/<int:book_id>/quiz/', CatalogQuizView.as_view(), name='catalog-quiz'),
     path('summaries/', GetUserSummariesView.as_view(), name='user-summaries'),
+    path('summaries/<int:summary_id>/', GetUserSummaryView.as_view(), name='user-summary'),
     path('quizzes/', GetUserQuizzesView.as_view(), name='user-quizzes'),
+    path('quizzes/<int:quiz_id>/', GetUserQuizView.as_view(), name='user-quiz'),
+    path('ask/', AskView.as_view(), name='ask'),
+    path('usage/', AIUsageView.as_view(), name='ai-usage'),
+    path('jobs/<uuid:job_id>/', GenerationJobStatusView.as_view(), name='ai-job-status'),
 ]
@@ -0,0 +1,86 @@
+"""
+Aggregates over AIRequest rows for capacity planning.
+
+Counts and token totals are grouped in the database by user, day and model.
+Latency percentiles use ``percentile_cont`` on Postgres. Other databases fall
+back to computing them in Python from the raw latencies.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Aggregate, Count, FloatField, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+class PercentileCont(Aggregate):
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _percentile(values, fraction):
+    # Same linear interpolation as percentile_cont; ``values`` must be sorted
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def cost(model_name, prompt_tokens, completion_tokens):
+    prices = getattr(settings, 'AI_MODEL_PRICES', {}).get(model_name)
+    if not prices:
+        return 0.0
+    return ((prompt_tokens or 0) * prices.get('prompt', 0) + (completion_tokens or 0) * prices.get('completion', 0)) / 1000
+
+
+def _latency_percentiles(requests):
+    timed = requests.filter(latency_ms__isnull=False).annotate(day=TruncDate('created_at'))
+    if connection.vendor == 'postgresql':
+        rows = timed.values('user_id', 'day').annotate(
+            p50=PercentileCont('latency_ms', 0.5), p95=PercentileCont('latency_ms', 0.95)
+        )
+        return {(row['user_id'], row['day']): (row['p50'], row['p95']) for row in rows}
+
+    latencies = defaultdict(list)
+    for user_id, day, latency in timed.values_list('user_id', 'day', 'latency_ms').order_by('latency_ms'):
+        latencies[(user_id, day)].append(latency)
+    return {key: (_percentile(values, 0.5), _percentile(values, 0.95)) for key, values in latencies.items()}
+
+
+def usage_by_user_day(requests):
+    """Return one dict per (user, day) for the AIRequest queryset ``requests``, newest day first."""
+    grouped = requests.annotate(day=TruncDate('created_at')).values(
+        'user_id', 'user__username', 'day', 'model_name'
+    ).annotate(
+        requests=Count('id'),
+        cache_hits=Count('id', filter=Q(cache_hit=True)),
+        prompt_tokens=Sum('prompt_tokens'),
+        completion_tokens=Sum('completion_tokens'),
+    )
+
+    results = {}
+    for row in grouped:
+        key = (row['user_id'], row['day'])
+        entry = results.setdefault(key, {
+            'user_id': row['user_id'], 'username': row['user__username'], 'day': row['day'],
+            'requests': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0,
+        })
+        entry['requests'] += row['requests']
+        entry['cache_hits'] += row['cache_hits']
+        entry['prompt_tokens'] += row['prompt_tokens'] or 0
+        entry['completion_tokens'] += row['completion_tokens'] or 0
+        entry['cost'] += cost(row['model_name'], row['prompt_tokens'], row['completion_tokens'])
+
+    percentiles = _latency_percentiles(requests)
+    for key, entry in results.items():
+        p50, p95 = percentiles.get(key, (None, None))
+        entry['p50_latency_ms'] = round(p50, 1) if p50 is not None else None
+        entry['p95_latency_ms'] = round(p95, 1) if p95 is not None else None
+        entry['cost'] = round(entry['cost'], 6)
+    return sorted(results.values(), key=lambda entry: (entry['day'], entry['requests']), reverse=True)
@@ -0,0 +1,241 @@
+"""
+Local embedding index over DocumentChunk text.
+
+Each partition (one per user, one per CommonBook subject/grade) is a pair of
+files that new rows are appended to: ``vectors.f32`` holds L2-normalised float32 rows and
+``ids.i64`` the matching DocumentChunk ids. Searches memory-map the vectors
+and scan them in fixed-size blocks, so a query touches the page cache rather
+than loading the whole matrix into Python and stays fast on CPU-only hosts.
+
+A re-extraction replaces a document's chunks, so once they are indexed the
+partition is compacted: rows of chunks that no longer exist are dropped by
+rewriting both files and swapping them in under the writers' lock.
+"""
+import fcntl
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from notes.models import CommonBook, DocumentChunk
+from .llm import get_client
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = 100
+
+
+def _config():
+    config = getattr(settings, 'AI_VECTOR_INDEX', {})
+    return {
+        'DIR': config.get('DIR', os.path.join(settings.BASE_DIR, 'vector_index')),
+        'EMBEDDING_MODEL': config.get('EMBEDDING_MODEL', 'models/embedding-001'),
+        'DIMENSIONS': config.get('DIMENSIONS', 768),
+        'BLOCK_ROWS': config.get('BLOCK_ROWS', 65536),
+    }
+
+
+def user_partition(user_id):
+    return f'user-{user_id}'
+
+
+def book_partition(subject, grade):
+    return f'book-{subject}-{grade}'
+
+
+def embed_texts(texts, task_type='retrieval_document'):
+    """Return an ``(len(texts), DIMENSIONS)`` float32 array of embeddings."""
+    config = _config()
+    client = get_client()
+    rows = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        batch = texts[start:start + EMBED_BATCH_SIZE]
+        rows.extend(client.embed(batch, config['EMBEDDING_MODEL'], task_type, config['DIMENSIONS']))
+    return np.asarray(rows, dtype=np.float32).reshape(len(texts), -1)
+
+
+def _normalise(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    def __init__(self, partition):
+        config = _config()
+        self.dimensions = config['DIMENSIONS']
+        self.block_rows = config['BLOCK_ROWS']
+        self.path = os.path.join(config['DIR'], partition)
+        self.vectors_path = os.path.join(self.path, 'vectors.f32')
+        self.ids_path = os.path.join(self.path, 'ids.i64')
+        self._mapped = None  # (rows, ids file inode, vectors memmap, ids memmap)
+
+    def _locked(self, operation):
+        os.makedirs(self.path, exist_ok=True)
+        lock = open(os.path.join(self.path, 'lock'), 'w')
+        fcntl.flock(lock, operation)
+        return lock
+
+    def append(self, ids, vectors):
+        vectors = _normalise(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions))
+        ids = np.asarray(ids, dtype=np.int64)
+        # Serialise writers across processes; readers never see more ids than vectors
+        with self._locked(fcntl.LOCK_EX):
+            rows = self._rows()
+            with open(self.vectors_path, 'r+b' if os.path.exists(self.vectors_path) else 'wb') as fh:
+                fh.truncate(rows * self.dimensions * 4)  # Drop any torn write from a crashed writer
+                fh.seek(0, os.SEEK_END)
+                fh.write(vectors.tobytes())
+            with open(self.ids_path, 'r+b' if os.path.exists(self.ids_path) else 'wb') as fh:
+                fh.truncate(rows * 8)
+                fh.seek(0, os.SEEK_END)
+                fh.write(ids.tobytes())
+
+    def _rows(self):
+        try:
+            vector_rows = os.path.getsize(self.vectors_path) // (self.dimensions * 4)
+            id_rows = os.path.getsize(self.ids_path) // 8
+        except OSError:
+            return 0
+        return min(vector_rows, id_rows)
+
+    def compact(self, live_ids):
+        """Drop the rows whose chunk id is not in ``live_ids``; returns how many were dropped."""
+        if not os.path.exists(self.ids_path):
+            return 0
+        with self._locked(fcntl.LOCK_EX):
+            rows = self._rows()
+            ids = np.fromfile(self.ids_path, dtype=np.int64, count=rows)
+            keep = np.isin(ids, np.fromiter(live_ids, dtype=np.int64))
+            if keep.all():
+                return 0
+            vectors = np.fromfile(self.vectors_path, dtype=np.float32, count=rows * self.dimensions)
+            vectors = vectors.reshape(rows, self.dimensions)[keep]
+            # Written aside and renamed, so open memory maps keep reading the old files
+            vectors.tofile(self.vectors_path + '.new')
+            ids[keep].tofile(self.ids_path + '.new')
+            os.replace(self.vectors_path + '.new', self.vectors_path)
+            os.replace(self.ids_path + '.new', self.ids_path)
+        return int(rows - keep.sum())
+
+    def _map(self):
+        try:
+            inode = os.stat(self.ids_path).st_ino
+        except OSError:
+            return 0, None, None
+        if self._mapped is None or self._mapped[:2] != (self._rows(), inode):
+            # Shared lock: a compaction must not swap one file between mapping the two
+            with self._locked(fcntl.LOCK_SH):
+                rows = self._rows()
+                if rows == 0:
+                    return 0, None, None
+                vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimensions))
+                ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(rows,))
+                self._mapped = (rows, os.stat(self.ids_path).st_ino, vectors, ids)
+        return self._mapped[0], self._mapped[2], self._mapped[3]
+
+    def search(self, queries, k):
+        """Return, for each query row, a list of ``(chunk_id, score)`` sorted by cosine similarity."""
+        queries = _normalise(np.asarray(queries, dtype=np.float32).reshape(-1, self.dimensions))
+        rows, vectors, ids = self._map()
+        if rows == 0:
+            return [[] for _ in range(len(queries))]
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, rows, self.block_rows):
+            block = vectors[start:start + self.block_rows]
+            scores = queries @ block.T  # (queries, block rows)
+            take = min(k, scores.shape[1])
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results = []
+        for scores, row_numbers in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([(int(ids[row_numbers[i]]), float(scores[i])) for i in order])
+        return results
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(partition):
+    # Keep one instance per partition so the memory map is reused between queries
+    with _indexes_lock:
+        if partition not in _indexes:
+            _indexes[partition] = VectorIndex(partition)
+        return _indexes[partition]
+
+
+def _owner_partition(model, owner):
+    if model is CommonBook:
+        return book_partition(owner.subject, owner.grade), DocumentChunk.objects.filter(
+            book__subject=owner.subject, book__grade=owner.grade
+        )
+    return user_partition(owner.user_id), DocumentChunk.objects.filter(file__user_id=owner.user_id)
+
+
+def index_chunks(chunks):
+    """Embed ``chunks`` and append them to their partitions (user or catalog subject/grade)."""
+    by_partition = {}
+    for chunk in chunks:
+        if chunk.book_id:
+            partition = book_partition(chunk.book.subject, chunk.book.grade)
+        else:
+            partition = user_partition(chunk.file.user_id)
+        by_partition.setdefault(partition, []).append(chunk)
+
+    for partition, members in by_partition.items():
+        vectors = embed_texts([chunk.text for chunk in members])
+        get_index(partition).append([chunk.id for chunk in members], vectors)
+
+
+# Embedding is a network call, so new chunks are indexed off the extraction callback thread
+_indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vector-index')
+
+
+def retire_stale(model, owner_id):
+    """Compact the partition of ``owner_id``'s document down to the chunks that still exist."""
+    owner = model.objects.filter(id=owner_id).first()
+    if owner is None:
+        return 0
+    partition, chunks = _owner_partition(model, owner)
+    return get_index(partition).compact(chunks.values_list('id', flat=True).iterator())
+
+
+def _index_owner(model, owner_id):
+    try:
+        owner_field = 'book_id' if model is CommonBook else 'file_id'
+        chunks = DocumentChunk.objects.filter(**{owner_field: owner_id}).select_related('file', 'book')
+        index_chunks(list(chunks))
+        # The chunks of an earlier extraction were deleted, but their vectors are still in the partition
+        retire_stale(model, owner_id)
+    except Exception:
+        logger.exception('Indexing chunks of %s %s failed', model.__name__, owner_id)
+    finally:
+        close_old_connections()
+
+
+def on_chunks_extracted(sender, owner_id, **kwargs):
+    _indexer.submit(_index_owner, sender, owner_id)
+
+
+def search(partitions, question, k):
+    """Embed ``question`` and return the top ``k`` ``(chunk_id, score)`` pairs across ``partitions``."""
+    query = embed_texts([question], task_type='retrieval_query')
+    hits = []
+    for partition in partitions:
+        hits.extend(get_index(partition).search(query, k)[0])
+    hits.sort(key=lambda hit: hit[1], reverse=True)
+    return hits[:k]
@@ -0,0 +1,11 @@
+"""
+Offline end-to-end load benchmark.
+
+    python -m benchmarks.run --concurrency 16 --duration 20 --output bench.json
+    python -m benchmarks.run --baseline bench.json      # exit 1 on regressions
+
+Gemini is replaced by the ``stub`` LLM backend. Supabase storage and auth are
+replaced by a local HTTP stand-in (``benchmarks.standins``). Both have
+configurable latency and error injection. The app itself runs unmodified in
+a separate server process, using ``benchmarks.settings``.
+"""
@@ -0,0 +1,503 @@
+"""
+Drive every endpoint routed from ``core/urls.py`` and report throughput and latency.
+
+Each route has a scenario below. Runs use ``--concurrency`` client threads, one
+seeded user each. Each thread warms up, then sends requests back to back for
+``--duration`` seconds. Some scenarios need a request before the measured one,
+such as minting a refresh token to log out with. Those extra requests are not
+timed.
+
+The JSON report holds the following per route:
+- throughput;
+- p50/p95/p99 latency;
+- status counts;
+- the server-side phase breakdown, taken from the ``Server-Timing`` header
+  (core.metrics).
+
+It also records the commit, the run configuration and the routes that have no
+scenario yet. ``--baseline`` compares the run with an earlier report.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+
+from .standins import SupabaseStandIn
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PASSWORD = 'bench-Passw0rd!'
+SUBJECTS = ['Maths', 'Physics', 'Chemistry', 'Biology', 'English']
+GRADES = ['Grade9', 'Grade10', 'Grade11', 'Grade12']
+WORDS = ('energy force mass velocity atom molecule cell membrane enzyme reaction equation function '
+         'derivative integral vector matrix photosynthesis respiration gene protein acid base '
+         'electron circuit current voltage wave frequency grammar essay metaphor narrative').split()
+QUESTIONS = [
+    'What is the relationship between force and mass?',
+    'How does photosynthesis store energy?',
+    'Explain what an enzyme does in a reaction.',
+    'What is the derivative of a function?',
+    'How do waves carry energy?',
+]
+
+
+def document(number, chars):
+    rng = random.Random(number)
+    paragraphs = []
+    while sum(len(paragraph) for paragraph in paragraphs) < chars:
+        paragraphs.append(' '.join(rng.choice(WORDS) for _ in range(80)).capitalize() + '.')
+    return '\n\n'.join(paragraphs)[:chars]
+
+
+class Worker:
+    """One simulated student: an HTTP client plus the user and content seeded for it."""
+
+    def __init__(self, number, base_url, timeout):
+        self.number = number
+        self.client = httpx.Client(base_url=base_url, timeout=timeout)
+        self.email = f'bench-{number}@bench.local'
+        self.token = None
+        self.refresh = None
+        self.file_id = None
+        self.file_path = None
+        self.job_id = None
+        self.summary_id = None
+        self.quiz_id = None
+        self.book_ids = []
+        self.sent = 0  # Requests so far; scenarios rotate their inputs on it
+        self.sequence = 0
+
+    def next_id(self):
+        self.sequence += 1
+        return f'{self.number}-{self.sequence}'
+
+    def auth(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def call(self, method, url, **kwargs):
+        response = self.client.request(method, url, **kwargs)
+        if not response.is_success:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}: {response.text[:300]}')
+        return response.json()
+
+    def seed(self, document_chars, extraction_timeout=120):
+        data = self.call('POST', '/api/ai/signup/', json={'email': self.email, 'password': PASSWORD})
+        self.token = data['supabase_access_token']
+        upload = self.call('POST', '/api/notes/upload/', headers=self.auth(),
+                           data={'title': f'Notes {self.number}', 'subject': 'Physics', 'grade': 'Grade11'},
+                           files={'file': (f'notes-{self.number}.txt', document(self.number, document_chars),
+                                           'text/plain')})
+        self.file_id = upload['id']
+        self.file_path = urlparse(upload['file_url']).path
+
+        # Summaries, quizzes and answers need the extracted (and indexed) text
+        deadline = time.monotonic() + extraction_timeout
+        while True:
+            files = self.call('GET', '/api/notes/files/', headers=self.auth())
+            state = next(item['extraction_status'] for item in files if item['id'] == self.file_id)
+            if state != 'pending':
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'Extraction of file {self.file_id} did not finish')
+            time.sleep(0.2)
+
+        self.summary_id = self.call('POST', '/api/ai/summary/generate/', headers=self.auth(),
+                                    json={'file_id': self.file_id})['summary_id']
+        self.quiz_id = self.call('POST', '/api/ai/quiz/generate/', headers=self.auth(),
+                                 json={'file_id': self.file_id})['quiz_id']
+        job = self.call('POST', '/api/ai/summary/generate/', headers=self.auth(),
+                        json={'file_id': self.file_id, 'async': True})
+        self.job_id = job['job_id']
+        self.book_ids = [book['id'] for book in self.call('GET', '/api/notes/common-books/', headers=self.auth())]
+        self.refresh = self.call('POST', '/api/token/', json={'username': self.email, 'password': PASSWORD})['refresh']
+
+
+# Scenarios return (method, url, request kwargs[, callback for a successful response])
+
+def _keep_refresh(worker):
+    def callback(response):
+        worker.refresh = response.json().get('refresh', worker.refresh)
+    return callback
+
+
+def _logout(worker):
+    refresh = worker.call('POST', '/api/token/', json={'username': worker.email, 'password': PASSWORD})['refresh']
+    return 'POST', '/api/users/logout/', {'headers': worker.auth(), 'json': {'refresh': refresh}}
+
+
+def _book_id(worker):
+    return worker.book_ids[worker.sent % len(worker.book_ids)]
+
+
+def _text_file(worker):
+    name = f'upload-{worker.next_id()}.txt'
+    return name, document(worker.sequence, 4000), 'text/plain'
+
+
+SCENARIOS = {
+    'admin/': lambda worker: ('GET', '/admin/login/', {}),
+    'api/token/': lambda worker: ('POST', '/api/token/', {'json': {'username': worker.email, 'password': PASSWORD}}),
+    'api/token/refresh/': lambda worker: ('POST', '/api/token/refresh/', {'json': {'refresh': worker.refresh}},
+                                          _keep_refresh(worker)),
+    'api/users/register/': lambda worker: ('POST', '/api/users/register/', {'json': {
+        'username': f'register-{worker.next_id()}', 'email': '', 'password': PASSWORD}}),
+    'api/users/logout/': _logout,
+    'api/users/profile/': lambda worker: ('GET', '/api/users/profile/', {'headers': worker.auth()}),
+    'api/notes/upload/': lambda worker: ('POST', '/api/notes/upload/', {
+        'headers': worker.auth(), 'files': {'file': _text_file(worker)},
+        'data': {'title': 'Benchmark upload', 'subject': 'Biology', 'grade': 'Grade10'}}),
+    'api/notes/upload/batch/': lambda worker: ('POST', '/api/notes/upload/batch/', {
+        'headers': worker.auth(), 'files': [('files', _text_file(worker)) for _ in range(5)],
+        'data': {'subject': 'Chemistry', 'grade': 'Grade12'}}),
+    'api/notes/files/': lambda worker: ('GET', '/api/notes/files/', {'headers': worker.auth()}),
+    # Served by the app only with --storage local; Supabase serves its own files
+    'api/notes/storage/<str:bucket>/<path:path>': lambda worker: ('GET', worker.file_path, {}),
+    'api/notes/common-books/': lambda worker: ('GET', '/api/notes/common-books/', {
+        'headers': worker.auth(), 'params': {'subject': SUBJECTS[worker.sent % len(SUBJECTS)]}}),
+    'api/ai/signup/': lambda worker: ('POST', '/api/ai/signup/', {'json': {
+        'email': f'signup-{worker.next_id()}@bench.local', 'password': PASSWORD}}),
+    'api/ai/login/': lambda worker: ('POST', '/api/ai/login/', {'json': {'email': worker.email, 'password': PASSWORD}}),
+    'api/ai/summary/generate/': lambda worker: ('POST', '/api/ai/summary/generate/', {
+        'headers': worker.auth(), 'json': {'file_id': worker.file_id}}),
+    'api/ai/summary/stream/': lambda worker: ('POST', '/api/ai/summary/stream/', {
+        'headers': worker.auth(), 'json': {'file_id': worker.file_id}}),
+    # Cycling the length mixes cache misses (first time round) with hits
+    'api/ai/quiz/generate/': lambda worker: ('POST', '/api/ai/quiz/generate/', {
+        'headers': worker.auth(), 'json': {'file_id': worker.file_id, 'num_questions': 1 + worker.sent % 10}}),
+    'api/ai/batch/generate/': lambda worker: ('POST', '/api/ai/batch/generate/', {
+        'headers': worker.auth(), 'json': {'kind': 'summary', 'file_ids': [worker.file_id]}}),
+    # Seeded books are not precomputed, so these measure the lookup that answers 404
+    'api/ai/catalog/<int:book_id>/summary/': lambda worker: (
+        'GET', f'/api/ai/catalog/{_book_id(worker)}/summary/', {'headers': worker.auth()}),
+    'api/ai/catalog/<int:book_id>/quiz/': lambda worker: (
+        'GET', f'/api/ai/catalog/{_book_id(worker)}/quiz/', {'headers': worker.auth()}),
+    'api/ai/summaries/': lambda worker: ('GET', '/api/ai/summaries/', {'headers': worker.auth()}),
+    'api/ai/summaries/<int:summary_id>/': lambda worker: (
+        'GET', f'/api/ai/summaries/{worker.summary_id}/', {'headers': worker.auth()}),
+    'api/ai/quizzes/': lambda worker: ('GET', '/api/ai/quizzes/', {'headers': worker.auth()}),
+    'api/ai/quizzes/<int:quiz_id>/': lambda worker: (
+        'GET', f'/api/ai/quizzes/{worker.quiz_id}/', {'headers': worker.auth()}),
+    'api/ai/ask/': lambda worker: ('POST', '/api/ai/ask/', {
+        'headers': worker.auth(), 'json': {'question': QUESTIONS[worker.sent % len(QUESTIONS)]}}),
+    'api/ai/usage/': lambda worker: ('GET', '/api/ai/usage/', {'headers': worker.auth()}),
+    'api/ai/jobs/<uuid:job_id>/': lambda worker: ('GET', f'/api/ai/jobs/{worker.job_id}/', {'headers': worker.auth()}),
+    'api-auth/': lambda worker: ('GET', '/api-auth/login/', {}),
+    'metrics': lambda worker: ('GET', '/metrics', {
+        'headers': {'Authorization': f"Bearer {os.environ['METRICS_TOKEN']}"}}),
+}
+
+
+def routes():
+    """Every route in core/urls.py, with the project's own includes expanded."""
+    from django.urls import URLResolver, get_resolver
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern)
+            module_file = getattr(getattr(pattern, 'urlconf_module', None), '__file__', None)
+            if isinstance(pattern, URLResolver) and module_file and Path(module_file).resolve().is_relative_to(BASE_DIR):
+                yield from walk(pattern.url_patterns, route)
+            else:
+                yield route
+
+    return list(walk(get_resolver().url_patterns, ''))
+
+
+def _server_timing(header):
+    phases = {}
+    for entry in (header or '').split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                phases[name] = float(value)
+    return phases
+
+
+def _send(worker, scenario):
+    worker.sent += 1
+    try:
+        method, url, kwargs, *callback = scenario(worker)
+    except Exception as e:
+        return None, f'setup:{type(e).__name__}', {}
+    started = time.perf_counter()
+    try:
+        response = worker.client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        return (time.perf_counter() - started) * 1000, type(e).__name__, {}
+    latency = (time.perf_counter() - started) * 1000
+    if callback and response.is_success:
+        callback[0](response)
+    return latency, response.status_code, _server_timing(response.headers.get('Server-Timing'))
+
+
+def measure(workers, scenario, duration, warmup):
+    window = {}
+    barrier = threading.Barrier(len(workers), action=lambda: window.setdefault('start', time.monotonic()))
+    samples = [[] for _ in workers]
+
+    def loop(index, worker):
+        for _ in range(warmup):
+            _send(worker, scenario)
+        barrier.wait()
+        stop_at = window['start'] + duration
+        while time.monotonic() < stop_at:
+            samples[index].append(_send(worker, scenario))
+
+    threads = [threading.Thread(target=loop, args=(index, worker)) for index, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [sample for worker_samples in samples for sample in worker_samples], time.monotonic() - window['start']
+
+
+def summarize(samples, wall):
+    from ai_services.usage import _percentile
+
+    latencies = sorted(latency for latency, status, _ in samples if latency is not None)
+    statuses = Counter(str(status) for _, status, _ in samples)
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    phase_totals, timed = defaultdict(float), 0
+    for _, _, phases in samples:
+        if phases:
+            timed += 1
+            for phase, value in phases.items():
+                phase_totals[phase] += value
+
+    def ms(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'status_codes': dict(sorted(statuses.items())),
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(_percentile(latencies, 0.5)),
+            'p95': ms(_percentile(latencies, 0.95)),
+            'p99': ms(_percentile(latencies, 0.99)),
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+        # Mean per request, from the server's Server-Timing header
+        'server_phases_ms': {phase: ms(total / timed) for phase, total in sorted(phase_totals.items())},
+    }
+
+
+def compare(baseline, report, threshold):
+    """Print per-route changes against ``baseline``; return the routes that regressed."""
+    if baseline.get('config') != report['config']:
+        print('warning: baseline was run with a different configuration', file=sys.stderr)
+    regressions = []
+    for route, current in report['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous or not previous['latency_ms']['p95'] or not current['latency_ms']['p95']:
+            continue
+        p95_change = current['latency_ms']['p95'] / previous['latency_ms']['p95'] - 1
+        rps_change = current['throughput_rps'] / previous['throughput_rps'] - 1 if previous['throughput_rps'] else 0.0
+        regressed = p95_change > threshold or rps_change < -threshold
+        print(f"{'REGRESSED' if regressed else 'ok':9} {route:32} "
+              f"p95 {previous['latency_ms']['p95']:9.1f} -> {current['latency_ms']['p95']:9.1f} ms ({p95_change:+.0%})  "
+              f"rps {previous['throughput_rps']:8.1f} -> {current['throughput_rps']:8.1f} ({rps_change:+.0%})",
+              file=sys.stderr)
+        if regressed:
+            regressions.append(route)
+    return regressions
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _git(*command):
+    try:
+        return subprocess.run(['git', *command], cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(args, workdir, port):
+    if args.server == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'core.asgi:application', '--host', '127.0.0.1',
+                   '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning', '--no-access-log']
+    else:
+        command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+    log_path = workdir / 'server.log'
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(command, cwd=BASE_DIR, env=os.environ.copy(), stdout=log, stderr=subprocess.STDOUT)
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with {process.returncode}, see {log_path}')
+        try:
+            httpx.get(f'{url}/metrics', timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f'Server did not start within 60s, see {log_path}')
+            time.sleep(0.2)
+
+
+def prepare_database(books):
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connections
+    from notes.models import CommonBook
+
+    call_command('migrate', verbosity=0)
+    CommonBook.objects.bulk_create([
+        CommonBook(title=f'Catalog book {number}', subject=SUBJECTS[number % len(SUBJECTS)],
+                   grade=GRADES[number % len(GRADES)], file_url=f'https://books.bench.local/{number}.pdf',
+                   description='Seeded by the benchmark', extraction_status='done')
+        for number in range(books)
+    ])
+    connections.close_all()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads (one seeded user each)')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds per route')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per thread before measuring')
+    parser.add_argument('--only', nargs='*', default=[], help='Only routes containing one of these strings')
+    parser.add_argument('--server', choices=['uvicorn', 'runserver'], default='uvicorn')
+    parser.add_argument('--workers', type=int, default=2, help='uvicorn worker processes')
+    parser.add_argument('--database', choices=['sqlite', 'postgres'], default='sqlite',
+                        help='postgres migrates and writes to the POSTGRES_* database; use a scratch one')
+    parser.add_argument('--storage', choices=['standin', 'local'], default='standin',
+                        help='Supabase storage stand-in, or the local filesystem backend')
+    parser.add_argument('--llm-latency-ms', type=int, default=300)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--storage-latency-ms', type=int, default=40)
+    parser.add_argument('--storage-error-rate', type=float, default=0.0)
+    parser.add_argument('--auth-latency-ms', type=int, default=60)
+    parser.add_argument('--auth-error-rate', type=float, default=0.0)
+    parser.add_argument('--books', type=int, default=200, help='Catalog books to seed')
+    parser.add_argument('--document-chars', type=int, default=40000, help='Size of each seeded study document')
+    parser.add_argument('--timeout', type=float, default=60, help='Client timeout per request (seconds)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='Earlier report to compare with; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Allowed p95 increase / throughput drop before a route counts as regressed')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory (database, logs)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix='benchmark-'))
+    jwt_secret = secrets.token_hex(32)
+    port = _free_port()
+    # Failures are only injected once seeding is done
+    standin = SupabaseStandIn(jwt_secret, latency_ms={'storage': args.storage_latency_ms,
+                                                      'auth': args.auth_latency_ms}).start()
+    os.environ.update({
+        'DJANGO_SETTINGS_MODULE': 'benchmarks.settings',
+        'DJANGO_SECRET_KEY': secrets.token_hex(32),
+        'BENCHMARK_DIR': str(workdir),
+        'BENCHMARK_DATABASE': args.database,
+        'SUPABASE_URL': standin.url,
+        'SUPABASE_KEY': standin.service_key(),
+        'SUPABASE_JWT_SECRET': jwt_secret,
+        'NOTES_STORAGE_BACKEND': 'local' if args.storage == 'local' else 'supabase',
+        'NOTES_STORAGE_ROOT': str(workdir / 'storage'),
+        'NOTES_STORAGE_PUBLIC_URL': f'http://127.0.0.1:{port}',
+        'AI_STUB_LATENCY_MS': str(args.llm_latency_ms),
+        'AI_STUB_ERROR_RATE': str(args.llm_error_rate),
+        'SHARED_CACHE_DIR': str(workdir / 'cache'),
+        'AI_VECTOR_INDEX_DIR': str(workdir / 'vector_index'),
+        'METRICS_SERVER_TIMING': 'True',
+        'METRICS_TOKEN': secrets.token_hex(16),
+    })
+
+    process = None
+    try:
+        print(f'Preparing database in {workdir}', file=sys.stderr)
+        prepare_database(args.books)
+        process, url = start_server(args, workdir, port)
+
+        print(f'Seeding {args.concurrency} users against {url}', file=sys.stderr)
+        workers = [Worker(number, url, args.timeout) for number in range(args.concurrency)]
+        seeders = [threading.Thread(target=worker.seed, args=(args.document_chars,)) for worker in workers]
+        for thread in seeders:
+            thread.start()
+        for thread in seeders:
+            thread.join()
+        if any(worker.refresh is None for worker in workers):
+            raise RuntimeError(f'Seeding failed, see {workdir / "server.log"}')
+        standin.error_rate.update(storage=args.storage_error_rate, auth=args.auth_error_rate)
+
+        all_routes = routes()
+        selected = [route for route in all_routes if route in SCENARIOS
+                    and (not args.only or any(part in route for part in args.only))]
+        results = {}
+        for route in selected:
+            samples, wall = measure(workers, SCENARIOS[route], args.duration, args.warmup)
+            results[route] = summarize(samples, wall)
+            latency = results[route]['latency_ms']
+            print(f"{route:32} {results[route]['throughput_rps']:8.1f} req/s  p50 {latency['p50']} ms  "
+                  f"p95 {latency['p95']} ms  errors {results[route]['errors']}", file=sys.stderr)
+
+        report = {
+            'meta': {
+                'commit': _git('rev-parse', 'HEAD'),
+                'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'config': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'baseline', 'threshold', 'keep')},
+            'routes': results,
+            'unexercised': [route for route in all_routes if route not in SCENARIOS],
+            'standin': standin.stats(),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        standin.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        regressions = compare(json.loads(Path(args.baseline).read_text()), report, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} route(s) regressed', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
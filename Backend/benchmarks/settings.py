@@ -0,0 +1,34 @@
+"""
+Settings for benchmark runs; ``benchmarks.run`` sets the environment they read.
+
+Supabase URL/keys, stub latency and the cache/index directories come in through
+the usual environment variables. Only what the environment cannot express is
+overridden here.
+"""
+import os
+
+from core.settings import *  # noqa: F401,F403
+from core.settings import AI_LLM, AI_QUOTA, REST_FRAMEWORK
+
+BENCHMARK_DIR = os.environ['BENCHMARK_DIR']
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS = ['http://127.0.0.1']
+
+# Never reach a real provider from a benchmark
+AI_LLM = {**AI_LLM, 'BACKEND': 'stub'}
+
+# Measure capacity, not the rate limits
+REST_FRAMEWORK = {**REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': []}
+AI_QUOTA = {**AI_QUOTA, 'ENABLED': False}
+
+if os.getenv('BENCHMARK_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+            # Concurrent writers queue for the lock instead of failing with "database is locked"
+            'OPTIONS': {'timeout': 30, 'transaction_mode': 'IMMEDIATE', 'init_command': 'PRAGMA journal_mode=WAL;'},
+        }
+    }
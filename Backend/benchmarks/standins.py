@@ -0,0 +1,243 @@
+"""
+Local stand-in for the Supabase storage and auth APIs.
+
+Only the calls the app makes are implemented:
+- bucket get, create and update;
+- object upload;
+- TUS resumable uploads;
+- password signup and sign-in;
+- admin user update.
+
+Uploaded bytes are counted and then discarded. Access tokens are HS256 JWTs
+signed with ``jwt_secret``, so ``users.authentication`` verifies them locally,
+exactly as it does in production. Each request to a service first waits that
+service's latency. A request then fails with a 503 at that service's error rate.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+
+TOKEN_SECONDS = 24 * 3600  # Outlives any run, so clients never need to refresh
+
+
+class SupabaseStandIn:
+    def __init__(self, jwt_secret, latency_ms=None, error_rate=None, host='127.0.0.1', port=0):
+        self.jwt_secret = jwt_secret
+        self.latency_ms = {'storage': 0, 'auth': 0, **(latency_ms or {})}
+        self.error_rate = {'storage': 0.0, 'auth': 0.0, **(error_rate or {})}
+        self.buckets = {}
+        self.users = {}  # email -> user dict (plus password)
+        self.uploads = {}  # TUS upload id -> [length, offset]
+        self.requests = {'storage': 0, 'auth': 0}
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def service_key(self):
+        return jwt.encode({'iss': 'supabase', 'role': 'service_role', 'iat': int(time.time())},
+                          self.jwt_secret, algorithm='HS256')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='supabase-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': dict(self.requests), 'bytes_received': self.bytes_received,
+                    'users': len(self.users), 'buckets': sorted(self.buckets)}
+
+    def _user_json(self, user):
+        return {key: value for key, value in user.items() if key != 'password'}
+
+    def _session(self, user):
+        now = int(time.time())
+        access_token = jwt.encode({
+            'iss': f'{self.url}/auth/v1',
+            'aud': 'authenticated',
+            'sub': user['id'],
+            'email': user['email'],
+            'role': 'authenticated',
+            'iat': now,
+            'exp': now + TOKEN_SECONDS,
+        }, self.jwt_secret, algorithm='HS256')
+        return {
+            'access_token': access_token,
+            'refresh_token': uuid.uuid4().hex,
+            'expires_in': TOKEN_SECONDS,
+            'expires_at': now + TOKEN_SECONDS,
+            'token_type': 'bearer',
+            'user': self._user_json(user),
+        }
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _handler_for(standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self):
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                data = b''
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return data
+                    data += self.rfile.read(size)
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        def _send(self, status, payload=None, headers=None):
+            body = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if payload is not None:
+                self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._send(status, {'statusCode': str(status), 'error': message, 'message': message,
+                                'error_description': message})
+
+        def _dispatch(self, method):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split('/') if part]
+            body = self._body()
+            service = {'storage': 'storage', 'auth': 'auth'}.get(parts[0] if parts else '')
+            if service is None:
+                return self._error(404, 'Not found')
+
+            with standin._lock:
+                standin.requests[service] += 1
+                standin.bytes_received += len(body)
+            if standin.latency_ms[service]:
+                time.sleep(standin.latency_ms[service] / 1000)
+            if random.random() < standin.error_rate[service]:
+                return self._error(503, f'Injected {service} failure')
+
+            handler = getattr(self, f'_{service}', None)
+            return handler(method, parts[2:], parse_qs(url.query), body)
+
+        def _storage(self, method, parts, query, body):
+            if parts[:1] == ['bucket']:
+                return self._bucket(method, parts[1:], body)
+            if parts[:1] == ['object'] and method in ('POST', 'PUT'):
+                return self._send(200, {'Key': '/'.join(parts[1:]), 'Id': str(uuid.uuid4())})
+            if parts[:2] == ['upload', 'resumable']:
+                return self._resumable(method, parts[2:])
+            return self._error(404, 'Not found')
+
+        def _bucket(self, method, parts, body):
+            if method == 'POST' and not parts:
+                options = json.loads(body or b'{}')
+                with standin._lock:
+                    standin.buckets[options['id']] = {
+                        'id': options['id'], 'name': options.get('name') or options['id'], 'owner': '',
+                        'public': bool(options.get('public')), 'created_at': _now(), 'updated_at': _now(),
+                        'file_size_limit': options.get('file_size_limit'),
+                        'allowed_mime_types': options.get('allowed_mime_types'),
+                    }
+                return self._send(200, {'name': options['id']})
+            bucket = standin.buckets.get(parts[0]) if parts else None
+            if bucket is None:
+                return self._error(404, 'Bucket not found')
+            if method == 'PUT':
+                options = json.loads(body or b'{}')
+                with standin._lock:
+                    bucket.update({key: value for key, value in options.items() if key in bucket},
+                                  updated_at=_now())
+                return self._send(200, {'message': 'Successfully updated'})
+            return self._send(200, bucket)
+
+        def _resumable(self, method, parts):
+            if method == 'POST' and not parts:
+                upload_id = uuid.uuid4().hex
+                with standin._lock:
+                    standin.uploads[upload_id] = [int(self.headers['Upload-Length']), 0]
+                return self._send(201, headers={'Location': f'/storage/v1/upload/resumable/{upload_id}',
+                                                'Tus-Resumable': '1.0.0'})
+            upload = standin.uploads.get(parts[0]) if parts else None
+            if upload is None:
+                return self._error(404, 'Upload not found')
+            if method == 'PATCH':
+                if int(self.headers['Upload-Offset']) != upload[1]:
+                    return self._error(409, 'Offset mismatch')
+                with standin._lock:
+                    upload[1] += int(self.headers['Content-Length'])
+                    if upload[1] >= upload[0]:
+                        del standin.uploads[parts[0]]
+            return self._send(204 if method == 'PATCH' else 200,
+                              headers={'Upload-Offset': str(upload[1]), 'Upload-Length': str(upload[0]),
+                                       'Tus-Resumable': '1.0.0'})
+
+        def _auth(self, method, parts, query, body):
+            payload = json.loads(body or b'{}')
+            if method == 'POST' and parts == ['signup']:
+                with standin._lock:
+                    if payload['email'] in standin.users:
+                        return self._error(422, 'User already registered')
+                    user = standin.users[payload['email']] = {
+                        'id': str(uuid.uuid4()), 'aud': 'authenticated', 'role': 'authenticated',
+                        'email': payload['email'], 'password': payload['password'],
+                        'app_metadata': {'provider': 'email'},
+                        'user_metadata': (payload.get('data') or {}),
+                        'created_at': _now(), 'email_confirmed_at': _now(),
+                    }
+                return self._send(200, standin._session(user))
+            if method == 'POST' and parts == ['token'] and query.get('grant_type') == ['password']:
+                user = standin.users.get(payload.get('email'))
+                if user is None or user['password'] != payload.get('password'):
+                    return self._error(400, 'Invalid login credentials')
+                return self._send(200, standin._session(user))
+            if method == 'PUT' and parts[:2] == ['admin', 'users'] and len(parts) == 3:
+                user = next((user for user in standin.users.values() if user['id'] == parts[2]), None)
+                if user is None:
+                    return self._error(404, 'User not found')
+                return self._send(200, standin._user_json(user))
+            return self._error(404, 'Not found')
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_PUT(self):
+            self._dispatch('PUT')
+
+        def do_PATCH(self):
+            self._dispatch('PATCH')
+
+        def do_HEAD(self):
+            self._dispatch('HEAD')
+
+    return Handler
@@ -0,0 +1,50 @@
+from io import StringIO
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from . import run
+
+
+def route_report(p95, rps):
+    return {'latency_ms': {'p95': p95}, 'throughput_rps': rps}
+
+
+class BenchmarkReportTests(SimpleTestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual([route for route in run.routes() if route not in run.SCENARIOS], [])
+        self.assertIn('api/notes/upload/batch/', run.routes())
+
+    def test_server_timing_header_is_parsed(self):
+        header = 'db;dur=12.5;desc="3 calls", app;dur=4.0, total;dur=16.5'
+        self.assertEqual(run._server_timing(header), {'db': 12.5, 'app': 4.0, 'total': 16.5})
+        self.assertEqual(run._server_timing(None), {})
+
+    def test_summary_counts_errors_and_averages_phases(self):
+        samples = [
+            (10.0, 200, {'db': 2.0}),
+            (20.0, 200, {'db': 4.0}),
+            (30.0, 503, {}),
+            (40.0, 'ReadTimeout', {}),
+            (None, 'setup:RuntimeError', {}),
+        ]
+        summary = run.summarize(samples, wall=2.0)
+        self.assertEqual((summary['requests'], summary['errors']), (5, 3))
+        self.assertEqual(summary['throughput_rps'], 2.0)
+        self.assertEqual(summary['latency_ms']['p50'], 25.0)
+        self.assertEqual(summary['latency_ms']['max'], 40.0)
+        self.assertEqual(summary['server_phases_ms'], {'db': 3.0})
+        self.assertEqual(summary['status_codes']['200'], 2)
+
+    def test_compare_flags_latency_and_throughput_regressions(self):
+        config = {'concurrency': 8}
+        baseline = {'config': config, 'routes': {
+            'api/ai/ask/': route_report(100, 50), 'api/ai/usage/': route_report(100, 50),
+            'api/ai/quizzes/': route_report(100, 50),
+        }}
+        report = {'config': config, 'routes': {
+            'api/ai/ask/': route_report(120, 50), 'api/ai/usage/': route_report(100, 40),
+            'api/ai/quizzes/': route_report(105, 48), 'api/ai/summaries/': route_report(100, 50),
+        }}
+        with mock.patch('sys.stderr', StringIO()):
+            self.assertEqual(run.compare(baseline, report, 0.10), ['api/ai/ask/', 'api/ai/usage/'])
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serve with an ASGI server (``uvicorn core.asgi:application``) so that streaming
+endpoints such as /api/ai/summary/stream/ flush tokens as they are generated.
 """
 
 import os
@@ -0,0 +1,184 @@
+"""
+Request timing breakdown and Prometheus metrics.
+
+Work that leaves the process is wrapped in ``timed(phase)``:
+- ``db``: every ORM query, via a ``connection_created`` execute wrapper.
+- ``storage`` and ``auth``: Supabase calls.
+- ``llm``: model calls.
+
+Each wrapped call is observed in ``upstream_call_duration_seconds``. While
+``RequestTimingMiddleware`` is handling a request, the call's time is also
+added to that request's per-phase totals. At the end of the request the totals
+go into ``http_request_phase_seconds``. Whatever is left over is reported as
+the ``app`` phase.
+
+Histograms live in process memory, so each worker process exposes its own
+series on ``/metrics``. Prometheus sums them across scrape targets as usual.
+"""
+import bisect
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        def label_text(key, extra=()):
+            pairs = list(zip(self.labelnames, key)) + list(extra)
+            escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{label_text(key, [("le", repr(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{label_text(key, [("le", "+Inf")])} {values[-1]}')
+            lines.append(f'{self.name}_sum{label_text(key)} {values[-2]}')
+            lines.append(f'{self.name}_count{label_text(key)} {values[-1]}')
+        return '\n'.join(lines)
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route.', ('method', 'route', 'status'))
+REQUEST_PHASE_DURATION = Histogram(
+    'http_request_phase_seconds', 'Per-request time spent in each phase (db, storage, auth, llm, app).',
+    ('route', 'phase'))
+CALL_DURATION = Histogram(
+    'upstream_call_duration_seconds', 'Duration of individual database, storage, auth and LLM calls.', ('phase',))
+
+REGISTRY = [REQUEST_DURATION, REQUEST_PHASE_DURATION, CALL_DURATION]
+
+
+class RequestTimings:
+    def __init__(self):
+        self.phases = {}  # phase -> [seconds, calls]
+        self._lock = threading.Lock()  # Map-reduce worker threads share the request's timings
+
+    def add(self, phase, seconds):
+        with self._lock:
+            entry = self.phases.setdefault(phase, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        CALL_DURATION.observe(elapsed, phase=phase)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(phase, elapsed)
+
+
+def _time_query(execute, sql, params, many, context):
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(_instrument_connection, dispatch_uid='core.metrics.instrument_connection')
+
+
+def _config():
+    config = getattr(settings, 'METRICS', {})
+    return {
+        'SERVER_TIMING': config.get('SERVER_TIMING', False),
+        'TOKEN': config.get('TOKEN', ''),
+    }
+
+
+class RequestTimingMiddleware:
+    """Records per-phase timings for every request; optionally adds a Server-Timing header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = _config()['SERVER_TIMING']
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        if route == 'metrics':
+            return response
+
+        with timings._lock:
+            phases = {phase: seconds for phase, (seconds, _) in timings.phases.items()}
+            calls = {phase: count for phase, (_, count) in timings.phases.items()}
+        # Worker threads can overlap, so the remainder is clamped rather than going negative
+        phases['app'] = max(0.0, total - sum(phases.values()))
+
+        REQUEST_DURATION.observe(total, method=request.method, route=route, status=response.status_code)
+        for phase, seconds in phases.items():
+            REQUEST_PHASE_DURATION.observe(seconds, route=route, phase=phase)
+
+        if self.server_timing:
+            # Streaming responses are measured up to the first byte only
+            entries = [
+                f'{phase};dur={seconds * 1000:.1f}' + (f';desc="{calls[phase]} calls"' if phase in calls else '')
+                for phase, seconds in phases.items()
+            ]
+            entries.append(f'total;dur={total * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's histograms; requires ``METRICS['TOKEN']``."""
+    token = _config()['TOKEN']
+    if not token:
+        return HttpResponse(status=403)  # Never public: scraping needs a configured token
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    body = '\n\n'.join(histogram.render() for histogram in REGISTRY) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
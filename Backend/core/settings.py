@@ -48,6 +48,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Supabase access tokens are verified locally; anything else falls through to SimpleJWT
+        'users.authentication.SupabaseJWTAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
@@ -56,7 +58,6 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_RATES': {
         'user': '100/hour',
-        'ai_request': '30/minute',
     },
 }
 
@@ -70,6 +71,168 @@ SIMPLE_JWT = {
     "AUDIENCE": None,
     "ISSUER": None,
     "AUTH_HEADER_TYPES": ("Bearer", ),
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.FilteredTokenRefreshSerializer",
+}
+
+# Bloom filter in front of the refresh-token blacklist (users.token_filter). A token blacklisted
+# in another process may be accepted for up to SYNC_SECONDS; prune with manage.py prune_tokens.
+TOKEN_BLACKLIST_FILTER = {
+    'CAPACITY': int(os.getenv('TOKEN_FILTER_CAPACITY', '100000')),
+    'ERROR_RATE': float(os.getenv('TOKEN_FILTER_ERROR_RATE', '0.001')),
+    'SYNC_SECONDS': int(os.getenv('TOKEN_FILTER_SYNC_SECONDS', '2')),
+    'REBUILD_SECONDS': int(os.getenv('TOKEN_FILTER_REBUILD_SECONDS', str(6 * 3600))),
+}
+
+# Local verification of Supabase access tokens (users.authentication).
+# Projects on the legacy shared secret sign with HS256 and need SUPABASE_JWT_SECRET;
+# projects with asymmetric signing keys are verified against the cached JWKS.
+SUPABASE_AUTH = {
+    'JWT_SECRET': os.getenv('SUPABASE_JWT_SECRET', ''),
+    'ISSUER': os.getenv('SUPABASE_JWT_ISSUER', ''),  # defaults to {SUPABASE_URL}/auth/v1
+    'AUDIENCE': os.getenv('SUPABASE_JWT_AUDIENCE', 'authenticated'),
+    'JWKS_CACHE_SECONDS': int(os.getenv('SUPABASE_JWKS_CACHE_SECONDS', '600')),
+    'JWKS_MIN_REFRESH_SECONDS': int(os.getenv('SUPABASE_JWKS_MIN_REFRESH_SECONDS', '30')),
+    # In-process Supabase id -> user cache (users.identity); bounds how long a deactivation takes to apply
+    'IDENTITY_CACHE_MAX_ENTRIES': int(os.getenv('SUPABASE_IDENTITY_CACHE_MAX_ENTRIES', '10000')),
+    'IDENTITY_CACHE_SECONDS': int(os.getenv('SUPABASE_IDENTITY_CACHE_SECONDS', '300')),
+}
+
+# Per-request phase timings (core.metrics), scraped from /metrics with 'Authorization: Bearer <METRICS_TOKEN>'.
+# /metrics answers 403 to everyone while METRICS_TOKEN is unset. SERVER_TIMING adds a Server-Timing header
+# to every response.
+METRICS = {
+    'SERVER_TIMING': os.getenv('METRICS_SERVER_TIMING', 'False') == 'True',
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+}
+
+# Model provider for ai_services.llm: 'gemini', 'stub' (offline, deterministic) or a dotted class path
+AI_LLM = {
+    'BACKEND': os.getenv('AI_LLM_BACKEND', 'gemini'),
+    'API_KEY': os.getenv('GEMINI_API_KEY', ''),
+    'MODEL': os.getenv('AI_MODEL', 'gemini-pro'),
+    'TRANSPORT': os.getenv('GEMINI_TRANSPORT', ''),  # 'grpc' (default) or 'rest'
+    'TIMEOUT': int(os.getenv('AI_REQUEST_TIMEOUT_SECONDS', '120')),
+    'STUB_LATENCY_MS': int(os.getenv('AI_STUB_LATENCY_MS', '0')),
+    'STUB_ERROR_RATE': float(os.getenv('AI_STUB_ERROR_RATE', '0')),  # Fraction of stub calls that raise
+}
+
+# AI result cache: in-process LRU in front of the persisted Summary rows
+AI_RESULT_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('AI_CACHE_MAX_ENTRIES', '512')),
+    'TTL_SECONDS': int(os.getenv('AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+}
+
+# AIRequest rows are buffered in-process and written in batches (ai_services.request_log)
+AI_REQUEST_LOG = {
+    'BATCH_SIZE': int(os.getenv('AI_REQUEST_LOG_BATCH_SIZE', '200')),
+    'FLUSH_SECONDS': float(os.getenv('AI_REQUEST_LOG_FLUSH_SECONDS', '2')),
+    'MAX_QUEUE': int(os.getenv('AI_REQUEST_LOG_MAX_QUEUE', '10000')),
+}
+
+# USD per 1,000 tokens by model name, used by /api/ai/usage/ to estimate cost
+AI_MODEL_PRICES = {
+    'gemini-pro': {'prompt': float(os.getenv('AI_PRICE_PROMPT_PER_1K', '0.0005')),
+                   'completion': float(os.getenv('AI_PRICE_COMPLETION_PER_1K', '0.0015'))},
+}
+
+# Background AI generation jobs run on a bounded in-process thread pool
+AI_JOBS = {
+    'MAX_WORKERS': int(os.getenv('AI_JOB_WORKERS', '4')),
+    'STALE_AFTER_SECONDS': int(os.getenv('AI_JOB_STALE_AFTER_SECONDS', '600')),
+    'MAX_ATTEMPTS': int(os.getenv('AI_JOB_MAX_ATTEMPTS', '3')),
+    # Running jobs refresh updated_at this often; keep it well below STALE_AFTER_SECONDS
+    'HEARTBEAT_SECONDS': int(os.getenv('AI_JOB_HEARTBEAT_SECONDS', '60')),
+}
+
+# Batch generation (/api/ai/batch/generate/): files of one batch job are generated CONCURRENCY at a time
+# and their rows bulk inserted FLUSH_SIZE at a time
+AI_BATCH = {
+    'CONCURRENCY': int(os.getenv('AI_BATCH_CONCURRENCY', '4')),
+    'MAX_FILES': int(os.getenv('AI_BATCH_MAX_FILES', '200')),
+    'FLUSH_SIZE': int(os.getenv('AI_BATCH_FLUSH_SIZE', '20')),
+    'PROGRESS_SECONDS': float(os.getenv('AI_BATCH_PROGRESS_SECONDS', '1')),
+}
+
+# Cost-weighted AI quota (ai_services.quota): a token bucket per user, kept in the database so every
+# worker process shares it. Requests are admitted on estimated tokens and then charged what they used.
+AI_QUOTA = {
+    'ENABLED': os.getenv('AI_QUOTA_ENABLED', 'True') == 'True',
+    'CAPACITY': int(os.getenv('AI_QUOTA_CAPACITY', '100000')),  # Burst size, in model tokens
+    'REFILL_PER_MINUTE': int(os.getenv('AI_QUOTA_REFILL_PER_MINUTE', '10000')),
+    'CHARS_PER_TOKEN': 4,
+    'PROMPT_OVERHEAD_TOKENS': 250,  # Prompt template around the content
+    'COMPLETION_TOKENS': {'summary': 1200, 'quiz': 150, 'ask': 600},  # Quiz: per question
+}
+
+# Concurrent identical generations share one model call (ai_services.singleflight); across processes the
+# producer holds a database lease, renewed while it runs, that others may take over once it expires
+AI_SINGLE_FLIGHT = {
+    'LEASE_SECONDS': int(os.getenv('AI_SINGLE_FLIGHT_LEASE_SECONDS', '300')),
+    'POLL_SECONDS': float(os.getenv('AI_SINGLE_FLIGHT_POLL_SECONDS', '0.5')),
+}
+
+# Quizzes are sampled from per-document question banks; Gemini is asked for BATCH_SIZE more questions
+# when a request cannot be covered, and in the background while a bank holds fewer than LOW_WATER
+AI_QUESTION_BANK = {
+    'BATCH_SIZE': int(os.getenv('AI_QUESTION_BATCH_SIZE', '20')),
+    'LOW_WATER': int(os.getenv('AI_QUESTION_LOW_WATER', '30')),
+    'AVOID_IN_PROMPT': int(os.getenv('AI_QUESTION_AVOID_IN_PROMPT', '50')),  # Existing questions listed in a top-up prompt
+    'RECENT_QUIZZES': int(os.getenv('AI_QUESTION_RECENT_QUIZZES', '5')),  # A user's recent quizzes sampled last
+    'MAX_WORKERS': int(os.getenv('AI_QUESTION_TOPUP_WORKERS', '2')),
+    # No top-ups for a bank whose last batch added nothing new, until its text changes or this passes
+    'SATURATED_COOLDOWN_SECONDS': int(os.getenv('AI_QUESTION_SATURATED_COOLDOWN', '3600')),
+}
+
+# Uploads to Supabase storage are streamed; files above the threshold use resumable (TUS) uploads
+NOTES_UPLOAD = {
+    'CHUNK_SIZE': int(os.getenv('UPLOAD_CHUNK_SIZE', str(6 * 1024 * 1024))),  # Supabase requires 6 MB TUS chunks
+    'RESUMABLE_THRESHOLD': int(os.getenv('UPLOAD_RESUMABLE_THRESHOLD', str(6 * 1024 * 1024))),
+    'MAX_RETRIES': int(os.getenv('UPLOAD_MAX_RETRIES', '5')),
+    'TIMEOUT': int(os.getenv('UPLOAD_TIMEOUT_SECONDS', '60')),
+    'BATCH_MAX_FILES': int(os.getenv('UPLOAD_BATCH_MAX_FILES', '50')),
+    'BATCH_CONCURRENCY': int(os.getenv('UPLOAD_BATCH_CONCURRENCY', '4')),
+}
+
+# Where uploaded notes are stored: 'supabase', 'local' (files under LOCAL_ROOT, public buckets served
+# from /api/notes/storage/) or a dotted StorageBackend path. SENDFILE_HEADER lets the web server send
+# local files: 'X-Accel-Redirect' with SENDFILE_PREFIX an nginx internal location (e.g. '/protected/'),
+# or 'X-Sendfile' with SENDFILE_PREFIX the LOCAL_ROOT path plus '/'.
+NOTES_STORAGE = {
+    'BACKEND': os.getenv('NOTES_STORAGE_BACKEND', 'supabase'),
+    'LOCAL_ROOT': os.getenv('NOTES_STORAGE_ROOT', os.path.join(BASE_DIR, 'storage')),
+    'PUBLIC_BASE_URL': os.getenv('NOTES_STORAGE_PUBLIC_URL', 'http://localhost:8000'),
+    'SENDFILE_HEADER': os.getenv('NOTES_STORAGE_SENDFILE_HEADER', ''),
+    'SENDFILE_PREFIX': os.getenv('NOTES_STORAGE_SENDFILE_PREFIX', ''),
+}
+
+# Storage buckets used by the notes app; checked once per process or per deploy (manage.py bootstrap_storage)
+NOTES_STORAGE_BUCKETS = {
+    'uploads': {'public': True},
+}
+
+# Upload-time text extraction (process pool); OCR also needs pytesseract + pdf2image
+NOTES_EXTRACTION = {
+    'MAX_WORKERS': int(os.getenv('EXTRACTION_WORKERS', '2')),
+    'CHUNK_CHARS': int(os.getenv('EXTRACTION_CHUNK_CHARS', '4000')),
+    'OCR': os.getenv('EXTRACTION_OCR', 'False') == 'True',
+    # Threads that write extracted chunks to the database
+    'STORE_WORKERS': int(os.getenv('EXTRACTION_STORE_WORKERS', '2')),
+}
+
+# Upper bound on document text sent to the model in a single prompt
+AI_MAX_CONTENT_CHARS = int(os.getenv('AI_MAX_CONTENT_CHARS', '30000'))
+
+# Larger documents are summarized map-reduce style with bounded parallel chunk calls
+AI_MAP_REDUCE = {
+    'CONCURRENCY': int(os.getenv('AI_MAP_CONCURRENCY', '4')),
+}
+
+# Local embedding index used by /api/ai/ask/ (memory-mapped, one partition per user/catalog shelf)
+AI_VECTOR_INDEX = {
+    'DIR': os.getenv('AI_VECTOR_INDEX_DIR', os.path.join(BASE_DIR, 'vector_index')),
+    'EMBEDDING_MODEL': os.getenv('AI_EMBEDDING_MODEL', 'models/embedding-001'),
+    'DIMENSIONS': int(os.getenv('AI_EMBEDDING_DIMENSIONS', '768')),
+    'BLOCK_ROWS': int(os.getenv('AI_VECTOR_BLOCK_ROWS', '65536')),
 }
 
 INSTALLED_APPS = [
@@ -90,6 +253,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.RequestTimingMiddleware',  # First, so the timings cover the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -135,6 +299,21 @@ DATABASES = {
 }
 
 
+# Caches
+# "shared" is visible to every worker process on the host (used for the catalog
+# version and listings); point it at Redis/Memcached for multi-host deployments.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SHARED_CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,68 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import metrics
+
+
+class HistogramTests(SimpleTestCase):
+    def test_render_is_cumulative_with_sum_and_count(self):
+        histogram = metrics.Histogram('job_seconds', 'Job time.', ('kind',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value, kind='quiz')
+        lines = histogram.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP job_seconds Job time.', '# TYPE job_seconds histogram'])
+        self.assertEqual(lines[2:], [
+            'job_seconds_bucket{kind="quiz",le="0.1"} 1',
+            'job_seconds_bucket{kind="quiz",le="1.0"} 3',
+            'job_seconds_bucket{kind="quiz",le="+Inf"} 4',
+            'job_seconds_sum{kind="quiz"} 4.25',
+            'job_seconds_count{kind="quiz"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        histogram = metrics.Histogram('job_seconds', 'Job time.', ('kind',), buckets=(1.0,))
+        histogram.observe(0.5, kind='a"b\\c\nd')
+        self.assertIn('job_seconds_count{kind="a\\"b\\\\c\\nd"} 1', histogram.render())
+
+    def test_timed_adds_to_the_current_request(self):
+        timings = metrics.RequestTimings()
+        token = metrics._current.set(timings)
+        try:
+            with metrics.timed('storage'):
+                pass
+            with metrics.timed('storage'):
+                pass
+        finally:
+            metrics._current.reset(token)
+        self.assertEqual(timings.phases['storage'][1], 2)
+
+
+@override_settings(METRICS={'SERVER_TIMING': True, 'TOKEN': 'scrape-token'})
+class RequestTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        # The test database connection was opened before core.metrics was imported
+        metrics._instrument_connection(None, connection)
+
+    def test_server_timing_header_breaks_down_the_request(self):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'nobody', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        phases = {entry.split(';')[0] for entry in response['Server-Timing'].split(', ')}
+        self.assertEqual(phases, {'db', 'app', 'total'})
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ calls"')
+
+    def test_requests_are_observed_by_route(self):
+        self.client.post(reverse('token_obtain_pair'), {'username': 'nobody', 'password': 'wrong'})
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="POST",route="api/token/",status="401"}', body)
+        self.assertIn('http_request_phase_seconds_count{route="api/token/",phase="db"}', body)
+        # Scrapes are not themselves observed
+        self.assertNotIn('route="metrics"', body)
+
+    def test_metrics_requires_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        with self.settings(METRICS={'TOKEN': ''}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
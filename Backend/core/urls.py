@@ -20,6 +20,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from core.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -30,6 +31,7 @@ urlpatterns = [
     path('api/notes/', include('notes.urls')),  # Note-related endpoints under /api/notes/
     path('api/ai/', include('ai_services.urls')),  # AI services endpoints
     path('api-auth/', include('rest_framework.urls')),  # DRF browsable API login/logout
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape endpoint (per process)
 ]
 
 # Serve media files in development
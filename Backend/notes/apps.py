@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class NotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notes'
+
+    def ready(self):
+        # Registers the CommonBook signal handlers that invalidate the cached catalog
+        from . import catalog  # noqa: F401
@@ -0,0 +1,84 @@
+"""
+Storage bucket bootstrap.
+
+Buckets listed in ``NOTES_STORAGE_BUCKETS`` are checked, and created when
+missing, once per process, or once per deploy with ``manage.py bootstrap_storage``.
+The result is memoized, so uploads only pay for the object write. A deploy-time
+run also leaves a marker in the shared cache, which lets new worker processes
+skip the remote check. When a bucket's real settings differ from the configured
+ones, the difference is logged but never raised. A drifted bucket therefore does
+not fail or slow down an upload.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+_ready = set()
+_lock = threading.Lock()
+
+
+def configured_buckets():
+    return getattr(settings, 'NOTES_STORAGE_BUCKETS', {'uploads': {'public': True}})
+
+
+def _marker_key(name, options):
+    # Changing a bucket's configured options (or the backend) invalidates the deploy-time marker
+    backend = type(storage.get_storage()).__name__
+    digest = hashlib.sha256(json.dumps([backend, name, options], sort_keys=True).encode()).hexdigest()[:16]
+    return f'storage-bucket:{digest}'
+
+
+def _drift(bucket, options):
+    drift = []
+    for option, expected in options.items():
+        actual = bucket.get(option)
+        if option == 'allowed_mime_types':
+            expected, actual = sorted(expected or []), sorted(actual or [])
+        if actual != expected:
+            drift.append(f'{option}: expected {expected!r}, found {actual!r}')
+    return drift
+
+
+def check_bucket(name, options):
+    """Create ``name`` if it is missing; return ``{'bucket', 'created', 'drift'}``."""
+    backend = storage.get_storage()
+    bucket = backend.get_bucket(name)
+    if bucket is None:
+        backend.create_bucket(name, options)
+        return {'bucket': name, 'created': True, 'drift': []}
+    return {'bucket': name, 'created': False, 'drift': _drift(bucket, options)}
+
+
+def mark_ready(name, options):
+    caches['shared'].set(_marker_key(name, options), True, timeout=None)
+    _ready.add(name)
+
+
+def ensure_bucket(name):
+    """Make sure ``name`` exists; only the first call per process (or deploy) asks the storage backend."""
+    if name in _ready:
+        return
+    with _lock:
+        if name in _ready:
+            return
+        options = configured_buckets().get(name, {})
+        if caches['shared'].get(_marker_key(name, options)):
+            _ready.add(name)
+            return
+        try:
+            report = check_bucket(name, options)
+        except Exception:
+            # Not memoized, so the next upload tries again; the upload itself reports real failures
+            logger.exception('Could not verify storage bucket %s', name)
+            return
+        for problem in report['drift']:
+            logger.warning('Storage bucket %s drifted from settings: %s', name, problem)
+        mark_ready(name, options)
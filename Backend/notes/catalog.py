@@ -0,0 +1,83 @@
+"""
+Versioned cache for the CommonBook catalog.
+
+The catalog changes a few times a term but is polled constantly. Every
+(subject, grade) listing is cached as rendered JSON under the current catalog
+version; saving or deleting a CommonBook bumps the version once the write has
+committed, which makes every cached listing unreachable at once. The version
+lives in the ``shared`` cache so all worker processes agree on it, and doubles
+as the ETag/Last-Modified source so conditional requests are answered without
+touching the database.
+"""
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+
+from .models import CommonBook, SUBJECT_CHOICES, GRADE_CHOICES
+from .serializers import CommonBookSerializer
+from .signals import chunks_extracted
+
+VERSION_KEY = 'catalog:version'
+LISTING_TIMEOUT = 24 * 3600
+
+
+def _cache():
+    return caches['shared']
+
+
+def bump_catalog_version():
+    # Microsecond timestamps are monotonic enough and double as Last-Modified
+    version = time.time_ns() // 1000
+    _cache().set(VERSION_KEY, version, timeout=None)
+    return version
+
+
+def get_catalog_version():
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        version = bump_catalog_version()
+    return version
+
+
+def version_timestamp(version):
+    return version / 1_000_000
+
+
+def get_catalog_listing(version, subject=None, grade=None):
+    """Return the rendered JSON listing of active books for ``subject``/``grade``."""
+    cacheable = (subject in (None, '') or subject in dict(SUBJECT_CHOICES)) and \
+                (grade in (None, '') or grade in dict(GRADE_CHOICES))
+    key = f'catalog:{version}:{subject or ""}:{grade or ""}'
+    if cacheable:
+        body = _cache().get(key)
+        if body is not None:
+            return body
+
+    books = CommonBook.objects.filter(is_active=True)
+    if subject:
+        books = books.filter(subject=subject)
+    if grade:
+        books = books.filter(grade=grade)
+    body = JSONRenderer().render(CommonBookSerializer(books, many=True).data)
+
+    # Unknown filter values are not cached so arbitrary query strings cannot flood the cache
+    if cacheable:
+        _cache().set(key, body, timeout=LISTING_TIMEOUT)
+    return body
+
+
+@receiver(post_save, sender=CommonBook, dispatch_uid='notes.catalog.saved')
+@receiver(post_delete, sender=CommonBook, dispatch_uid='notes.catalog.deleted')
+def invalidate_catalog(sender, **kwargs):
+    # A listing rebuilt before the write commits would be cached from the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(chunks_extracted, sender=CommonBook, dispatch_uid='notes.catalog.extracted')
+def invalidate_catalog_after_extraction(sender, **kwargs):
+    # extraction_status is part of the listing and is set with a queryset update
+    transaction.on_commit(bump_catalog_version)
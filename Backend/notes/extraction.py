@@ -0,0 +1,144 @@
+"""
+Upload-time text extraction.
+
+Uploaded documents, and catalog books downloaded from their URL, are copied to
+a temporary file and parsed by a process pool (see ``notes.parsers``) so
+CPU-heavy PDF/DOCX parsing and OCR never run on a request thread. The resulting chunks are stored as DocumentChunk rows, which
+the AI endpoints read instead of re-downloading the file from storage.
+
+Storing the chunks happens on a separate thread pool: the process pool's
+management thread runs the done callbacks, and blocking it on database writes
+would stall every other extraction's results.
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import urllib.request
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import UploadedFile, CommonBook, DocumentChunk
+from .parsers import extract_chunks
+from .signals import chunks_extracted
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_store_executor = None
+_executor_lock = threading.Lock()
+
+
+def _config():
+    config = getattr(settings, 'NOTES_EXTRACTION', {})
+    return {
+        'MAX_WORKERS': config.get('MAX_WORKERS', 2),
+        'CHUNK_CHARS': config.get('CHUNK_CHARS', 4000),
+        'OCR': config.get('OCR', False),
+        'STORE_WORKERS': config.get('STORE_WORKERS', 2),
+    }
+
+
+def _get_executor(reset=False):
+    global _executor
+    with _executor_lock:
+        if _executor is None or reset:
+            # Spawned workers do not inherit the parent's threads or DB connections
+            _executor = ProcessPoolExecutor(
+                max_workers=_config()['MAX_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _get_store_executor():
+    global _store_executor
+    with _executor_lock:
+        if _store_executor is None:
+            _store_executor = ThreadPoolExecutor(max_workers=_config()['STORE_WORKERS'],
+                                                 thread_name_prefix='extraction-store')
+        return _store_executor
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _copy_to_temp(uploaded_file, file_name):
+    suffix = os.path.splitext(file_name)[1]
+    fd, path = tempfile.mkstemp(prefix='extract-', suffix=suffix)
+    with os.fdopen(fd, 'wb') as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+    return path
+
+
+def _submit(model, owner_id, path, file_name):
+    config = _config()
+    args = (extract_chunks, path, file_name, config['CHUNK_CHARS'], config['OCR'])
+    try:
+        try:
+            future = _get_executor().submit(*args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge scan); start a fresh pool
+            future = _get_executor(reset=True).submit(*args)
+    except BaseException:
+        # No worker owns the temporary copy, so nothing else would remove it
+        _remove(path)
+        raise
+    future.add_done_callback(partial(_queue_store, model, owner_id))
+    return future
+
+
+def schedule_extraction(file_record, uploaded_file):
+    """Queue text extraction for ``file_record``; chunks are stored when the worker finishes."""
+    path = _copy_to_temp(uploaded_file, file_record.file_name)
+    return _submit(UploadedFile, file_record.id, path, file_record.file_name)
+
+
+def schedule_book_extraction(book):
+    """Download a catalog book from its ``file_url`` and queue it for extraction."""
+    file_name = os.path.basename(urlparse(book.file_url).path) or f'book-{book.id}.pdf'
+    fd, path = tempfile.mkstemp(prefix='extract-', suffix=os.path.splitext(file_name)[1])
+    with os.fdopen(fd, 'wb') as out, urllib.request.urlopen(book.file_url, timeout=60) as src:
+        shutil.copyfileobj(src, out, 1024 * 1024)
+    return _submit(CommonBook, book.id, path, file_name)
+
+
+def _queue_store(model, owner_id, future):
+    # Runs on the process pool's management thread, which must not wait on the database
+    _get_store_executor().submit(_store_chunks, model, owner_id, future)
+
+
+def _store_chunks(model, owner_id, future):
+    owner_field = 'book_id' if model is CommonBook else 'file_id'
+    try:
+        try:
+            chunks = future.result()
+        except Exception:
+            logger.exception('Text extraction failed for %s %s', model.__name__, owner_id)
+            model.objects.filter(id=owner_id).update(extraction_status=UploadedFile.EXTRACTION_FAILED)
+            return
+
+        with transaction.atomic():
+            DocumentChunk.objects.filter(**{owner_field: owner_id}).delete()
+            DocumentChunk.objects.bulk_create(
+                [DocumentChunk(index=index, page=page, text=text, **{owner_field: owner_id})
+                 for index, (page, text) in enumerate(chunks)],
+                batch_size=500,
+            )
+            model.objects.filter(id=owner_id).update(extraction_status=UploadedFile.EXTRACTION_DONE)
+        chunks_extracted.send(sender=model, owner_id=owner_id)
+    finally:
+        # Runs on a store pool thread, outside any request cycle
+        close_old_connections()
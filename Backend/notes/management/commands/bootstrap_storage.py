@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.buckets import configured_buckets, check_bucket, mark_ready
+from notes.storage import get_storage
+
+
+class Command(BaseCommand):
+    help = ("Create missing storage buckets and report settings drift. Run once per deploy "
+            "so web workers skip the bucket check on their first upload.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Update drifted buckets to match NOTES_STORAGE_BUCKETS')
+        parser.add_argument('--strict', action='store_true',
+                            help='Exit with an error if any bucket has drifted (after --fix)')
+
+    def handle(self, *args, **options):
+        drifted = []
+        for name, bucket_options in configured_buckets().items():
+            try:
+                report = check_bucket(name, bucket_options)
+            except Exception as e:
+                raise CommandError(f"Could not check bucket {name}: {e}")
+
+            if report['created']:
+                self.stdout.write(f"Created bucket {name}")
+            elif report['drift'] and options['fix']:
+                get_storage().update_bucket(name, bucket_options)
+                self.stdout.write(f"Updated bucket {name}: {'; '.join(report['drift'])}")
+            elif report['drift']:
+                drifted.append(name)
+                for problem in report['drift']:
+                    self.stderr.write(f"Bucket {name} drifted: {problem}")
+            else:
+                self.stdout.write(f"Bucket {name} OK")
+            mark_ready(name, bucket_options)
+
+        if drifted and options['strict']:
+            raise CommandError(f"Drifted buckets: {', '.join(drifted)}")
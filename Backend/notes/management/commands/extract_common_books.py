@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from notes.extraction import schedule_book_extraction
+from notes.models import CommonBook, UploadedFile
+
+
+class Command(BaseCommand):
+    help = "Download active CommonBooks and extract their text into DocumentChunk rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book-id', type=int, action='append', dest='book_ids',
+                            help='Only extract these books (repeatable)')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-extract books that were already extracted')
+
+    def handle(self, *args, **options):
+        books = CommonBook.objects.filter(is_active=True)
+        if options['book_ids']:
+            books = books.filter(id__in=options['book_ids'])
+        if not options['force']:
+            books = books.exclude(extraction_status=UploadedFile.EXTRACTION_DONE)
+
+        futures = []
+        for book in books:
+            try:
+                futures.append((book, schedule_book_extraction(book)))
+            except Exception as e:
+                self.stderr.write(f"Download failed for {book.title}: {e}")
+
+        for book, future in futures:
+            try:
+                chunks = future.result()
+                self.stdout.write(f"Extracted {len(chunks)} chunks from {book.title}")
+            except Exception as e:
+                self.stderr.write(f"Extraction failed for {book.title}: {e}")
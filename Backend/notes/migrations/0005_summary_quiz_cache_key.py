@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_alter_commonbook_subject_alter_uploadedfile_subject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_summary_quiz_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='extraction_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('page', models.PositiveIntegerField(blank=True, null=True)),
+                ('text', models.TextField()),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='notes.uploadedfile')),
+            ],
+            options={
+                'ordering': ['file', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('file', 'index'), name='unique_chunk_index_per_file')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_documentchunk_uploadedfile_extraction_status'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='documentchunk',
+            options={'ordering': ['file', 'book', 'index']},
+        ),
+        migrations.AddField(
+            model_name='commonbook',
+            name='extraction_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='book',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='notes.commonbook'),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='summary_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='documentchunk',
+            name='file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='notes.uploadedfile'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentchunk',
+            constraint=models.UniqueConstraint(fields=('book', 'index'), name='unique_chunk_index_per_book'),
+        ),
+    ]
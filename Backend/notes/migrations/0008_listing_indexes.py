@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_commonbook_chunks_map_summaries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commonbook',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subject', 'grade'], name='commonbook_active_subj_grade'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='quiz_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='summary',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='summary_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['user', '-uploaded_at'], name='uploadedfile_user_uploaded'),
+        ),
+    ]
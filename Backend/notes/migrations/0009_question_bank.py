@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_key', models.CharField(max_length=64)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('question', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bank_questions', to='notes.commonbook')),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bank_questions', to='notes.uploadedfile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['file', 'source_key'], name='bankquestion_file_source'), models.Index(fields=['book', 'source_key'], name='bankquestion_book_source')],
+                'constraints': [models.UniqueConstraint(fields=('file', 'content_hash'), name='unique_bank_question_per_file'), models.UniqueConstraint(fields=('book', 'content_hash'), name='unique_bank_question_per_book')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_question_bank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField()),
+                ('cache_key', models.CharField(db_index=True, max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='shared_summary', to='notes.commonbook')),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -19,6 +20,15 @@ GRADE_CHOICES = [
 ]
 
 class UploadedFile(models.Model):
+    EXTRACTION_PENDING = 'pending'
+    EXTRACTION_DONE = 'done'
+    EXTRACTION_FAILED = 'failed'
+    EXTRACTION_CHOICES = [
+        (EXTRACTION_PENDING, 'Pending'),
+        (EXTRACTION_DONE, 'Done'),
+        (EXTRACTION_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_files')
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -27,6 +37,12 @@ class UploadedFile(models.Model):
     file_name = models.CharField(max_length=255)
     file_url = models.URLField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    extraction_status = models.CharField(max_length=20, choices=EXTRACTION_CHOICES, default=EXTRACTION_PENDING)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-uploaded_at'], name='uploadedfile_user_uploaded'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.subject}-{self.grade})"
@@ -35,7 +51,14 @@ class Summary(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='summaries')
     file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='summaries')
     content = models.TextField()
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)  # AI result cache key
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Matches the (created_at, id) keyset used by the summaries listing
+            models.Index(fields=['user', '-created_at', '-id'], name='summary_user_created'),
+        ]
     
     def __str__(self):
         return f"Summary for {self.file.title} by {self.user.username}"
@@ -44,7 +67,13 @@ class Quiz(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quizzes')
     file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='quizzes')
     questions = models.JSONField()  # Store questions and answers as JSON
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)  # source_key of the question bank it came from
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='quiz_user_created'),
+        ]
     
     def __str__(self):
         return f"Quiz for {self.file.title} by {self.user.username}"
@@ -57,6 +86,72 @@ class CommonBook(models.Model):
     description = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    extraction_status = models.CharField(
+        max_length=20, choices=UploadedFile.EXTRACTION_CHOICES, default=UploadedFile.EXTRACTION_PENDING
+    )
+
+    class Meta:
+        indexes = [
+            # The catalog only ever lists active books, so inactive rows stay out of the index
+            models.Index(fields=['subject', 'grade'], condition=models.Q(is_active=True),
+                         name='commonbook_active_subj_grade'),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.subject}-{self.grade})"
+
+class DocumentChunk(models.Model):
+    # A chunk belongs to either a student's upload or a shared catalog book
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='chunks', null=True, blank=True)
+    book = models.ForeignKey(CommonBook, on_delete=models.CASCADE, related_name='chunks', null=True, blank=True)
+    index = models.PositiveIntegerField()  # Position of the chunk within the document
+    page = models.PositiveIntegerField(null=True, blank=True)
+    text = models.TextField()
+    summary = models.TextField(blank=True)  # Map-phase summary, reused while summary_key matches
+    summary_key = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        ordering = ['file', 'book', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'index'], name='unique_chunk_index_per_file'),
+            models.UniqueConstraint(fields=['book', 'index'], name='unique_chunk_index_per_book'),
+        ]
+
+    def __str__(self):
+        document = self.file or self.book
+        return f"Chunk {self.index} of {document.title}"
+
+class BankQuestion(models.Model):
+    # Question bank of a student's upload or a catalog book; quizzes are sampled from it
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='bank_questions',
+                             null=True, blank=True)
+    book = models.ForeignKey(CommonBook, on_delete=models.CASCADE, related_name='bank_questions',
+                             null=True, blank=True)
+    source_key = models.CharField(max_length=64)  # Model, prompt version and text the question was written from
+    content_hash = models.CharField(max_length=64)  # Normalized question text, for deduplication
+    question = models.JSONField()  # question, options, correct_answer, explanation
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'content_hash'], name='unique_bank_question_per_file'),
+            models.UniqueConstraint(fields=['book', 'content_hash'], name='unique_bank_question_per_book'),
+        ]
+        indexes = [
+            models.Index(fields=['file', 'source_key'], name='bankquestion_file_source'),
+            models.Index(fields=['book', 'source_key'], name='bankquestion_book_source'),
+        ]
+
+    def __str__(self):
+        document = self.file or self.book
+        return f"Bank question for {document.title}"
+
+class BookSummary(models.Model):
+    # Shared summary of a catalog book, precomputed once for every student (manage.py precompute_catalog)
+    book = models.OneToOneField(CommonBook, on_delete=models.CASCADE, related_name='shared_summary')
+    content = models.TextField()
+    cache_key = models.CharField(max_length=64, db_index=True)  # AI result cache key of the text it summarizes
+    created_at = models.DateTimeField(default=timezone.now)  # Reset whenever the summary is regenerated
+
+    def __str__(self):
+        return f"Shared summary of {self.book.title}"
@@ -0,0 +1,109 @@
+"""
+Text extraction that runs inside the extraction process pool.
+
+Nothing in this module touches Django, so spawned worker processes can import
+it without setting up the project. Documents are read one page at a time and
+cut into chunks as they go, but ``extract_chunks`` returns every chunk in one
+list, so a worker holds the document's full text until it hands it back.
+"""
+import os
+
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv')
+
+
+def iter_pages(path, file_name, ocr=False):
+    """Yield ``(page_number, text)`` for each page of the document at ``path``."""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.pdf':
+        yield from _iter_pdf_pages(path, ocr)
+    elif extension == '.docx':
+        yield from _iter_docx_pages(path)
+    elif extension in TEXT_EXTENSIONS:
+        yield from _iter_text_pages(path)
+    # Other formats carry no extractable text
+
+
+def _iter_pdf_pages(path, ocr):
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ''
+        if not text.strip() and ocr:
+            # Scanned page without a text layer
+            text = _ocr_pdf_page(path, number)
+        yield number, text
+
+
+def _ocr_pdf_page(path, number):
+    # OCR is optional: it needs pytesseract, pdf2image and the tesseract/poppler binaries
+    try:
+        import pytesseract
+        from pdf2image import convert_from_path
+    except ImportError:
+        return ''
+    images = convert_from_path(path, first_page=number, last_page=number)
+    return '\n'.join(pytesseract.image_to_string(image) for image in images)
+
+
+def _iter_docx_pages(path, paragraphs_per_page=40):
+    import docx
+
+    # DOCX has no fixed pages; group paragraphs into page-sized blocks instead
+    document = docx.Document(path)
+    buffer = []
+    number = 1
+    for paragraph in document.paragraphs:
+        if paragraph.text.strip():
+            buffer.append(paragraph.text)
+        if len(buffer) >= paragraphs_per_page:
+            yield number, '\n'.join(buffer)
+            buffer = []
+            number += 1
+    if buffer:
+        yield number, '\n'.join(buffer)
+
+
+def _iter_text_pages(path, block_chars=64 * 1024):
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        number = 1
+        while True:
+            text = fh.read(block_chars)
+            if not text:
+                break
+            yield number, text
+            number += 1
+
+
+def split_text(text, chunk_chars):
+    """Split ``text`` into pieces of at most ``chunk_chars``, preferring line and word breaks."""
+    text = text.strip()
+    while len(text) > chunk_chars:
+        cut = text.rfind('\n', 0, chunk_chars)
+        if cut < chunk_chars // 2:
+            cut = text.rfind(' ', 0, chunk_chars)
+        if cut <= 0:
+            cut = chunk_chars
+        yield text[:cut].strip()
+        text = text[cut:].strip()
+    if text:
+        yield text
+
+
+def extract_chunks(path, file_name, chunk_chars, ocr=False):
+    """
+    Return ``[(page_number, text), ...]`` for the document at ``path``.
+
+    ``path`` is a temporary copy owned by the caller's job and is removed here.
+    """
+    chunks = []
+    try:
+        for number, text in iter_pages(path, file_name, ocr):
+            for piece in split_text(text, chunk_chars):
+                chunks.append((number, piece))
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return chunks
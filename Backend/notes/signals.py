@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent once a document's DocumentChunk rows have been (re)written.
+# sender is the owning model (UploadedFile or CommonBook); owner_id is its primary key.
+chunks_extracted = Signal()
@@ -0,0 +1,318 @@
+"""
+Pluggable file storage for uploaded notes.
+
+``NOTES_STORAGE['BACKEND']`` picks the driver: ``supabase``, ``local`` or a
+dotted path to a ``StorageBackend`` subclass. Views call ``upload_file`` and
+``public_url`` and never talk to a driver directly.
+
+- ``supabase`` streams every upload, so files are never read into worker memory
+  in full. Small files are posted straight from Django's upload file. Large
+  files go through Supabase's resumable (TUS) endpoint one fixed-size chunk at a
+  time, so peak memory per upload is bounded by the chunk size. Resumable
+  session URLs are remembered in the shared cache. A retried upload of the same
+  file continues from the last acknowledged offset instead of restarting.
+- ``local`` writes under ``LOCAL_ROOT/<bucket>/``. Each file is written to a
+  temporary file next to its target, fsynced, and renamed into place, so readers
+  never see a partial file. Public buckets are served by ``StoredFileView``.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.module_loading import import_string
+
+from core.metrics import timed
+from core.supabase_client import supabase, SUPABASE_URL, SUPABASE_KEY
+from . import buckets
+
+TUS_VERSION = '1.0.0'
+READ_BLOCK_SIZE = 64 * 1024
+COPY_BLOCK_SIZE = 1024 * 1024
+SESSION_TIMEOUT = 24 * 3600  # Supabase keeps unfinished resumable uploads for a day
+BUCKET_META = '.bucket.json'
+
+
+class UploadError(Exception):
+    pass
+
+
+def _config():
+    config = getattr(settings, 'NOTES_UPLOAD', {})
+    return {
+        'CHUNK_SIZE': config.get('CHUNK_SIZE', 6 * 1024 * 1024),
+        'RESUMABLE_THRESHOLD': config.get('RESUMABLE_THRESHOLD', 6 * 1024 * 1024),
+        'MAX_RETRIES': config.get('MAX_RETRIES', 5),
+        'TIMEOUT': config.get('TIMEOUT', 60),
+    }
+
+
+def _storage_config():
+    config = getattr(settings, 'NOTES_STORAGE', {})
+    return {
+        'BACKEND': config.get('BACKEND', 'supabase'),
+        'LOCAL_ROOT': config.get('LOCAL_ROOT', os.path.join(settings.BASE_DIR, 'storage')),
+        'PUBLIC_BASE_URL': config.get('PUBLIC_BASE_URL', 'http://localhost:8000'),
+        'SENDFILE_HEADER': config.get('SENDFILE_HEADER', ''),
+        'SENDFILE_PREFIX': config.get('SENDFILE_PREFIX', ''),
+    }
+
+
+class StorageBackend:
+    """
+    Drivers implement ``_put``, ``public_url`` and the bucket calls: ``get_bucket``
+    (returns the bucket's options, or None when it is missing), ``create_bucket``
+    and ``update_bucket``.
+    """
+    local = False
+
+    def upload(self, bucket, path, uploaded_file, content_type):
+        with timed('storage'):
+            self._put(bucket, path, uploaded_file, content_type)
+
+
+class SupabaseStorage(StorageBackend):
+    def __init__(self, config):
+        pass
+
+    def _put(self, bucket, path, uploaded_file, content_type):
+        config = _config()
+        if uploaded_file.size > config['RESUMABLE_THRESHOLD']:
+            _resumable_upload(bucket, path, uploaded_file, content_type, config)
+            return
+
+        file_options = {'content-type': content_type}
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            # Spooled to disk by Django: let httpx stream it from there
+            with open(uploaded_file.temporary_file_path(), 'rb') as fh:
+                res = supabase.storage.from_(bucket).upload(path, fh, file_options)
+        else:
+            # In-memory uploads are below FILE_UPLOAD_MAX_MEMORY_SIZE already
+            uploaded_file.seek(0)
+            res = supabase.storage.from_(bucket).upload(path, uploaded_file.read(), file_options)
+        if isinstance(res, dict) and res.get('error'):
+            raise UploadError(res['error']['message'])
+
+    def public_url(self, bucket, path):
+        url = supabase.storage.from_(bucket).get_public_url(path)
+        if isinstance(url, dict):
+            url = url.get('publicURL') or url.get('public_url') or ''
+        return url
+
+    def get_bucket(self, name):
+        try:
+            with timed('storage'):
+                return dict(supabase.storage.get_bucket(name))
+        except Exception:
+            return None
+
+    def create_bucket(self, name, options):
+        with timed('storage'):
+            supabase.storage.create_bucket(name, options=options)
+
+    def update_bucket(self, name, options):
+        with timed('storage'):
+            supabase.storage.update_bucket(name, options)
+
+
+class LocalStorage(StorageBackend):
+    local = True
+
+    def __init__(self, config):
+        self.root = config['LOCAL_ROOT']
+        self.base_url = config['PUBLIC_BASE_URL'].rstrip('/')
+        self.sendfile_header = config['SENDFILE_HEADER']
+        self.sendfile_prefix = config['SENDFILE_PREFIX']
+
+    def path(self, bucket, path):
+        # safe_join rejects anything (``..``, absolute paths) that would escape the bucket,
+        # so a public bucket's URL cannot reach into a private one
+        return safe_join(safe_join(self.root, bucket), path)
+
+    def _write_atomic(self, target, write):
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write(out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.chmod(temp_path, 0o644)  # mkstemp creates 0600; a sendfile-serving proxy must read it
+            os.replace(temp_path, target)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _put(self, bucket, path, uploaded_file, content_type):
+        def write(out):
+            for chunk in uploaded_file.chunks(COPY_BLOCK_SIZE):
+                out.write(chunk)
+
+        self._write_atomic(self.path(bucket, path), write)
+
+    def public_url(self, bucket, path):
+        return self.base_url + reverse('stored-file', args=[bucket, path])
+
+    def get_bucket(self, name):
+        try:
+            with open(self.path(name, BUCKET_META)) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def create_bucket(self, name, options):
+        self.update_bucket(name, options)
+
+    def update_bucket(self, name, options):
+        self._write_atomic(self.path(name, BUCKET_META),
+                           lambda out: out.write(json.dumps(options).encode()))
+
+
+BACKENDS = {
+    'supabase': SupabaseStorage,
+    'local': LocalStorage,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_storage():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = _storage_config()
+                backend_class = BACKENDS.get(config['BACKEND']) or import_string(config['BACKEND'])
+                _backend = backend_class(config)
+    return _backend
+
+
+def reset_storage():
+    """Drop the backend so the next call re-reads settings (tests, benchmarks)."""
+    global _backend
+    _backend = None
+
+
+def upload_file(bucket, path, uploaded_file, content_type=None):
+    """Write ``uploaded_file`` (a Django UploadedFile) to ``bucket``/``path``."""
+    content_type = content_type or getattr(uploaded_file, 'content_type', None) or 'application/octet-stream'
+    buckets.ensure_bucket(bucket)
+    get_storage().upload(bucket, path, uploaded_file, content_type)
+
+
+def public_url(bucket, path):
+    return get_storage().public_url(bucket, path)
+
+
+def _auth_headers():
+    return {
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'apikey': SUPABASE_KEY,
+        'Tus-Resumable': TUS_VERSION,
+    }
+
+
+def _session_key(bucket, path, uploaded_file):
+    # Same destination, size and leading bytes: treat it as the same file
+    uploaded_file.seek(0)
+    head = uploaded_file.read(1024 * 1024)
+    uploaded_file.seek(0)
+    digest = hashlib.sha256(f'{bucket}/{path}:{uploaded_file.size}:'.encode() + head).hexdigest()
+    return f'upload-session:{digest}'
+
+
+def _create_session(http, bucket, path, size, content_type):
+    metadata = {
+        'bucketName': bucket,
+        'objectName': path,
+        'contentType': content_type,
+        'cacheControl': '3600',
+    }
+    response = http.post(f'{SUPABASE_URL}/storage/v1/upload/resumable', headers={
+        **_auth_headers(),
+        'Upload-Length': str(size),
+        'Upload-Metadata': ','.join(
+            f'{key} {base64.b64encode(value.encode()).decode()}' for key, value in metadata.items()
+        ),
+    })
+    if response.status_code != 201:
+        raise UploadError(f'Could not start resumable upload: {response.text}')
+    return str(response.url.join(response.headers['Location']))
+
+
+def _remote_offset(http, location):
+    """Return how many bytes the server has for ``location``, or None if the session is gone."""
+    try:
+        response = http.head(location, headers=_auth_headers())
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200 or 'Upload-Offset' not in response.headers:
+        return None
+    return int(response.headers['Upload-Offset'])
+
+
+def _read_range(uploaded_file, offset, length):
+    # Yield the chunk in small blocks; a single bytes object per chunk would be kept
+    # alive by httpx's request/stream reference cycle until the next GC pass
+    uploaded_file.seek(offset)
+    remaining = length
+    while remaining > 0:
+        data = uploaded_file.read(min(READ_BLOCK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def _resumable_upload(bucket, path, uploaded_file, content_type, config):
+    cache = caches['shared']
+    session_key = _session_key(bucket, path, uploaded_file)
+    size = uploaded_file.size
+
+    with httpx.Client(timeout=config['TIMEOUT']) as http:
+        location = cache.get(session_key)
+        offset = _remote_offset(http, location) if location else None
+        if offset is None:
+            location = _create_session(http, bucket, path, size, content_type)
+            cache.set(session_key, location, timeout=SESSION_TIMEOUT)
+            offset = 0
+
+        retries = 0
+        while offset < size:
+            length = min(config['CHUNK_SIZE'], size - offset)
+            try:
+                response = http.patch(location, content=_read_range(uploaded_file, offset, length), headers={
+                    **_auth_headers(),
+                    'Upload-Offset': str(offset),
+                    'Content-Length': str(length),
+                    'Content-Type': 'application/offset+octet-stream',
+                })
+                response.raise_for_status()
+                offset = int(response.headers['Upload-Offset'])
+                retries = 0
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                retries += 1
+                if retries > config['MAX_RETRIES']:
+                    raise UploadError(f'Upload interrupted at byte {offset} of {size}: {e}') from e
+                time.sleep(min(0.5 * 2 ** retries, 10))
+                # Ask the server how far it got before sending anything again
+                remote = _remote_offset(http, location)
+                if remote is None:
+                    cache.delete(session_key)
+                    raise UploadError('Resumable upload session expired') from e
+                offset = remote
+
+    cache.delete(session_key)
@@ -1,3 +1,382 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from concurrent.futures import Future
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from . import buckets, extraction, storage, views
+from .models import CommonBook, DocumentChunk, UploadedFile
+from .parsers import extract_chunks, split_text
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CommonBooksListingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for title, subject in (('Mechanics', 'Physics'), ('Algebra', 'Maths')):
+            CommonBook.objects.create(title=title, subject=subject, grade='Grade11',
+                                      file_url=f'http://example.com/{title}.pdf')
+
+    def get(self, **params):
+        headers = {'HTTP_IF_NONE_MATCH': params.pop('etag')} if 'etag' in params else {}
+        return self.client.get(reverse('common-books'), params, **headers)
+
+    def test_filters_select_books(self):
+        response = self.get(subject='Physics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['title'] for book in response.json()], ['Mechanics'])
+
+    def test_matching_etag_gets_304(self):
+        etag = self.get(subject='Physics')['ETag']
+        self.assertEqual(self.get(subject='Physics', etag=etag).status_code, 304)
+
+    def test_filters_that_differ_only_in_punctuation_get_distinct_etags(self):
+        etag = self.get(subject='Physics')['ETag']
+        response = self.get(subject='Phys-ics', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_and_empty_filters_share_an_etag(self):
+        self.assertEqual(self.get()['ETag'], self.get(subject='', grade='')['ETag'])
+
+    def test_catalog_change_invalidates_the_etag(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            CommonBook.objects.create(title='Optics', subject='Physics', grade='Grade11',
+                                      file_url='http://example.com/Optics.pdf')
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_etag_changes_only_after_commit(self):
+        etag = self.get()['ETag']
+        book = CommonBook.objects.get(title='Mechanics')
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                book.title = 'Classical mechanics'
+                book.save()
+                # A listing built now reads the old rows, so it must stay under the old version
+                self.assertEqual(self.get()['ETag'], etag)
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Classical mechanics', [book['title'] for book in response.json()])
+
+
+class TextExtractionTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='student', password='secret')
+        self.file = UploadedFile.objects.create(user=user, title='Forces', subject='Physics', grade='Grade11',
+                                                file_name='forces.txt', file_url='http://example.com/forces.txt')
+        # The store pool releases its connection; the test's transaction must stay open
+        for patcher in (mock.patch.object(extraction, 'close_old_connections'),
+                        mock.patch.object(extraction.chunks_extracted, 'send')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_split_text_prefers_line_and_word_breaks(self):
+        text = 'a first line here\nsecond line is longer\n' + 'word ' * 20
+        pieces = list(split_text(text, 30))
+        self.assertTrue(all(len(piece) <= 30 for piece in pieces))
+        self.assertEqual(pieces[:3], ['a first line here', 'second line is longer', 'word word word word word word'])
+        self.assertEqual(' '.join(pieces).split(), text.split())
+
+    def test_extract_chunks_reads_text_files_and_removes_the_copy(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as out:
+            out.write('Forces change motion. ' * 10)
+        chunks = extract_chunks(path, 'forces.txt', 100)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(all(page == 1 and len(text) <= 100 for page, text in chunks))
+        self.assertEqual(' '.join(text for _, text in chunks).split(), ('Forces change motion. ' * 10).split())
+
+    def test_unknown_formats_have_no_text(self):
+        fd, path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        self.assertEqual(extract_chunks(path, 'diagram.png', 100), [])
+
+    def store(self, result=None, error=None):
+        future = Future()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        extraction._store_chunks(UploadedFile, self.file.id, future)
+        self.file.refresh_from_db()
+
+    def test_stored_chunks_replace_the_previous_extraction(self):
+        DocumentChunk.objects.create(file=self.file, index=0, page=1, text='Old text')
+        self.store([(1, 'New text'), (2, 'More text')])
+        self.assertEqual(list(DocumentChunk.objects.filter(file=self.file).order_by('index')
+                              .values_list('page', 'text')), [(1, 'New text'), (2, 'More text')])
+        self.assertEqual(self.file.extraction_status, UploadedFile.EXTRACTION_DONE)
+        extraction.chunks_extracted.send.assert_called_once_with(sender=UploadedFile, owner_id=self.file.id)
+
+    def test_failed_extraction_is_recorded(self):
+        with self.assertLogs('notes.extraction', 'ERROR'):
+            self.store(error=ValueError('not a PDF'))
+        self.assertEqual(self.file.extraction_status, UploadedFile.EXTRACTION_FAILED)
+        self.assertFalse(DocumentChunk.objects.filter(file=self.file).exists())
+
+
+class FakeTusServer:
+    """Supabase's resumable upload endpoint, keeping the bytes of one session in memory."""
+
+    def __init__(self, fail_patch=None):
+        self.data = bytearray()
+        self.sessions = 0
+        self.patches = 0
+        self.fail_patch = fail_patch
+
+    def __call__(self, request):
+        if request.method == 'POST':
+            self.sessions += 1
+            self.data = bytearray()
+            return httpx.Response(201, headers={'Location': '/storage/v1/upload/resumable/session'})
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'Upload-Offset': str(len(self.data))})
+        self.patches += 1
+        if self.patches == self.fail_patch:
+            return httpx.Response(503)
+        if int(request.headers['Upload-Offset']) != len(self.data):
+            return httpx.Response(409)
+        self.data += request.read()
+        return httpx.Response(204, headers={'Upload-Offset': str(len(self.data))})
+
+
+@override_settings(CACHES=LOCAL_CACHES,
+                   NOTES_UPLOAD={'CHUNK_SIZE': 1000, 'RESUMABLE_THRESHOLD': 1500, 'MAX_RETRIES': 0})
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.content = bytes(range(256)) * 14  # 3584 bytes: four chunks
+        self.server = FakeTusServer()
+        client = httpx.Client
+        for patcher in (
+            mock.patch.object(storage.httpx, 'Client',
+                              lambda **kwargs: client(transport=httpx.MockTransport(self.server), **kwargs)),
+            mock.patch.object(storage, 'SUPABASE_URL', 'https://supabase.test'),
+            mock.patch.object(storage.time, 'sleep'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self):
+        uploaded_file = SimpleUploadedFile('notes.pdf', self.content, content_type='application/pdf')
+        storage.SupabaseStorage({})._put('uploads', 'student/notes.pdf', uploaded_file, 'application/pdf')
+
+    def test_large_file_is_sent_in_chunks(self):
+        self.upload()
+        self.assertEqual(bytes(self.server.data), self.content)
+        self.assertEqual((self.server.sessions, self.server.patches), (1, 4))
+        # A finished upload forgets its session, so the next upload of this file starts afresh
+        self.upload()
+        self.assertEqual(self.server.sessions, 2)
+
+    def test_interrupted_upload_resumes_from_the_acknowledged_offset(self):
+        self.server.fail_patch = 2
+        with self.assertRaises(storage.UploadError):
+            self.upload()
+        self.assertEqual(len(self.server.data), 1000)
+
+        self.upload()
+        self.assertEqual(bytes(self.server.data), self.content)
+        self.assertEqual(self.server.sessions, 1)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class LocalStorageTestCase(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        settings_override = override_settings(NOTES_STORAGE={
+            'BACKEND': 'local', 'LOCAL_ROOT': self.root, 'PUBLIC_BASE_URL': 'http://testserver'
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['shared'].clear()
+        storage.reset_storage()
+        self.addCleanup(storage.reset_storage)
+        buckets._ready.clear()
+        self.addCleanup(buckets._ready.clear)
+
+
+class BucketBootstrapTests(LocalStorageTestCase):
+    def test_bucket_is_created_and_checked_once_per_process(self):
+        backend = storage.get_storage()
+        with mock.patch.object(backend, 'get_bucket', wraps=backend.get_bucket) as get_bucket:
+            buckets.ensure_bucket('uploads')
+            buckets.ensure_bucket('uploads')
+        self.assertEqual(get_bucket.call_count, 1)
+        self.assertEqual(backend.get_bucket('uploads'), {'public': True})
+
+    def test_deploy_marker_lets_new_processes_skip_the_check(self):
+        call_command('bootstrap_storage', stdout=StringIO())
+        buckets._ready.clear()  # A freshly started worker
+        with mock.patch.object(storage.get_storage(), 'get_bucket') as get_bucket:
+            buckets.ensure_bucket('uploads')
+        get_bucket.assert_not_called()
+
+    def test_drift_is_logged_not_raised(self):
+        storage.get_storage().create_bucket('uploads', {'public': False})
+        with self.assertLogs('notes.buckets', 'WARNING') as logs:
+            buckets.ensure_bucket('uploads')
+        self.assertIn('public: expected True, found False', logs.output[0])
+        self.assertIn('uploads', buckets._ready)
+
+    def test_failed_check_is_retried_on_the_next_upload(self):
+        backend = storage.get_storage()
+        with mock.patch.object(backend, 'get_bucket', side_effect=OSError('unreachable')), \
+                self.assertLogs('notes.buckets', 'ERROR'):
+            buckets.ensure_bucket('uploads')
+        self.assertNotIn('uploads', buckets._ready)
+        buckets.ensure_bucket('uploads')
+        self.assertIn('uploads', buckets._ready)
+
+    def test_command_fixes_drift(self):
+        storage.get_storage().create_bucket('uploads', {'public': False})
+        out = StringIO()
+        call_command('bootstrap_storage', fix=True, stdout=out)
+        self.assertIn('Updated bucket uploads', out.getvalue())
+        self.assertEqual(storage.get_storage().get_bucket('uploads'), {'public': True})
+
+
+class LocalStorageTests(LocalStorageTestCase):
+    def put(self, bucket, path, content=b'Newton\'s laws'):
+        storage.get_storage().upload(bucket, path, SimpleUploadedFile('notes.txt', content), 'text/plain')
+        return storage.public_url(bucket, path)
+
+    def test_stored_file_is_served_from_its_public_url(self):
+        url = self.put('uploads', 'student/notes.txt')
+        self.assertTrue(url.startswith('http://testserver/'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b"Newton's laws")
+        self.assertIn('Last-Modified', response)
+
+    def test_unchanged_file_is_not_sent_again(self):
+        url = self.put('uploads', 'student/notes.txt')
+        mtime = os.stat(os.path.join(self.root, 'uploads', 'student', 'notes.txt')).st_mtime
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(mtime))
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(NOTES_STORAGE_BUCKETS={'uploads': {'public': True}, 'private': {'public': False}})
+    def test_only_files_of_public_buckets_are_served(self):
+        self.put('uploads', 'student/notes.txt')
+        self.put('private', 'student/notes.txt')
+        storage.get_storage().create_bucket('uploads', {'public': True})
+        for path in ['private/student/notes.txt', 'uploads/.bucket.json', 'uploads/student/missing.txt',
+                     'uploads/student/../../private/student/notes.txt', 'unknown/student/notes.txt']:
+            with self.subTest(path):
+                self.assertEqual(self.client.get(f'/api/notes/storage/{path}').status_code, 404)
+
+    def test_sendfile_header_hands_the_file_to_the_web_server(self):
+        with self.settings(NOTES_STORAGE={'BACKEND': 'local', 'LOCAL_ROOT': self.root,
+                                          'SENDFILE_HEADER': 'X-Accel-Redirect', 'SENDFILE_PREFIX': '/protected/'}):
+            storage.reset_storage()
+            url = self.put('uploads', 'student/notes.txt')
+            response = self.client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/uploads/student/notes.txt')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content, b'')
+
+    def test_failed_write_leaves_neither_file_nor_temporary(self):
+        self.put('uploads', 'student/notes.txt', b'first version')
+
+        def failing(out):
+            out.write(b'half of the second')
+            raise OSError('disk full')
+
+        target = os.path.join(self.root, 'uploads', 'student', 'notes.txt')
+        with self.assertRaises(OSError):
+            storage.get_storage()._write_atomic(target, failing)
+        with open(target, 'rb') as fh:
+            self.assertEqual(fh.read(), b'first version')
+        self.assertEqual(os.listdir(os.path.dirname(target)), ['notes.txt'])
+
+    def test_nothing_is_served_with_the_supabase_backend(self):
+        url = self.put('uploads', 'student/notes.txt')
+        with self.settings(NOTES_STORAGE={'BACKEND': 'supabase'}):
+            storage.reset_storage()
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class BatchFileUploadTests(LocalStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='student', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch.object(views, 'schedule_extraction')
+        self.schedule_extraction = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, names, **data):
+        files = [SimpleUploadedFile(name, f'Contents of {name}'.encode()) for name in names]
+        return self.client.post(reverse('file-upload-batch'),
+                                {'files': files, 'subject': 'Physics', 'grade': 'Grade11', **data},
+                                format='multipart')
+
+    def stored(self, name):
+        with open(os.path.join(self.root, 'uploads', 'student', 'Grade11', 'Physics', name), 'rb') as fh:
+            return fh.read()
+
+    def test_every_file_is_stored_and_recorded(self):
+        response = self.post(['a.txt', 'b.txt'], metadata=json.dumps([{'title': 'First'}, {}]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['status'] for row in response.data['files']], ['created', 'created'])
+        self.assertEqual(sorted(UploadedFile.objects.values_list('title', flat=True)), ['First', 'b.txt'])
+        self.assertEqual(self.stored('b.txt'), b'Contents of b.txt')
+        self.assertEqual(self.schedule_extraction.call_count, 2)
+
+    def test_invalid_entry_rejects_the_whole_batch(self):
+        response = self.post(['a.txt', 'b.txt'], metadata=json.dumps([{}, {'grade': 'Grade99'}]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['files'], [{'index': 1, 'file_name': 'b.txt', 'error': 'Invalid grade.'}])
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'uploads', 'student')))
+
+    def test_duplicate_names_are_rejected(self):
+        response = self.post(['a.txt', 'a.txt'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['files'][0]['index'], 1)
+
+    def test_failed_upload_is_reported_per_file(self):
+        upload_file = views.upload_file
+
+        def failing(bucket, path, uploaded_file):
+            if uploaded_file.name == 'b.txt':
+                raise storage.UploadError('storage unavailable')
+            upload_file(bucket, path, uploaded_file)
+
+        with mock.patch.object(views, 'upload_file', failing):
+            response = self.post(['a.txt', 'b.txt'])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([row['status'] for row in response.data['files']], ['created', 'failed'])
+        self.assertIn('storage unavailable', response.data['files'][1]['error'])
+        self.assertEqual(list(UploadedFile.objects.values_list('file_name', flat=True)), ['a.txt'])
+
+    @override_settings(NOTES_UPLOAD={'BATCH_MAX_FILES': 2})
+    def test_batch_size_is_limited(self):
+        response = self.post(['a.txt', 'b.txt', 'c.txt'])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
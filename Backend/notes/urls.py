@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import FileUploadView, GetUserFilesView, GetCommonBooksView
+from .views import FileUploadView, BatchFileUploadView, GetUserFilesView, GetCommonBooksView, StoredFileView
 
 urlpatterns = [
     path('upload/', FileUploadView.as_view(), name='file-upload'),
+    path('upload/batch/', BatchFileUploadView.as_view(), name='file-upload-batch'),
     path('files/', GetUserFilesView.as_view(), name='user-files'),
     path('common-books/', GetCommonBooksView.as_view(), name='common-books'),
+    path('storage/<str:bucket>/<path:path>', StoredFileView.as_view(), name='stored-file'),
 ]
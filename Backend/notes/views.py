@@ -2,12 +2,48 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.conf import settings
-from supabase import create_client
-from core.supabase_client import supabase as supabase_client_singleton
-from .models import UploadedFile, CommonBook
-from .serializers import UploadedFileSerializer, CommonBookSerializer
+from .models import UploadedFile, SUBJECT_CHOICES, GRADE_CHOICES
+from .serializers import UploadedFileSerializer
+from .extraction import schedule_extraction
+from .storage import upload_file, public_url, get_storage
+from .buckets import configured_buckets
+from .catalog import get_catalog_version, get_catalog_listing, version_timestamp
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from users.authentication import SupabaseJWTAuthentication
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import hashlib
+import json
+import mimetypes
+import os
 import re
 
+BUCKET_NAME = "uploads"
+
+
+def sanitize(segment: str) -> str:
+    # Keep storage paths free of characters Supabase rejects
+    return re.sub(r"[^A-Za-z0-9._-]", "-", segment.strip())
+
+
+def storage_path(username, grade, subject, filename):
+    # Organize file path: username/grade/subject/filename
+    return f"{sanitize(username)}/{sanitize(grade)}/{sanitize(subject)}/{sanitize(filename)}"
+
+
+def schedule_or_mark_failed(file_record, uploaded_file):
+    # Extract text once, off the request thread, for the AI endpoints to reuse
+    try:
+        schedule_extraction(file_record, uploaded_file)
+    except Exception:
+        UploadedFile.objects.filter(id=file_record.id).update(extraction_status=UploadedFile.EXTRACTION_FAILED)
+        file_record.extraction_status = UploadedFile.EXTRACTION_FAILED
+
+
 class FileUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -28,41 +64,16 @@ class FileUploadView(APIView):
         if grade not in dict(UploadedFile._meta.get_field('grade').choices):
             return Response({'error': 'Invalid grade.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Use shared Supabase client
-        supabase_client = supabase_client_singleton
-
-        # Organize file path: username/grade/subject/filename (sanitize to avoid invalid characters)
-        def sanitize(segment: str) -> str:
-            return re.sub(r"[^A-Za-z0-9._-]", "-", segment.strip())
-
-        safe_user = sanitize(request.user.username)
-        safe_grade = sanitize(grade)
-        safe_subject = sanitize(subject)
-        safe_filename = sanitize(uploaded_file.name)
-
-        file_path = f"{safe_user}/{safe_grade}/{safe_subject}/{safe_filename}"
-        bucket_name = "uploads"
+        file_path = storage_path(request.user.username, grade, subject, uploaded_file.name)
+        bucket_name = BUCKET_NAME
 
-        # Ensure bucket exists (idempotent)
+        # Upload file (streamed in chunks; large files use resumable uploads).
+        # The bucket itself is checked once per process, see notes.buckets
         try:
-            # Create bucket if missing (idempotent). If it already exists, ignore error.
-            supabase_client.storage.create_bucket(bucket_name, public=True)
-        except Exception:
-            pass
-
-        # Upload file
-        try:
-            res = supabase_client.storage.from_(bucket_name).upload(file_path, uploaded_file.read())
-            if isinstance(res, dict) and res.get("error"):
-                return Response({'error': res["error"]["message"]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            upload_file(bucket_name, file_path, uploaded_file)
         except Exception as e:
             return Response({'error': f'Upload failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Get public URL
-        public_url = supabase_client.storage.from_(bucket_name).get_public_url(file_path)
-        if isinstance(public_url, dict):
-            public_url = public_url.get('publicURL') or public_url.get('public_url') or ''
-
         # Save metadata
         file_record = UploadedFile.objects.create(
             user=request.user,
@@ -71,12 +82,121 @@ class FileUploadView(APIView):
             subject=subject,
             grade=grade,
             file_name=uploaded_file.name,
-            file_url=public_url
+            file_url=public_url(bucket_name, file_path)
         )
 
+        schedule_or_mark_failed(file_record, uploaded_file)
+
         serializer = UploadedFileSerializer(file_record)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+class BatchFileUploadView(APIView):
+    """
+    Uploads many files in one request.
+
+    Send the files as repeated ``files`` parts. Batch-wide ``subject``, ``grade`` and
+    ``description`` fields apply to every file. An optional ``metadata`` field holds a
+    JSON list, one object per file in the same order, whose values override them.
+    A missing ``title`` defaults to the file name. Each entry is validated before
+    anything is uploaded. Files go to storage concurrently, and the rows are created
+    with a single bulk insert. The response reports the outcome of every file.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        files = request.FILES.getlist('files')
+        config = getattr(settings, 'NOTES_UPLOAD', {})
+        max_files = config.get('BATCH_MAX_FILES', 50)
+        if not files:
+            return Response({'error': 'At least one file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) > max_files:
+            return Response({'error': f'At most {max_files} files can be uploaded at once.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            metadata = json.loads(request.data.get('metadata') or '[]')
+        except ValueError:
+            return Response({'error': 'metadata must be a JSON list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(metadata, list) or not all(isinstance(item, dict) for item in metadata) \
+                or len(metadata) not in (0, len(files)):
+            return Response({'error': 'metadata must be a list with one object per file.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        defaults = {
+            'subject': request.data.get('subject'),
+            'grade': request.data.get('grade'),
+            'description': request.data.get('description', ''),
+        }
+        subjects, grades = dict(SUBJECT_CHOICES), dict(GRADE_CHOICES)
+        items, errors, paths = [], [], set()
+        for index, uploaded_file in enumerate(files):
+            entry = {**defaults, 'title': uploaded_file.name, **(metadata[index] if metadata else {})}
+            if any(not isinstance(entry[key] or '', str) for key in ('subject', 'grade', 'title', 'description')):
+                errors.append({'index': index, 'file_name': uploaded_file.name, 'error': 'Metadata values must be strings.'})
+                continue
+            file_path = storage_path(request.user.username, entry['grade'] or '', entry['subject'] or '',
+                                     uploaded_file.name)
+            if entry['subject'] not in subjects:
+                errors.append({'index': index, 'file_name': uploaded_file.name, 'error': 'Invalid subject.'})
+            elif entry['grade'] not in grades:
+                errors.append({'index': index, 'file_name': uploaded_file.name, 'error': 'Invalid grade.'})
+            elif not entry['title'] or len(entry['title']) > 255:
+                errors.append({'index': index, 'file_name': uploaded_file.name, 'error': 'Invalid title.'})
+            elif file_path in paths:
+                errors.append({'index': index, 'file_name': uploaded_file.name,
+                               'error': 'Duplicate file name for this subject and grade.'})
+            paths.add(file_path)
+            items.append((uploaded_file, entry, file_path))
+
+        # Nothing is uploaded unless the whole batch is valid
+        if errors:
+            return Response({'error': 'Invalid files in batch.', 'files': errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        def upload(item):
+            uploaded_file, entry, file_path = item
+            try:
+                upload_file(BUCKET_NAME, file_path, uploaded_file)
+                return None
+            except Exception as e:
+                return str(e)
+
+        # Each upload runs in a copy of this request's context, so its storage time is attributed to it
+        with ThreadPoolExecutor(max_workers=config.get('BATCH_CONCURRENCY', 4)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, upload, item) for item in items]
+            upload_errors = [future.result() for future in futures]
+
+        records, uploaded = [], []
+        for (uploaded_file, entry, file_path), error in zip(items, upload_errors):
+            if error is None:
+                records.append(UploadedFile(
+                    user=request.user,
+                    title=entry['title'],
+                    description=entry['description'] or '',
+                    subject=entry['subject'],
+                    grade=entry['grade'],
+                    file_name=uploaded_file.name,
+                    file_url=public_url(BUCKET_NAME, file_path),
+                ))
+                uploaded.append(uploaded_file)
+        records = UploadedFile.objects.bulk_create(records)
+        for file_record, uploaded_file in zip(records, uploaded):
+            schedule_or_mark_failed(file_record, uploaded_file)
+
+        created = iter(records)
+        results = []
+        for index, ((uploaded_file, entry, file_path), error) in enumerate(zip(items, upload_errors)):
+            if error is None:
+                results.append({'index': index, 'file_name': uploaded_file.name, 'status': 'created',
+                                'file': UploadedFileSerializer(next(created)).data})
+            else:
+                results.append({'index': index, 'file_name': uploaded_file.name, 'status': 'failed',
+                                'error': f'Upload failed: {error}'})
+
+        all_created = len(records) == len(items)
+        return Response({'files': results},
+                        status=status.HTTP_201_CREATED if all_created else status.HTTP_207_MULTI_STATUS)
+
 class GetUserFilesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -86,18 +206,72 @@ class GetUserFilesView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class GetCommonBooksView(APIView):
+    """
+    Lists active catalog books, optionally filtered by ``subject``/``grade``.
+
+    Listings come pre-rendered from the versioned catalog cache and carry ETag and
+    Last-Modified headers; a matching conditional request gets a 304 without any
+    database access (the stateless SimpleJWT check below skips the user lookup as well).
+    """
     permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [SupabaseJWTAuthentication, JWTStatelessUserAuthentication]
     
     def get(self, request):
         subject = request.query_params.get('subject')
         grade = request.query_params.get('grade')
-        
-        books = CommonBook.objects.filter(is_active=True)
-        
-        if subject:
-            books = books.filter(subject=subject)
-        if grade:
-            books = books.filter(grade=grade)
-            
-        serializer = CommonBookSerializer(books, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+        version = get_catalog_version()
+        # Missing and empty filters list the same books; hashing the pair keeps distinct values distinct
+        filters = json.dumps([subject or '', grade or ''], ensure_ascii=False)
+        etag = quote_etag(f"catalog-{version}-{hashlib.sha256(filters.encode('utf-8')).hexdigest()[:16]}")
+        last_modified = int(version_timestamp(version))
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(get_catalog_listing(version, subject, grade), content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class StoredFileView(APIView):
+    """
+    Serves files from public buckets of the ``local`` storage backend (Supabase serves its own).
+
+    With ``NOTES_STORAGE['SENDFILE_HEADER']`` set, the response is empty and the web server
+    in front sends the file (nginx ``X-Accel-Redirect``, Apache/lighttpd ``X-Sendfile``).
+    Otherwise ``FileResponse`` streams it in blocks: WSGI servers that provide
+    ``wsgi.file_wrapper`` (gunicorn, uWSGI) hand the open file to ``sendfile(2)``.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    block_size = 512 * 1024
+
+    def get(self, request, bucket, path):
+        backend = get_storage()
+        if not backend.local or not configured_buckets().get(bucket, {}).get('public'):
+            raise Http404
+        try:
+            full_path = backend.path(bucket, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if os.path.basename(full_path).startswith('.'):  # Bucket metadata and in-flight uploads
+            raise Http404
+        try:
+            stat = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise Http404
+
+        last_modified = int(stat.st_mtime)
+        response = get_conditional_response(request, last_modified=last_modified)
+        if response is None:
+            if backend.sendfile_header:
+                content_type, _ = mimetypes.guess_type(full_path)
+                response = HttpResponse(content_type=content_type or 'application/octet-stream')
+                response[backend.sendfile_header] = backend.sendfile_prefix + f"{bucket}/{path}"
+            else:
+                response = FileResponse(open(full_path, 'rb'))
+                response.block_size = self.block_size
+        response['Last-Modified'] = http_date(last_modified)
+        return response
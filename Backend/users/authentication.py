@@ -0,0 +1,155 @@
+"""
+DRF authentication for Supabase-issued access tokens.
+
+Tokens are verified locally. Projects using the legacy shared secret are
+checked with HS256 against ``SUPABASE_JWT_SECRET``. Projects using asymmetric
+signing keys are checked against the project's JWKS. The key set is fetched
+once, kept in memory and fetched again only when a token names a key id it
+does not know, which is what happens after a key rotation. Authenticated
+requests therefore never wait on Supabase.
+
+Tokens from other issuers (our own SimpleJWT tokens) are left to the next
+authentication class.
+"""
+import json
+import logging
+import threading
+import time
+import urllib.request
+
+import jwt
+from django.conf import settings
+from rest_framework import authentication, exceptions
+
+from core.metrics import timed
+
+from .identity import get_user_for_supabase
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+
+def _config():
+    config = getattr(settings, 'SUPABASE_AUTH', {})
+    issuer = config.get('ISSUER') or f"{(settings.SUPABASE_URL or '').rstrip('/')}/auth/v1"
+    return {
+        'JWT_SECRET': config.get('JWT_SECRET', ''),
+        'ISSUER': issuer,
+        'AUDIENCE': config.get('AUDIENCE', 'authenticated'),
+        'JWKS_URL': config.get('JWKS_URL') or f'{issuer}/.well-known/jwks.json',
+        'JWKS_CACHE_SECONDS': config.get('JWKS_CACHE_SECONDS', 600),
+        'JWKS_MIN_REFRESH_SECONDS': config.get('JWKS_MIN_REFRESH_SECONDS', 30),
+        'LEEWAY': config.get('LEEWAY', 30),
+    }
+
+
+class JWKSCache:
+    """Signing keys by ``kid``; a miss refreshes the set at most once per ``min_refresh`` seconds."""
+
+    def __init__(self):
+        self._keys = {}
+        self._fetched_at = float('-inf')
+        self._attempted_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _fetch(self, url):
+        request = urllib.request.Request(url, headers={'Accept': 'application/json'})
+        with timed('auth'), urllib.request.urlopen(request, timeout=10) as response:
+            jwks = json.load(response)
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            try:
+                keys[jwk.get('kid')] = jwt.PyJWK(jwk)
+            except jwt.PyJWKError:
+                logger.warning('Ignoring unusable JWK %s', jwk.get('kid'))
+        return keys
+
+    def get(self, kid, config):
+        key = self._keys.get(kid)
+        if key is not None and time.monotonic() - self._fetched_at < config['JWKS_CACHE_SECONDS']:
+            return key
+        with self._lock:
+            now = time.monotonic()
+            # Unknown key ids cannot make us hammer Supabase; another thread may also have just refreshed
+            if now - self._attempted_at >= config['JWKS_MIN_REFRESH_SECONDS']:
+                self._attempted_at = now
+                try:
+                    self._keys = self._fetch(config['JWKS_URL'])
+                    self._fetched_at = now
+                except Exception:
+                    # Keep serving the known keys if Supabase is briefly unreachable
+                    logger.exception('Could not refresh Supabase JWKS')
+            return self._keys.get(kid)
+
+
+jwks_cache = JWKSCache()
+
+
+def is_supabase_token(token, config=None):
+    config = config or _config()
+    try:
+        claims = jwt.decode(token, options={'verify_signature': False})
+    except jwt.InvalidTokenError:
+        return False
+    return claims.get('iss') == config['ISSUER']
+
+
+def verify_supabase_token(token):
+    """Return the verified claims of a Supabase access token; raises ``jwt.InvalidTokenError``."""
+    config = _config()
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get('alg')
+    if algorithm == 'HS256':
+        if not config['JWT_SECRET']:
+            raise jwt.InvalidTokenError('SUPABASE_JWT_SECRET is not configured')
+        key = config['JWT_SECRET']
+    elif algorithm in ASYMMETRIC_ALGORITHMS:
+        key = jwks_cache.get(header.get('kid'), config)
+        if key is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+    else:
+        raise jwt.InvalidTokenError('Unsupported algorithm')
+
+    return jwt.decode(
+        token, key, algorithms=[algorithm], audience=config['AUDIENCE'], issuer=config['ISSUER'],
+        leeway=config['LEEWAY'], options={'require': ['exp', 'sub', 'iss']},
+    )
+
+
+def user_for_claims(claims):
+    try:
+        return get_user_for_supabase(claims['sub'], claims.get('email'))
+    except ValueError:
+        raise exceptions.AuthenticationFailed('Token subject is not a Supabase user id')
+
+
+class SupabaseJWTAuthentication(authentication.BaseAuthentication):
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        parts = authentication.get_authorization_header(request).split()
+        if len(parts) != 2:
+            return None
+        try:
+            keyword, token = parts[0].decode(), parts[1].decode()
+        except UnicodeDecodeError:
+            return None
+        if keyword.lower() != self.keyword.lower():
+            return None
+
+        config = _config()
+        if not is_supabase_token(token, config):
+            return None
+        try:
+            claims = verify_supabase_token(token)
+        except jwt.InvalidTokenError as e:
+            raise exceptions.AuthenticationFailed(f'Invalid Supabase token: {e}')
+
+        user = user_for_claims(claims)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User is inactive')
+        return user, claims
+
+    def authenticate_header(self, request):
+        return f'{self.keyword} realm="api"'
@@ -0,0 +1,75 @@
+"""
+Supabase user id -> Django user mapping.
+
+After the first login every lookup is one primary-key query on
+SupabaseIdentity, joined to the user. Hot mappings are also kept in a
+short-lived in-process cache, so repeated logins and authenticated requests
+skip the database entirely. Saving or deleting a user evicts that user's entry.
+"""
+import copy
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.lru import LRUCache
+from .models import SupabaseIdentity
+
+User = get_user_model()
+
+
+def _config():
+    config = getattr(settings, 'SUPABASE_AUTH', {})
+    return config.get('IDENTITY_CACHE_MAX_ENTRIES', 10000), config.get('IDENTITY_CACHE_SECONDS', 300)
+
+
+identity_cache = LRUCache(*_config())
+_cached_ids_by_user = {}
+_cached_ids_lock = threading.Lock()
+
+
+def _remember(supabase_id, user):
+    identity_cache.set(supabase_id, user)
+    with _cached_ids_lock:
+        _cached_ids_by_user.setdefault(user.pk, set()).add(supabase_id)
+
+
+def _link(supabase_id, email):
+    with transaction.atomic():
+        # First login since identities were tracked: adopt the account paired by email before
+        user = User.objects.filter(email=email).first() if email else None
+        if user is None:
+            user, _ = User.objects.get_or_create(username=email or str(supabase_id), defaults={'email': email or ''})
+    # One upsert keyed by supabase_id: if a concurrent login linked first its user wins, only the email is refreshed
+    identity, _ = SupabaseIdentity.objects.update_or_create(
+        supabase_id=supabase_id, defaults={'email': email} if email else {},
+        create_defaults={'user': user, 'email': email or ''}
+    )
+    return identity.user
+
+
+def get_user_for_supabase(supabase_id, email=None):
+    """Return the Django user for a Supabase user id, linking or creating one on first sight."""
+    supabase_id = uuid.UUID(str(supabase_id))
+    user = identity_cache.get(supabase_id)
+    if user is not None:
+        # Each caller gets its own instance; the cached one is never handed out
+        return copy.copy(user)
+
+    identity = SupabaseIdentity.objects.select_related('user').filter(supabase_id=supabase_id).first()
+    user = identity.user if identity is not None else _link(supabase_id, email)
+    _remember(supabase_id, copy.copy(user))
+    return user
+
+
+@receiver(post_save, sender=User, dispatch_uid='users.identity.user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='users.identity.user_deleted')
+def evict_user(sender, instance, **kwargs):
+    with _cached_ids_lock:
+        supabase_ids = _cached_ids_by_user.pop(instance.pk, ())
+    for supabase_id in supabase_ids:
+        identity_cache.delete(supabase_id)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+    help = ("Delete expired outstanding and blacklisted refresh tokens in small batches, "
+            "so the blacklist tables stay small without long-running deletes. Run it from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Pause between batches (seconds)')
+
+    def handle(self, *args, **options):
+        cutoff = aware_utcnow()
+        deleted = 0
+        last_id = 0
+        while True:
+            # Walk the primary key upwards: expired tokens are the oldest rows, so each
+            # batch is found near the start of the index instead of by a full scan
+            ids = list(OutstandingToken.objects.filter(id__gt=last_id, expires_at__lte=cutoff)
+                       .order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            last_id = ids[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(f"Pruned {deleted} expired tokens")
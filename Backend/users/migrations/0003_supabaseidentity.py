@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_remove_usersettings_user_delete_studystreak_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupabaseIdentity',
+            fields=[
+                ('supabase_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supabase_identities', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,4 +1,14 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
-User = get_user_model()
\ No newline at end of file
+User = get_user_model()
+
+class SupabaseIdentity(models.Model):
+    """Links a Supabase Auth user, by its id, to the Django user the API works with."""
+    supabase_id = models.UUIDField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='supabase_identities')
+    email = models.EmailField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.email or self.supabase_id} -> {self.user_id}"
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from .models import User
+from .tokens import RefreshToken
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,4 +30,7 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
- 
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    # Blacklist checks go through the in-process Bloom filter (users.token_filter)
+    token_class = RefreshToken
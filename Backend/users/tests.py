@@ -1,3 +1,177 @@
-from django.test import TestCase
+import time
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from . import authentication, identity
+from .models import SupabaseIdentity
+from .token_filter import BloomFilter, blacklist_filter
+from .tokens import RefreshToken
+
+ISSUER = 'https://project.supabase.co/auth/v1'
+
+
+class SupabaseIdentityTests(TestCase):
+    def setUp(self):
+        identity.identity_cache.clear()
+        self.addCleanup(identity.identity_cache.clear)
+        self.supabase_id = uuid.uuid4()
+
+    def test_first_login_creates_and_links_a_user(self):
+        user = identity.get_user_for_supabase(self.supabase_id, 'student@example.com')
+        self.assertEqual((user.username, user.email), ('student@example.com', 'student@example.com'))
+        self.assertEqual(SupabaseIdentity.objects.get().user, user)
+
+    def test_existing_account_is_adopted_by_email(self):
+        existing = User.objects.create_user(username='student', email='student@example.com')
+        self.assertEqual(identity.get_user_for_supabase(self.supabase_id, 'student@example.com'), existing)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_repeat_lookups_are_served_from_the_cache(self):
+        user = identity.get_user_for_supabase(self.supabase_id, 'student@example.com')
+        with self.assertNumQueries(0):
+            cached = identity.get_user_for_supabase(str(self.supabase_id))
+        self.assertEqual(cached, user)
+        self.assertIsNot(cached, identity.get_user_for_supabase(self.supabase_id))
+
+    def test_identity_linked_concurrently_keeps_its_user(self):
+        winner = User.objects.create_user(username='winner')
+        SupabaseIdentity.objects.create(supabase_id=self.supabase_id, user=winner)
+        self.assertEqual(identity._link(self.supabase_id, 'student@example.com'), winner)
+        self.assertEqual(SupabaseIdentity.objects.get().email, 'student@example.com')
+
+    def test_saving_a_user_evicts_its_cached_identity(self):
+        user = identity.get_user_for_supabase(self.supabase_id, 'student@example.com')
+        user.first_name = 'Ada'
+        user.save()
+        self.assertEqual(identity.get_user_for_supabase(self.supabase_id).first_name, 'Ada')
+
+
+@override_settings(SUPABASE_AUTH={'JWT_SECRET': 'secret', 'ISSUER': ISSUER, 'JWKS_MIN_REFRESH_SECONDS': 30})
+class SupabaseJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        identity.identity_cache.clear()
+        self.addCleanup(identity.identity_cache.clear)
+        self.jwks = authentication.JWKSCache()
+        patcher = mock.patch.object(authentication, 'jwks_cache', self.jwks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.supabase_id = str(uuid.uuid4())
+
+    def claims(self, **overrides):
+        claims = {'sub': self.supabase_id, 'email': 'student@example.com', 'iss': ISSUER,
+                  'aud': 'authenticated', 'exp': int(time.time()) + 3600}
+        claims.update(overrides)
+        return claims
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return authentication.SupabaseJWTAuthentication().authenticate(request)
+
+    def test_valid_token_is_verified_locally_and_links_a_user(self):
+        user, claims = self.authenticate(jwt.encode(self.claims(), 'secret', algorithm='HS256'))
+        self.assertEqual(user.email, 'student@example.com')
+        self.assertEqual(claims['sub'], self.supabase_id)
+        self.assertEqual(SupabaseIdentity.objects.get().user, user)
+
+    def test_invalid_tokens_are_rejected(self):
+        tokens = {
+            'signature': jwt.encode(self.claims(), 'other-secret', algorithm='HS256'),
+            'expired': jwt.encode(self.claims(exp=int(time.time()) - 3600), 'secret', algorithm='HS256'),
+            'audience': jwt.encode(self.claims(aud='service_role'), 'secret', algorithm='HS256'),
+            'subject': jwt.encode(self.claims(sub='not-a-uuid'), 'secret', algorithm='HS256'),
+        }
+        for case, token in tokens.items():
+            with self.subTest(case), self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate(token)
+
+    def test_inactive_user_is_rejected(self):
+        user = identity.get_user_for_supabase(self.supabase_id, 'student@example.com')
+        user.is_active = False
+        user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(jwt.encode(self.claims(), 'secret', algorithm='HS256'))
+
+    def test_tokens_of_other_issuers_are_left_to_the_next_class(self):
+        token = jwt.encode(self.claims(iss='django'), 'secret', algorithm='HS256')
+        self.assertIsNone(self.authenticate(token))
+        self.assertIsNone(self.authenticate('not-a-jwt'))
+
+    def test_asymmetric_token_is_checked_against_the_cached_key_set(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = jwt.PyJWK(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True), 'RS256')
+        token = jwt.encode(self.claims(), private_key, algorithm='RS256', headers={'kid': 'current'})
+
+        with mock.patch.object(self.jwks, '_fetch', return_value={'current': jwk}) as fetch:
+            self.assertEqual(self.authenticate(token)[1]['sub'], self.supabase_id)
+            self.authenticate(token)
+            self.assertEqual(fetch.call_count, 1)
+
+            # A key id the set does not know refreshes it, but not again within the minimum interval
+            unknown = jwt.encode(self.claims(), private_key, algorithm='RS256', headers={'kid': 'rotated'})
+            for _ in range(3):
+                with self.assertRaises(exceptions.AuthenticationFailed):
+                    self.authenticate(unknown)
+            self.assertEqual(fetch.call_count, 1)
+
+
+class BlacklistFilterTests(TestCase):
+    def setUp(self):
+        blacklist_filter.reset()
+        self.addCleanup(blacklist_filter.reset)
+        self.user = User.objects.create_user(username='student', password='pw')
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        jtis = [uuid.uuid4().hex for _ in range(1000)]
+        for jti in jtis:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in jtis))
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_rotated_refresh_token_is_refused(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST_FILTER={'SYNC_SECONDS': 3600})
+    def test_unlisted_tokens_skip_the_blacklist_query(self):
+        blacklist_filter.might_contain('warm-up')
+        with self.assertNumQueries(0):
+            self.assertFalse(blacklist_filter.might_contain(uuid.uuid4().hex))
+
+    @override_settings(TOKEN_BLACKLIST_FILTER={'SYNC_SECONDS': 0})
+    def test_tokens_blacklisted_elsewhere_are_picked_up_by_the_next_sync(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertFalse(blacklist_filter.might_contain(token['jti']))
+        # Blacklisted by another process: the base class does not touch this process's filter
+        outstanding = OutstandingToken.objects.get(jti=token['jti'])
+        BlacklistedToken.objects.create(token=outstanding)
+        self.assertTrue(blacklist_filter.might_contain(token['jti']))
+
+    def test_prune_tokens_deletes_only_expired_rows(self):
+        live = RefreshToken.for_user(self.user)
+        expired = RefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=aware_utcnow() - timedelta(days=1))
+
+        out = StringIO()
+        call_command('prune_tokens', sleep=0, stdout=out)
+        self.assertIn('Pruned 1 expired tokens', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertFalse(BlacklistedToken.objects.exists())
@@ -0,0 +1,113 @@
+"""
+In-process Bloom filter in front of the SimpleJWT token blacklist.
+
+Every refresh checks its token against ``token_blacklist_blacklistedtoken``.
+The filter holds the jti of every unexpired blacklisted token, so a "no" answer
+is final and the database is only asked about the rare maybe. Each process
+stays current by pulling newly blacklisted rows (a primary-key range query) at
+most once every ``SYNC_SECONDS``. Tokens this process blacklists are added
+immediately. The filter is rebuilt from scratch every ``REBUILD_SECONDS``,
+which sheds pruned and expired tokens.
+
+A token blacklisted by another process can therefore be accepted here for up
+to ``SYNC_SECONDS``. Keep that value small.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+# Blacklist rows can commit out of id order; re-reading a short tail catches late commits
+SYNC_OVERLAP_ROWS = 100
+
+
+def _config():
+    config = getattr(settings, 'TOKEN_BLACKLIST_FILTER', {})
+    return {
+        'CAPACITY': config.get('CAPACITY', 100000),
+        'ERROR_RATE': config.get('ERROR_RATE', 0.001),
+        'SYNC_SECONDS': config.get('SYNC_SECONDS', 2),
+        'REBUILD_SECONDS': config.get('REBUILD_SECONDS', 6 * 3600),
+    }
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    def __init__(self):
+        self._bloom = None
+        self._last_id = 0
+        self._built_at = float('-inf')
+        self._synced_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _rebuild(self, config):
+        # Read the high-water mark first: rows added meanwhile are picked up by the next sync
+        last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        jtis = list(BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+                    .values_list('token__jti', flat=True))
+        bloom = BloomFilter(max(config['CAPACITY'], 2 * len(jtis)), config['ERROR_RATE'])
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom, self._last_id = bloom, last_id
+        self._built_at = self._synced_at = time.monotonic()
+
+    def _sync(self, config):
+        rows = BlacklistedToken.objects.filter(id__gt=self._last_id - SYNC_OVERLAP_ROWS) \
+            .order_by('id').values_list('id', 'token__jti')
+        for row_id, jti in rows:
+            if jti not in self._bloom:  # The overlap re-reads rows we already hold
+                self._bloom.add(jti)
+            self._last_id = max(self._last_id, row_id)
+        self._synced_at = time.monotonic()
+        if self._bloom.count > self._bloom.capacity:
+            self._rebuild(config)  # Past capacity the false-positive rate climbs; start over bigger
+
+    def might_contain(self, jti):
+        """False means ``jti`` is certainly not blacklisted (as of the last sync)."""
+        config = _config()
+        with self._lock:
+            now = time.monotonic()
+            if self._bloom is None or now - self._built_at >= config['REBUILD_SECONDS']:
+                self._rebuild(config)
+            elif now - self._synced_at >= config['SYNC_SECONDS']:
+                self._sync(config)
+            return jti in self._bloom
+
+    def add(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+
+
+blacklist_filter = BlacklistFilter()
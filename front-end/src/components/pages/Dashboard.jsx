@@ -22,6 +22,8 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
   const [files, setFiles] = useState([]);
   const [summaries, setSummaries] = useState([]);
   const [quizzes, setQuizzes] = useState([]);
+  const [summariesCursor, setSummariesCursor] = useState(null);
+  const [quizzesCursor, setQuizzesCursor] = useState(null);
   const [commonBooks, setCommonBooks] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
@@ -92,24 +94,51 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
     }
   };
 
-  const loadUserSummaries = async () => {
+  // Summary and quiz listings are cursor-paginated previews; full bodies are fetched when an item is opened
+  const loadPage = async (url, cursor) => {
+    const response = await apiClient.get(url, { params: cursor ? { preview: 1, cursor } : { preview: 1 } });
+    return response.data;
+  };
+
+  const loadUserSummaries = async (cursor = null) => {
     try {
-      const response = await apiClient.get("/ai/summaries/");
-      setSummaries(response.data);
+      const page = await loadPage("/ai/summaries/", cursor);
+      setSummaries(prev => (cursor ? [...prev, ...page.results] : page.results));
+      setSummariesCursor(page.next_cursor);
     } catch (error) {
       console.error("Failed to load summaries:", error);
     }
   };
 
-  const loadUserQuizzes = async () => {
+  const loadUserQuizzes = async (cursor = null) => {
     try {
-      const response = await apiClient.get("/ai/quizzes/");
-      setQuizzes(response.data);
+      const page = await loadPage("/ai/quizzes/", cursor);
+      setQuizzes(prev => (cursor ? [...prev, ...page.results] : page.results));
+      setQuizzesCursor(page.next_cursor);
     } catch (error) {
       console.error("Failed to load quizzes:", error);
     }
   };
 
+  const openSummary = async (summaryId) => {
+    try {
+      const response = await apiClient.get(`/ai/summaries/${summaryId}/`);
+      setCurrentSummary(response.data.content);
+      setShowSummaryModal(true);
+    } catch (error) {
+      setError(error.response?.data?.error || "Failed to load summary");
+    }
+  };
+
+  const openQuiz = async (quizId) => {
+    try {
+      const response = await apiClient.get(`/ai/quizzes/${quizId}/`);
+      startQuiz(response.data.questions);
+    } catch (error) {
+      setError(error.response?.data?.error || "Failed to load quiz");
+    }
+  };
+
   const handleFileUpload = async (e) => {
     e.preventDefault();
     if (!selectedFile) {
@@ -175,12 +204,7 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
         num_questions: 5,
       });
       
-      setCurrentQuiz(response.data.quiz);
-      setQuizQuestions(response.data.quiz.questions);
-      setUserAnswers({});
-      setCurrentQuestionIndex(0);
-      setShowQuizResults(false);
-      setShowQuizModal(true);
+      startQuiz(response.data.quiz);
       loadUserQuizzes();
     } catch (error) {
       setError(error.response?.data?.error || "Failed to generate quiz");
@@ -189,6 +213,15 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
     }
   };
 
+  const startQuiz = (quiz) => {
+    setCurrentQuiz(quiz);
+    setQuizQuestions(quiz.questions);
+    setUserAnswers({});
+    setCurrentQuestionIndex(0);
+    setShowQuizResults(false);
+    setShowQuizModal(true);
+  };
+
   const handleQuizAnswer = (answer) => {
     setUserAnswers(prev => ({
       ...prev,
@@ -413,9 +446,9 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
           ) : (
             <ListGroup>
               {summaries.map((summary) => (
-                <ListGroup.Item key={summary.id}>
+                <ListGroup.Item key={summary.id} action onClick={() => openSummary(summary.id)}>
                   <h6 className="mb-1">{summary.file_title}</h6>
-                  <p className="mb-2">{summary.content.substring(0, 150)}...</p>
+                  <p className="mb-2">{summary.preview.substring(0, 150)}...</p>
                   <small className="text-muted">
                     {summary.subject} • {summary.grade} • {new Date(summary.created_at).toLocaleDateString()}
                   </small>
@@ -423,6 +456,11 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
               ))}
             </ListGroup>
           )}
+          {summariesCursor && (
+            <Button variant="outline-secondary" size="sm" className="mt-3" onClick={() => loadUserSummaries(summariesCursor)}>
+              Load more
+            </Button>
+          )}
         </Card.Body>
       </Card>
 
@@ -440,10 +478,10 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
           ) : (
             <ListGroup>
               {quizzes.map((quiz) => (
-                <ListGroup.Item key={quiz.id}>
+                <ListGroup.Item key={quiz.id} action onClick={() => openQuiz(quiz.id)}>
                   <h6 className="mb-1">{quiz.file_title}</h6>
                   <p className="mb-2">
-                    {quiz.questions.questions?.length || 0} questions • {quiz.subject} • {quiz.grade}
+                    {quiz.question_count || 0} questions • {quiz.subject} • {quiz.grade}
                   </p>
                   <small className="text-muted">
                     {new Date(quiz.created_at).toLocaleDateString()}
@@ -452,6 +490,11 @@ const Dashboard = ({ selectedSubjectGrade, onBackToSubjects }) => {
               ))}
             </ListGroup>
           )}
+          {quizzesCursor && (
+            <Button variant="outline-secondary" size="sm" className="mt-3" onClick={() => loadUserQuizzes(quizzesCursor)}>
+              Load more
+            </Button>
+          )}
         </Card.Body>
       </Card>
     </div>